@@ -1,109 +1,258 @@
 #include "./_board.hpp"
+#include "./_hashlife.hpp"
+#include "./_snapshot.hpp"
+#include "./_sparse_board.hpp"
 
 #include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/pytypes.h>
 #include <pybind11/stl.h>
-#include <pybind11/stl_bind.h>
 
 #include <algorithm>
+#include <atomic>
+#include <chrono>
 #include <cmath>
 #include <cstring>
-#include <future>
 #include <iostream>
 #include <memory>
-#include <queue>
+#include <numeric>
+#include <stdexcept>
 
 namespace py = pybind11;
 using namespace pybind11::literals;
 
-PYBIND11_MAKE_OPAQUE(std::vector<int>);
-PYBIND11_MAKE_OPAQUE(std::vector<float>);
+constexpr size_t Board::CHUNK_SIZE;
+constexpr size_t Board::MAX_SIDE;
 
-py::object glm = py::module_::import("moderngl");
-py::object Rule = py::module_::import("rule").attr("Rule");
-py::object Renderer = py::module_::import("engine.renderer").attr("Renderer");
-py::object drawBatch = Renderer.attr("draw_batch");
-const size_t MAX_BUFFER_SIZE =
-    py::module_::import("engine.renderer").attr("MAX_BUFFER_SIZE").cast<int>();
+namespace {
 
-static const std::vector<std::vector<int>> mooreOffsets{
-    {1, -1, -1}, {1, -1, 0},  {1, -1, 1},  {1, 0, -1},  {1, 0, 0},
-    {1, 0, 1},   {1, 1, -1},  {1, 1, 0},   {1, 1, 1},   {-1, -1, -1},
-    {-1, -1, 0}, {-1, -1, 1}, {-1, 0, -1}, {-1, 0, 0},  {-1, 0, 1},
-    {-1, 1, -1}, {-1, 1, 0},  {-1, 1, 1},  {0, -1, -1}, {0, -1, 0},
-    {0, -1, 1},  {0, 1, -1},  {0, 1, 0},   {0, 1, 1},   {0, 0, 1},
-    {0, 0, -1}};
+constexpr size_t quadSize(const std::vector<float>&) {
+    return FLOATS_PER_QUAD;
+}
+
+constexpr size_t quadSize(const std::vector<uint32_t>&) {
+    return WORDS_PER_PACKED_QUAD;
+}
+
+void emitQuad(float* out, int* positions[4], Face face, int side,
+              uint8_t state) {
+    writeQuad(out, positions, face, side, state);
+}
+
+void emitQuad(uint32_t* out, int* positions[4], Face face, int,
+              uint8_t state) {
+    writePackedQuad(out, positions, face, state);
+}
 
-static const std::vector<std::vector<int>> vnOffsets{
-    {1, 0, 0}, {-1, 0, 0}, {0, 1, 0}, {0, -1, 0}, {0, 0, 1}, {0, 0, -1}};
+// a merged rectangle of a slice mask and the state it shows
+struct MaskQuad {
+    int i, j, w, h;
+    uint8_t state;
+};
+
+}  // namespace
 
 Board::Board(int side, py::object rule)
     : mSide(side),
-      mQuadCount(0),
+      mGeneration(0),
+      mMeshDirty(true),
+      mPackedVertices(false),
+      mLod(false),
+      mLodStale(true),
       mRule(rule),
+      mUseAlivePlane(false),
       mCells(side * side * side),
-      mCellsBuffer(side * side * side) {
+      mCellsBuffer(side * side * side),
+      mCellViews(std::make_shared<char>()),
+      mThreadPool(new ThreadPool()),
+      mGrainSize(0) {
     setRuleBuffer(rule);
-    mVertexBuffer.reserve(MAX_BUFFER_SIZE);
+    resetChunks();
 }
 
-void Board::update() {
-    static std::queue<std::future<void>> futures;
-    auto asyncTask = [&](size_t divider) {
-        for (size_t i = 0; i < getSize() / mSide; i++) {
-            size_t index = getSize() / mSide * divider + i;
-            int neighborCount = countNeighbors(index);
-            mCellsBuffer[index] = applyRule(neighborCount, mCells[index]);
-        }
-    };
-    for (size_t divider = 0; divider < mSide; divider++) {
-        futures.emplace(std::async(std::launch::async, asyncTask, divider));
+void Board::update() { step(1, true); }
+
+void Board::step(size_t generations, bool remesh) {
+    std::lock_guard<std::mutex> lock(mStateMutex);
+    for (size_t i = 0; i < generations; i++) {
+        auto start = std::chrono::steady_clock::now();
+        size_t cellsChanged = advance();
+        uint64_t updateNs = BoardStats::elapsedNs(start);
+        std::lock_guard<std::mutex> statsLock(mStatsMutex);
+        mStats.updateNs.add(updateNs);
+        mStats.cellsChanged.add(cellsChanged);
+    }
+    if (generations > 0) {
+        mMeshDirty = true;
     }
-    while (!futures.empty()) {
-        futures.front().wait();
-        futures.pop();
+    if (remesh) {
+        ensureMesh();
     }
-    std::swap(mCellsBuffer, mCells);
-    calculateGreedyMeshes();
 }
 
-void Board::render() {
-    int batchCount = mVertexBuffer.size() / MAX_BUFFER_SIZE;
-    for (int count = 0; count < batchCount; count++) {
-        drawBatch(py::memoryview::from_memory(
-            mVertexBuffer.data() + count * MAX_BUFFER_SIZE,
-            sizeof(float) * MAX_BUFFER_SIZE));
+void Board::ensureMesh() {
+    if (mMeshDirty) {
+        auto start = std::chrono::steady_clock::now();
+        size_t quads = calculateGreedyMeshes();
+        uint64_t meshNs = BoardStats::elapsedNs(start);
+        std::lock_guard<std::mutex> lock(mStatsMutex);
+        mStats.meshNs.add(meshNs);
+        mStats.quads.add(quads);
     }
-    int remain = mVertexBuffer.size() - batchCount * MAX_BUFFER_SIZE;
-    if (remain > 0) {
-        drawBatch(py::memoryview::from_memory(
-            mVertexBuffer.data() + batchCount * MAX_BUFFER_SIZE,
-            sizeof(float) * remain));
+}
+
+void Board::tryEnsureMesh() {
+    // a step running on another thread publishes its own mesh
+    std::unique_lock<std::mutex> lock(mStateMutex, std::try_to_lock);
+    if (lock.owns_lock()) {
+        ensureMesh();
+    }
+}
+
+size_t Board::advance() {
+    if (mUseAlivePlane) {
+        packAlivePlane();
+    }
+    // only chunks next to a change can change themselves
+    collectActiveChunks();
+    std::fill(mChunkChangedNext.begin(), mChunkChangedNext.end(), 0);
+    size_t grainSize = grainSizeFor(mActiveChunks.size());
+    std::atomic<size_t> cellsChanged(0);
+    mThreadPool->parallelFor(0, mActiveChunks.size(), grainSize,
+                             [&](size_t begin, size_t end) {
+                                 ChunkScratch scratch;
+                                 size_t changed = 0;
+                                 for (size_t i = begin; i < end; i++) {
+                                     size_t chunk = mActiveChunks[i];
+                                     size_t count = updateChunk(chunk, scratch);
+                                     mChunkChangedNext[chunk] = count > 0;
+                                     changed += count;
+                                 }
+                                 cellsChanged += changed;
+                             });
+    // copy the changed chunks back instead of swapping the buffers, so
+    // mCells never moves and views of it stay valid
+    mThreadPool->parallelFor(0, mActiveChunks.size(), grainSize,
+                             [&](size_t begin, size_t end) {
+                                 for (size_t i = begin; i < end; i++) {
+                                     size_t chunk = mActiveChunks[i];
+                                     if (mChunkChangedNext[chunk]) {
+                                         copyChunk(chunk);
+                                         mChunkMeshDirty[chunk] = 1;
+                                     }
+                                 }
+                             });
+    std::swap(mChunkChanged, mChunkChangedNext);
+    mGeneration++;
+    return cellsChanged;
+}
+
+void Board::render() {
+    tryEnsureMesh();
+    auto start = std::chrono::steady_clock::now();
+    const char* part = mLod ? "near" : "all";
+    size_t bytesUploaded = 0;
+    if (mPackedVertices) {
+        bytesUploaded += mPackedMesh.draw(mSide, CHUNK_SIZE, part);
+        if (mLod) {
+            bytesUploaded += mPackedLodMesh.draw(mSide, CHUNK_SIZE, "far");
+        }
+    } else {
+        bytesUploaded += mMesh.draw(mSide, CHUNK_SIZE, part);
+        if (mLod) {
+            bytesUploaded += mLodMesh.draw(mSide, CHUNK_SIZE, "far");
+        }
     }
+    uint64_t renderNs = BoardStats::elapsedNs(start);
+    std::lock_guard<std::mutex> lock(mStatsMutex);
+    mStats.renderNs.add(renderNs);
+    mStats.bytesUploaded.add(bytesUploaded);
+}
+
+py::dict Board::getStats() const {
+    std::lock_guard<std::mutex> lock(mStatsMutex);
+    return mStats.toDict();
+}
+
+void Board::resetStats() {
+    std::lock_guard<std::mutex> lock(mStatsMutex);
+    mStats = BoardStats();
 }
 
 void Board::clear() {
-    mVertexBuffer.clear();
+    mMeshDirty = true;
+    mGeneration = 0;
     mCells.resize(mSide * mSide * mSide, 0);
     mCellsBuffer.resize(mSide * mSide * mSide, 0);
     std::fill(mCells.begin(), mCells.end(), 0);
     std::fill(mCellsBuffer.begin(), mCellsBuffer.end(), 0);
+    resetChunks();
+    if (mUseAlivePlane) {
+        mAlivePlane.assign((getSize() + 63) / 64, 0);
+    }
 }
 
 void Board::setSide(size_t side) {
+    checkSide(side);
+    if (static_cast<int>(side) != mSide) {
+        checkNoCellViews();
+    }
     mSide = side;
     clear();
     randomise(mRule);
 }
 
 void Board::setRule(py::object rule) {
-    mRule = rule;
     setRuleBuffer(rule);
+    mRule = rule;
     clear();
     randomise(rule);
 }
 
+void Board::setPackedVertices(bool enabled) {
+    if (enabled && mSide > MAX_PACKED_SIDE) {
+        throw std::invalid_argument(
+            "packed vertices need a side of at most 1023");
+    }
+    if (enabled == mPackedVertices) {
+        return;
+    }
+    std::lock_guard<std::mutex> lock(mStateMutex);
+    mPackedVertices = enabled;
+    // the other format is rebuilt from scratch if it is turned back on
+    mChunkMeshes.assign(mChunkMeshes.size(), std::vector<float>());
+    mPackedChunkMeshes.assign(mPackedChunkMeshes.size(),
+                              std::vector<uint32_t>());
+    if (enabled) {
+        mMesh.clear();
+    } else {
+        mPackedMesh.clear();
+    }
+    clearLod();
+    std::fill(mChunkMeshDirty.begin(), mChunkMeshDirty.end(), 1);
+    mMeshDirty = true;
+}
+
+void Board::setLod(bool enabled) {
+    if (enabled == mLod) {
+        return;
+    }
+    std::lock_guard<std::mutex> lock(mStateMutex);
+    mLod = enabled;
+    clearLod();
+    mMeshDirty = true;
+}
+
+void Board::clearLod() {
+    mLodChunkMeshes.assign(mLodChunkMeshes.size(), std::vector<float>());
+    mPackedLodChunkMeshes.assign(mPackedLodChunkMeshes.size(),
+                                 std::vector<uint32_t>());
+    mLodMesh.clear();
+    mPackedLodMesh.clear();
+    std::vector<uint8_t>().swap(mLodCells);
+    mLodStale = true;
+}
+
 size_t Board::coordToIndex(size_t x, size_t y, size_t z) const {
     return x + mSide * (y + mSide * z);
 }
@@ -113,7 +262,81 @@ int Board::getCellState(size_t x, size_t y, size_t z) const {
 }
 
 void Board::setCellState(int state, size_t x, size_t y, size_t z) {
+    if (state < 0 || state > UINT8_MAX) {
+        throw std::invalid_argument("cell state must be between 0 and 255");
+    }
     mCells[coordToIndex(x, y, z)] = state;
+    markChunkChanged(x, y, z);
+    mMeshDirty = true;
+}
+
+void Board::setThreadCount(size_t threadCount) {
+    mThreadPool->setThreadCount(threadCount);
+}
+
+size_t Board::grainSizeFor(size_t itemCount) const {
+    if (mGrainSize > 0) {
+        return mGrainSize;
+    }
+    // a few chunks per thread leaves room for stealing without making the
+    // queues busy
+    size_t chunkCount = mThreadPool->getThreadCount() * 8;
+    return std::max<size_t>(1, (itemCount + chunkCount - 1) / chunkCount);
+}
+
+void Board::setAlivePlane(bool enabled) {
+    mUseAlivePlane = enabled;
+    if (enabled) {
+        packAlivePlane();
+    } else {
+        mAlivePlane.clear();
+        mAlivePlane.shrink_to_fit();
+    }
+}
+
+void Board::packAlivePlane() {
+    mAlivePlane.assign((getSize() + 63) / 64, 0);
+    for (size_t word = 0; word < mAlivePlane.size(); word++) {
+        size_t begin = word * 64;
+        size_t end = std::min(begin + 64, mCells.size());
+        uint64_t bits = 0;
+        for (size_t index = begin; index < end; index++) {
+            bits |= static_cast<uint64_t>(mCells[index] == 1)
+                    << (index - begin);
+        }
+        mAlivePlane[word] = bits;
+    }
+}
+
+py::dict Board::getMemoryReport() const {
+    size_t cells = mCells.capacity() * sizeof(uint8_t);
+    size_t cellsBuffer = mCellsBuffer.capacity() * sizeof(uint8_t);
+    size_t alivePlane = mAlivePlane.capacity() * sizeof(uint64_t);
+    size_t chunkFlags =
+        (mChunkChanged.capacity() + mChunkChangedNext.capacity() +
+         mChunkMeshDirty.capacity()) *
+            sizeof(uint8_t) +
+        (mActiveChunks.capacity() + mRemeshChunks.capacity()) * sizeof(size_t);
+    size_t vertexBuffer = mMesh.capacityBytes() + mPackedMesh.capacityBytes();
+    for (const auto& chunkMesh : mChunkMeshes) {
+        vertexBuffer += chunkMesh.capacity() * sizeof(float);
+    }
+    for (const auto& chunkMesh : mPackedChunkMeshes) {
+        vertexBuffer += chunkMesh.capacity() * sizeof(uint32_t);
+    }
+    size_t lodCells = mLodCells.capacity() * sizeof(uint8_t);
+    vertexBuffer += mLodMesh.capacityBytes() + mPackedLodMesh.capacityBytes();
+    for (const auto& chunkMesh : mLodChunkMeshes) {
+        vertexBuffer += chunkMesh.capacity() * sizeof(float);
+    }
+    for (const auto& chunkMesh : mPackedLodChunkMeshes) {
+        vertexBuffer += chunkMesh.capacity() * sizeof(uint32_t);
+    }
+    return py::dict("cells"_a = cells, "cells_buffer"_a = cellsBuffer,
+                    "alive_plane"_a = alivePlane, "chunk_flags"_a = chunkFlags,
+                    "lod_cells"_a = lodCells, "vertex_buffer"_a = vertexBuffer,
+                    "total"_a = cells + cellsBuffer + alivePlane +
+                                chunkFlags + lodCells + vertexBuffer);
 }
 
 void Board::randomise(float radius, float density) {
@@ -130,7 +353,7 @@ void Board::randomise(float radius, float density) {
             mCells[index] = 1;
         }
     }
-    calculateGreedyMeshes();
+    markAllChunksChanged();
 }
 
 void Board::randomise(py::object rule) {
@@ -152,239 +375,624 @@ std::vector<int> Board::getCoordinate(int index) {
 }
 
 void Board::setRuleBuffer(py::object rule) {
-    mRuleBuffer.spawn = mRule.attr("spawn").cast<std::unordered_set<int>>();
-    mRuleBuffer.survival =
-        mRule.attr("survival").cast<std::unordered_set<int>>();
-    mRuleBuffer.maxState = mRule.attr("max_state").cast<uint32_t>();
-    mRuleBuffer.neighbor = mRule.attr("neighbor").cast<std::string>();
-}
-
-int Board::applyRule(int neighborCount, int cellState) {
-    if (cellState == 0 && mRuleBuffer.spawn.count(neighborCount)) {
-        cellState = 1;
-    } else if (cellState > 1 || (cellState == 1 &&
-                                 !mRuleBuffer.survival.count(neighborCount))) {
-        cellState++;
-        if (cellState >= mRuleBuffer.maxState) {
-            cellState = 0;
+    mRuleBuffer = RuleBuffer::fromRule(rule);
+}
+
+void Board::resetChunks() {
+    mChunksPerSide = (mSide + CHUNK_SIZE - 1) / CHUNK_SIZE;
+    size_t chunkCount = mChunksPerSide * mChunksPerSide * mChunksPerSide;
+    mChunkChanged.assign(chunkCount, 1);
+    mChunkChangedNext.assign(chunkCount, 0);
+    mChunkMeshDirty.assign(chunkCount, 1);
+    mChunkMeshes.assign(chunkCount * 3, std::vector<float>());
+    mPackedChunkMeshes.assign(chunkCount * 3, std::vector<uint32_t>());
+    mLodChunkMeshes.assign(chunkCount * 3, std::vector<float>());
+    mPackedLodChunkMeshes.assign(chunkCount * 3, std::vector<uint32_t>());
+    mLodStale = true;
+    mRemeshChunks.clear();
+    mActiveChunks.clear();
+    mActiveChunks.reserve(chunkCount);
+}
+
+void Board::markChunkChanged(size_t x, size_t y, size_t z) {
+    size_t cx = x / CHUNK_SIZE;
+    size_t cy = y / CHUNK_SIZE;
+    size_t cz = z / CHUNK_SIZE;
+    size_t chunk = cx + mChunksPerSide * (cy + mChunksPerSide * cz);
+    mChunkChanged[chunk] = 1;
+    mChunkMeshDirty[chunk] = 1;
+}
+
+void Board::markAllChunksChanged() {
+    std::fill(mChunkChanged.begin(), mChunkChanged.end(), 1);
+    std::fill(mChunkMeshDirty.begin(), mChunkMeshDirty.end(), 1);
+    mMeshDirty = true;
+}
+
+void Board::collectActiveChunks() {
+    size_t n = mChunksPerSide;
+    mActiveChunks.clear();
+    for (size_t cz = 0; cz < n; cz++) {
+        for (size_t cy = 0; cy < n; cy++) {
+            for (size_t cx = 0; cx < n; cx++) {
+                bool active = false;
+                for (int dz = -1; dz <= 1 && !active; dz++) {
+                    size_t nz = (cz + n + dz) % n;
+                    for (int dy = -1; dy <= 1 && !active; dy++) {
+                        size_t ny = (cy + n + dy) % n;
+                        for (int dx = -1; dx <= 1 && !active; dx++) {
+                            size_t nx = (cx + n + dx) % n;
+                            active = mChunkChanged[nx + n * (ny + n * nz)];
+                        }
+                    }
+                }
+                if (active) {
+                    mActiveChunks.push_back(cx + n * (cy + n * cz));
+                }
+            }
         }
     }
-    return cellState;
-}
-
-int Board::countNeighbors(int index) {
-    int neighbors = 0;
-    int side = mSide;
-    const auto& offsets =
-        mRuleBuffer.neighbor == "M" ? mooreOffsets : vnOffsets;
-    const auto coordinate = getCoordinate(index);
-    for (const auto& offset : offsets) {
-        int offX = coordinate[0] + offset[0];
-        int offY = coordinate[1] + offset[1];
-        int offZ = coordinate[2] + offset[2];
-        if (offX >= side) {
-            offX = 0;
-        } else if (offX < 0) {
-            offX = side - 1;
+}
+
+void Board::copyChunk(size_t chunk) {
+    size_t n = mChunksPerSide;
+    size_t x0 = chunk % n * CHUNK_SIZE;
+    size_t y0 = chunk / n % n * CHUNK_SIZE;
+    size_t z0 = chunk / (n * n) * CHUNK_SIZE;
+    size_t width = std::min(CHUNK_SIZE, mSide - x0);
+    size_t y1 = std::min(y0 + CHUNK_SIZE, static_cast<size_t>(mSide));
+    size_t z1 = std::min(z0 + CHUNK_SIZE, static_cast<size_t>(mSide));
+    for (size_t z = z0; z < z1; z++) {
+        for (size_t y = y0; y < y1; y++) {
+            size_t index = coordToIndex(x0, y, z);
+            std::memcpy(&mCells[index], &mCellsBuffer[index], width);
         }
-        if (offY >= side) {
-            offY = 0;
-        } else if (offY < 0) {
-            offY = side - 1;
+    }
+}
+
+void Board::setCells(py::array cells) {
+    size_t side = mSide;
+    if (cells.ndim() != 3 || static_cast<size_t>(cells.shape(0)) != side ||
+        static_cast<size_t>(cells.shape(1)) != side ||
+        static_cast<size_t>(cells.shape(2)) != side) {
+        throw std::invalid_argument("cells must have shape (side, side, side)");
+    }
+    // Fortran order puts x fastest, matching coordToIndex
+    if (py::dtype::of<uint8_t>().is(cells.dtype())) {
+        auto states = py::array_t<uint8_t, py::array::f_style |
+                                               py::array::forcecast>(cells);
+        // only the chunks whose cells differ are marked, so loading a
+        // similar board (like the next frame of a replay) remeshes little
+        const uint8_t* data = states.data();
+        for (size_t z = 0; z < side; z++) {
+            for (size_t y = 0; y < side; y++) {
+                for (size_t x = 0; x < side; x += CHUNK_SIZE) {
+                    size_t index = coordToIndex(x, y, z);
+                    size_t width = std::min(CHUNK_SIZE, side - x);
+                    if (std::memcmp(&mCells[index], data + index, width)) {
+                        std::memcpy(&mCells[index], data + index, width);
+                        markChunkChanged(x, y, z);
+                        mMeshDirty = true;
+                    }
+                }
+            }
         }
-        if (offZ >= side) {
-            offZ = 0;
-        } else if (offZ < 0) {
-            offZ = side - 1;
+        return;
+    }
+    auto states =
+        py::array_t<int64_t, py::array::f_style | py::array::forcecast>(cells);
+    const int64_t* data = states.data();
+    for (size_t index = 0; index < getSize(); index++) {
+        if (data[index] < 0 || data[index] > UINT8_MAX) {
+            throw std::invalid_argument("cell state must be between 0 and 255");
         }
-        neighbors += (mCells[getIndex(offX, offY, offZ)] == 1);
-    }
-    neighbors -= (mCells[index] == 1);
-    return neighbors;
-}
-
-void Board::calculateGreedyMeshes() {
-    mVertexBuffer.clear();
-    mQuadCount = 0;
-
-    // sweep over each axis (X, Y, Z)
-    for (int d = 0; d < 3; d++) {
-        int i, j, k, l, w, h;
-        int u = (d + 1) % 3;
-        int v = (d + 2) % 3;
-        int x[3] = {0};
-        int q[3] = {0};
-
-        std::vector<bool> mask(mSide * mSide);
-        q[d] = 1;  // determine the searching direction
-
-        // check each slice one at a time
-        for (x[d] = -1; x[d] < mSide;) {
-            // compute the mask
-            int n = 0;
-            for (x[v] = 0; x[v] < mSide; x[v]++) {
-                for (x[u] = 0; x[u] < mSide; x[u]++) {
-                    bool blockCurrent = false;
-                    if (x[d] >= 0) {
-                        blockCurrent = mCells[getIndex(x[0], x[1], x[2])] > 0;
-                    }
-                    bool blockCompare = false;
-                    if (x[d] < mSide - 1) {
-                        blockCompare =
-                            mCells[getIndex(x[0] + q[0], x[1] + q[1],
-                                            x[2] + q[2])] > 0;
-                    }
-                    mask[n++] = blockCurrent != blockCompare;
+    }
+    std::copy(data, data + getSize(), mCells.begin());
+    markAllChunksChanged();
+}
+
+void Board::save(const std::string& path, bool compress) const {
+    SnapshotHeader header;
+    header.side = mSide;
+    header.generation = mGeneration;
+    header.ruleName = py::str(mRule.attr("name"));
+    header.ruleFormat = py::str(mRule.attr("format"));
+    header.compressed = compress;
+    writeSnapshot(path, header, mCells.data(), getSize());
+}
+
+void Board::load(const std::string& path) {
+    MappedSnapshot snapshot(path);
+    const SnapshotHeader& header = snapshot.getHeader();
+    // everything that can fail happens before the board is touched, so a
+    // broken snapshot leaves it as it was
+    size_t side = header.side;
+    checkSide(side);
+    if (static_cast<int>(side) != mSide) {
+        checkNoCellViews();
+    }
+    std::vector<uint8_t> cells(side * side * side);
+    snapshot.readCells(cells.data(), cells.size());
+    py::object rule = mRule;
+    RuleBuffer ruleBuffer = mRuleBuffer;
+    std::string ruleName = py::str(mRule.attr("name"));
+    std::string ruleFormat = py::str(mRule.attr("format"));
+    if (header.ruleName != ruleName || header.ruleFormat != ruleFormat) {
+        py::object Rule = py::module_::import("rule").attr("Rule");
+        rule = Rule(header.ruleName, header.ruleFormat,
+                    mRule.attr("initial_density"),
+                    mRule.attr("initial_radius"));
+        ruleBuffer = RuleBuffer::fromRule(rule);
+    }
+
+    mRule = rule;
+    mRuleBuffer = std::move(ruleBuffer);
+    mSide = side;
+    clear();
+    std::copy(cells.begin(), cells.end(), mCells.begin());
+    mGeneration = header.generation;
+    markAllChunksChanged();
+}
+
+py::array Board::getCells(bool copy) {
+    size_t side = mSide;
+    std::vector<size_t> shape{side, side, side};
+    std::vector<size_t> strides{1, side, side * side};
+    // the view keeps the board alive and counts as a user of mCellViews
+    struct ViewOwner {
+        std::shared_ptr<const void> token;
+        py::object board;
+    };
+    auto* owner = new ViewOwner{
+        mCellViews, py::cast(this, py::return_value_policy::reference)};
+    py::capsule base(owner, [](void* owner) {
+        delete static_cast<ViewOwner*>(owner);
+    });
+    py::array view(py::dtype::of<uint8_t>(), shape, strides, mCells.data(),
+                   base);
+    if (copy) {
+        return view.attr("copy")();
+    }
+    // writes have to go through set_cells so the changed chunks get marked
+    view.attr("setflags")("write"_a = false);
+    return view;
+}
+
+void Board::checkSide(size_t side) const {
+    if (side == 0 || side > MAX_SIDE) {
+        throw std::invalid_argument("the side must be between 1 and 2048");
+    }
+    if (mPackedVertices && side > MAX_PACKED_SIDE) {
+        throw std::invalid_argument(
+            "packed vertices need a side of at most 1023");
+    }
+}
+
+void Board::checkNoCellViews() const {
+    if (mCellViews.use_count() > 1) {
+        throw std::logic_error(
+            "the side cannot change while views of the cells are alive");
+    }
+}
+
+size_t Board::updateChunk(size_t chunk, ChunkScratch& scratch) {
+    size_t side = mSide;
+    size_t n = mChunksPerSide;
+    size_t origin[3] = {chunk % n * CHUNK_SIZE, chunk / n % n * CHUNK_SIZE,
+                        chunk / (n * n) * CHUNK_SIZE};
+    size_t size[3];
+    size_t halo[3];
+    for (int axis = 0; axis < 3; axis++) {
+        size[axis] = std::min(CHUNK_SIZE, side - origin[axis]);
+        halo[axis] = size[axis] + 2;
+        // wrapped grid coordinate of every halo position along this axis
+        auto& coords = scratch.coords[axis];
+        coords.resize(halo[axis]);
+        for (size_t h = 0; h < halo[axis]; h++) {
+            coords[h] = (origin[axis] + h + side - 1) % side;
+        }
+    }
+    size_t sx = size[0], sy = size[1], sz = size[2];
+    size_t hx = halo[0], hy = halo[1], hz = halo[2];
+
+    auto& alive = scratch.alive;
+    alive.resize(hx * hy * hz);
+    for (size_t lz = 0; lz < hz; lz++) {
+        for (size_t ly = 0; ly < hy; ly++) {
+            size_t row = side * (scratch.coords[1][ly] +
+                                 side * scratch.coords[2][lz]);
+            uint8_t* out = &alive[hx * (ly + hy * lz)];
+            for (size_t lx = 0; lx < hx; lx++) {
+                out[lx] = isAlive(row + scratch.coords[0][lx]);
+            }
+        }
+    }
+
+    size_t changed = 0;
+    auto store = [&](size_t x, size_t y, size_t z, int neighborCount) {
+        size_t index = coordToIndex(origin[0] + x, origin[1] + y,
+                                    origin[2] + z);
+        uint8_t state = mRuleBuffer.next(mCells[index], neighborCount);
+        mCellsBuffer[index] = state;
+        changed += state != mCells[index];
+    };
+
+    if (mRuleBuffer.isMoore()) {
+        // window sums of three along x, then y, then z give the 3x3x3 box
+        auto& sumsX = scratch.sumsX;
+        sumsX.resize(sx * hy * hz);
+        for (size_t lz = 0; lz < hz; lz++) {
+            for (size_t ly = 0; ly < hy; ly++) {
+                const uint8_t* in = &alive[hx * (ly + hy * lz)];
+                uint8_t* out = &sumsX[sx * (ly + hy * lz)];
+                for (size_t x = 0; x < sx; x++) {
+                    out[x] = in[x] + in[x + 1] + in[x + 2];
+                }
+            }
+        }
+        auto& sumsXY = scratch.sumsXY;
+        sumsXY.resize(sx * sy * hz);
+        for (size_t lz = 0; lz < hz; lz++) {
+            for (size_t y = 0; y < sy; y++) {
+                const uint8_t* in = &sumsX[sx * (y + hy * lz)];
+                uint8_t* out = &sumsXY[sx * (y + sy * lz)];
+                for (size_t x = 0; x < sx; x++) {
+                    out[x] = in[x] + in[x + sx] + in[x + 2 * sx];
+                }
+            }
+        }
+        size_t slab = sx * sy;
+        for (size_t z = 0; z < sz; z++) {
+            for (size_t y = 0; y < sy; y++) {
+                const uint8_t* in = &sumsXY[sx * (y + sy * z)];
+                const uint8_t* self = &alive[1 + hx * (y + 1 + hy * (z + 1))];
+                for (size_t x = 0; x < sx; x++) {
+                    int box = in[x] + in[x + slab] + in[x + 2 * slab];
+                    store(x, y, z, box - self[x]);
                 }
             }
-            x[d]++;
-
-            bool isBackFace = x[d] % 2;
-            Face face;
-            if (d == 0) {
-                face = isBackFace ? Face::LEFT : Face::RIGHT;
-            } else if (d == 1) {
-                face = isBackFace ? Face::DOWN : Face::UP;
-            } else if (d == 2) {
-                face = isBackFace ? Face::BACK : Face::FRONT;
+        }
+    } else {
+        size_t rowStride = hx;
+        size_t slabStride = hx * hy;
+        for (size_t z = 0; z < sz; z++) {
+            for (size_t y = 0; y < sy; y++) {
+                const uint8_t* self = &alive[1 + hx * (y + 1 + hy * (z + 1))];
+                for (size_t x = 0; x < sx; x++) {
+                    const uint8_t* cell = self + x;
+                    int faces = cell[-1] + cell[1] + cell[-rowStride] +
+                                cell[rowStride] + cell[-slabStride] +
+                                cell[slabStride];
+                    store(x, y, z, faces);
+                }
             }
+        }
+    }
+    return changed;
+}
 
-            // Generate mesh for mask using lexicographic ordering
-            n = 0;
-            for (j = 0; j < mSide; j++) {
-                for (i = 0; i < mSide;) {
-                    if (!mask[n]) {
-                        i++;
-                        n++;
-                        continue;
-                    }
+// Each chunk keeps its own greedy mesh of the faces on the slice planes it
+// owns: the planes through its lower corner along every axis, plus the far
+// border for the last chunk on an axis. A plane between cells p - 1 and p
+// also looks at the chunk below, so a chunk is remeshed when it or one of
+// its lower neighbors changed since the last mesh.
+size_t Board::calculateGreedyMeshes() {
+    size_t n = mChunksPerSide;
+    mRemeshChunks.clear();
+    std::vector<size_t> changedChunks;
+    for (size_t chunk = 0; chunk < mChunkMeshDirty.size(); chunk++) {
+        size_t cx = chunk % n;
+        size_t cy = chunk / n % n;
+        size_t cz = chunk / (n * n);
+        if (mChunkMeshDirty[chunk] || (cx > 0 && mChunkMeshDirty[chunk - 1]) ||
+            (cy > 0 && mChunkMeshDirty[chunk - n]) ||
+            (cz > 0 && mChunkMeshDirty[chunk - n * n])) {
+            mRemeshChunks.push_back(chunk);
+        }
+        if (mLod && (mChunkMeshDirty[chunk] || mLodStale)) {
+            changedChunks.push_back(chunk);
+        }
+    }
+    MeshGrid grid = {mCells.data(), mSide, CHUNK_SIZE, 1};
+    size_t quads;
+    if (mPackedVertices) {
+        quads = meshChunks(mRemeshChunks, grid, mPackedChunkMeshes,
+                           mPackedMesh, WORDS_PER_PACKED_QUAD);
+    } else {
+        quads = meshChunks(mRemeshChunks, grid, mChunkMeshes, mMesh,
+                           FLOATS_PER_QUAD);
+    }
+    if (mLod) {
+        // the LOD mesh of a chunk depends on the same chunks as its full mesh
+        updateLodCells(changedChunks);
+        std::vector<size_t> allChunks;
+        if (mLodStale) {
+            allChunks.resize(mChunkMeshDirty.size());
+            std::iota(allChunks.begin(), allChunks.end(), 0);
+        }
+        const std::vector<size_t>& chunks =
+            mLodStale ? allChunks : mRemeshChunks;
+        MeshGrid lodGrid = {mLodCells.data(),
+                            static_cast<int>((mSide + LOD_SCALE - 1) /
+                                             LOD_SCALE),
+                            CHUNK_SIZE / LOD_SCALE, LOD_SCALE};
+        if (mPackedVertices) {
+            quads += meshChunks(chunks, lodGrid, mPackedLodChunkMeshes,
+                                mPackedLodMesh, WORDS_PER_PACKED_QUAD);
+        } else {
+            quads += meshChunks(chunks, lodGrid, mLodChunkMeshes, mLodMesh,
+                                FLOATS_PER_QUAD);
+        }
+        mLodStale = false;
+    }
+    std::fill(mChunkMeshDirty.begin(), mChunkMeshDirty.end(), 0);
+    mMeshDirty = false;
+    return quads;
+}
 
-                    // Compute width
-                    for (w = 1; mask[n + w] && i + w < mSide; w++) {
-                        // null statement
+// A cell of the LOD grid is solid when any of its board cells is, and takes
+// the lowest solid state among them.
+void Board::updateLodCells(const std::vector<size_t>& chunks) {
+    size_t lodSide = (mSide + LOD_SCALE - 1) / LOD_SCALE;
+    mLodCells.resize(lodSide * lodSide * lodSide);
+    auto lodState = [&](size_t x, size_t y, size_t z) {
+        size_t first[3] = {x * LOD_SCALE, y * LOD_SCALE, z * LOD_SCALE};
+        size_t last[3];
+        for (int axis = 0; axis < 3; axis++) {
+            last[axis] = std::min<size_t>(first[axis] + LOD_SCALE, mSide);
+        }
+        uint8_t state = 0;
+        for (size_t k = first[2]; k < last[2]; k++) {
+            for (size_t j = first[1]; j < last[1]; j++) {
+                for (size_t i = first[0]; i < last[0]; i++) {
+                    uint8_t cell = mCells[coordToIndex(i, j, k)];
+                    if (cell && (!state || cell < state)) {
+                        state = cell;
                     }
-
-                    // Compute height
-                    bool done = false;
-                    for (h = 1; j + h < mSide; h++) {
-                        for (k = 0; k < w; k++) {
-                            if (!mask[n + k + h * mSide]) {
-                                done = true;
-                                break;
-                            }
-                        }
-                        if (done) {
-                            break;
+                }
+            }
+        }
+        return state;
+    };
+    size_t n = mChunksPerSide;
+    size_t lodChunkSize = CHUNK_SIZE / LOD_SCALE;
+    mThreadPool->parallelFor(
+        0, chunks.size(), grainSizeFor(chunks.size()),
+        [&](size_t begin, size_t end) {
+            for (size_t c = begin; c < end; c++) {
+                size_t chunk = chunks[c];
+                size_t origin[3] = {chunk % n * lodChunkSize,
+                                    chunk / n % n * lodChunkSize,
+                                    chunk / (n * n) * lodChunkSize};
+                size_t last[3];
+                for (int axis = 0; axis < 3; axis++) {
+                    last[axis] = std::min(origin[axis] + lodChunkSize, lodSide);
+                }
+                for (size_t z = origin[2]; z < last[2]; z++) {
+                    for (size_t y = origin[1]; y < last[1]; y++) {
+                        for (size_t x = origin[0]; x < last[0]; x++) {
+                            mLodCells[x + lodSide * (y + lodSide * z)] =
+                                lodState(x, y, z);
                         }
                     }
+                }
+            }
+        });
+}
 
-                    // Add quad
-                    x[u] = i;
-                    x[v] = j;
+template <typename Vertex>
+size_t Board::meshChunks(const std::vector<size_t>& chunks,
+                         const MeshGrid& grid,
+                         std::vector<std::vector<Vertex>>& spans,
+                         MeshBuffer<Vertex>& mesh, size_t elementsPerQuad) {
+    // every axis of every chunk is meshed into its own span, so the workers
+    // never share a buffer
+    size_t itemCount = chunks.size() * 3;
+    mThreadPool->parallelFor(
+        0, itemCount, grainSizeFor(itemCount), [&](size_t begin, size_t end) {
+            for (size_t item = begin; item < end; item++) {
+                size_t chunk = chunks[item / 3];
+                int axis = item % 3;
+                meshChunkAxis(grid, chunk, axis, spans[chunk * 3 + axis]);
+            }
+        });
 
-                    int du[3] = {0};
-                    du[u] = w;
-                    int dv[3] = {0};
-                    dv[v] = h;
+    // the spans are copied to prefix sum offsets in chunk and axis order, so
+    // the buffer does not depend on the thread count and every chunk is one
+    // contiguous range of quads
+    std::vector<size_t> offsets(spans.size() + 1, 0);
+    for (size_t span = 0; span < spans.size(); span++) {
+        offsets[span + 1] = offsets[span] + spans[span].size();
+    }
+    std::vector<Vertex>& vertices = mesh.back();
+    vertices.resize(offsets.back());
+    mThreadPool->parallelFor(
+        0, spans.size(), grainSizeFor(spans.size()),
+        [&](size_t begin, size_t end) {
+            for (size_t span = begin; span < end; span++) {
+                std::copy(spans[span].begin(), spans[span].end(),
+                          vertices.begin() + offsets[span]);
+            }
+        });
+    std::vector<uint32_t>& chunkOffsets = mesh.backChunkOffsets();
+    chunkOffsets.resize(spans.size() / 3 + 1);
+    for (size_t chunk = 0; chunk < chunkOffsets.size(); chunk++) {
+        chunkOffsets[chunk] = offsets[chunk * 3] / elementsPerQuad;
+    }
+    mesh.publish(offsets.back() / elementsPerQuad);
+    size_t quads = 0;
+    for (size_t chunk : chunks) {
+        for (int axis = 0; axis < 3; axis++) {
+            quads += spans[chunk * 3 + axis].size() / elementsPerQuad;
+        }
+    }
+    return quads;
+}
 
-                    int tl[3] = {x[0], x[1], x[2]};
-                    int tr[3] = {x[0] + du[0], x[1] + du[1], x[2] + du[2]};
-                    int br[3] = {x[0] + du[0] + dv[0], x[1] + du[1] + dv[1],
-                                 x[2] + du[2] + dv[2]};
-                    int bl[3] = {x[0] + dv[0], x[1] + dv[1], x[2] + dv[2]};
+template <typename Vertex>
+void Board::meshChunkAxis(const MeshGrid& grid, size_t chunk, int d,
+                          std::vector<Vertex>& vertices) const {
+    vertices.clear();
+    size_t n = mChunksPerSide;
+    int side = grid.side;
+    int origin[3] = {static_cast<int>(chunk % n) * grid.chunkSize,
+                     static_cast<int>(chunk / n % n) * grid.chunkSize,
+                     static_cast<int>(chunk / (n * n)) * grid.chunkSize};
+    int extent[3];
+    for (int axis = 0; axis < 3; axis++) {
+        extent[axis] = std::min(grid.chunkSize, side - origin[axis]);
+    }
+    auto cellAt = [&](const int* x) {
+        return grid.cells[x[0] + side * (x[1] + side * x[2])];
+    };
+    // the state of the solid cell behind each face of a slice, 0 for none
+    uint8_t mask[CHUNK_SIZE * CHUNK_SIZE];
+    MaskQuad quads[CHUNK_SIZE * CHUNK_SIZE];
 
-                    int* positions[4] = {bl, br, tr, tl};
-                    if (isBackFace) {
-                        std::swap(positions[1], positions[3]);
-                    }
+    int i, j, k, l, w, h;
+    int u = (d + 1) % 3;
+    int v = (d + 2) % 3;
+    int width = extent[u];
+    int height = extent[v];
+    int x[3] = {0};
 
-                    int uvs[4][2] = {{0, 0}, {1, 0}, {1, 1}, {0, 1}};
-                    for (int i = 0; i < 4; i++) {
-                        // positions
-                        mVertexBuffer.push_back(positions[i][0] -
-                                                (mSide / 2.0f + 0.5f));
-                        mVertexBuffer.push_back(positions[i][1] -
-                                                (mSide / 2.0f + 0.5f));
-                        mVertexBuffer.push_back(positions[i][2] -
-                                                (mSide / 2.0f + 0.5f));
-
-                        mVertexBuffer.push_back(uvs[i][0]);
-                        mVertexBuffer.push_back(uvs[i][1]);
-
-                        // normal
-                        float normal[3] = {0};
-                        if (face == Face::RIGHT) {
-                            normal[0] = 1;
-                            normal[1] = 0;
-                            normal[2] = 0;
-                        } else if (face == Face::LEFT) {
-                            normal[0] = -1;
-                            normal[1] = 0;
-                            normal[2] = 0;
-                        } else if (face == Face::UP) {
-                            normal[0] = 0;
-                            normal[1] = 1;
-                            normal[2] = 0;
-                        } else if (face == Face::DOWN) {
-                            normal[0] = 0;
-                            normal[1] = -1;
-                            normal[2] = 0;
-                        } else if (face == Face::FRONT) {
-                            normal[0] = 0;
-                            normal[1] = 0;
-                            normal[2] = 1;
-                        } else {
-                            normal[0] = 0;
-                            normal[1] = 0;
-                            normal[2] = -1;
-                        }
+    int lastPlane = origin[d] + extent[d];
+    if (lastPlane == side) {
+        lastPlane++;
+    }
+    // check each slice one at a time
+    for (int plane = origin[d]; plane < lastPlane; plane++) {
+        // compute the mask between the cells at plane - 1 and plane
+        int n = 0;
+        for (j = 0; j < height; j++) {
+            for (i = 0; i < width; i++) {
+                x[u] = origin[u] + i;
+                x[v] = origin[v] + j;
+                uint8_t blockCurrent = 0;
+                if (plane > 0) {
+                    x[d] = plane - 1;
+                    blockCurrent = cellAt(x);
+                }
+                uint8_t blockCompare = 0;
+                if (plane < side) {
+                    x[d] = plane;
+                    blockCompare = cellAt(x);
+                }
+                bool isFace = (blockCurrent > 0) != (blockCompare > 0);
+                mask[n++] = isFace ? blockCurrent | blockCompare : 0;
+            }
+        }
+        x[d] = plane;
 
-                        mVertexBuffer.push_back(normal[0]);
-                        mVertexBuffer.push_back(normal[1]);
-                        mVertexBuffer.push_back(normal[2]);
-
-                        // color
-                        int rgb[3] = {0};
-                        if (face == Face::RIGHT || face == Face::LEFT) {
-                            rgb[0] = 244;
-                            rgb[1] = 125;
-                            rgb[2] = 126;
-                        } else if (face == Face::UP || face == Face::DOWN) {
-                            rgb[0] = 117;
-                            rgb[1] = 236;
-                            rgb[2] = 125;
-                        } else {
-                            rgb[0] = 128;
-                            rgb[1] = 126;
-                            rgb[2] = 250;
-                        }
+        bool isBackFace = plane % 2;
+        Face face = faceFor(d, isBackFace);
 
-                        mVertexBuffer.push_back(rgb[0] / 255.0f);
-                        mVertexBuffer.push_back(rgb[1] / 255.0f);
-                        mVertexBuffer.push_back(rgb[2] / 255.0f);
-                        mVertexBuffer.push_back(1.0f);
-                    }
-                    mQuadCount++;
+        // Generate mesh for mask using lexicographic ordering
+        size_t quadCount = 0;
+        n = 0;
+        for (j = 0; j < height; j++) {
+            for (i = 0; i < width;) {
+                if (!mask[n]) {
+                    i++;
+                    n++;
+                    continue;
+                }
+
+                // quads only grow over faces of the same state
+                uint8_t state = mask[n];
 
-                    // zero-out mask
-                    for (l = 0; l < h; l++) {
-                        for (k = 0; k < w; k++) {
-                            mask[n + k + l * mSide] = false;
+                // Compute width
+                for (w = 1; i + w < width && mask[n + w] == state; w++) {
+                    // null statement
+                }
+
+                // Compute height
+                bool done = false;
+                for (h = 1; j + h < height; h++) {
+                    for (k = 0; k < w; k++) {
+                        if (mask[n + k + h * width] != state) {
+                            done = true;
+                            break;
                         }
                     }
+                    if (done) {
+                        break;
+                    }
+                }
+
+                quads[quadCount++] = {i, j, w, h, state};
+
+                // zero-out mask
+                for (l = 0; l < h; l++) {
+                    for (k = 0; k < w; k++) {
+                        mask[n + k + l * width] = 0;
+                    }
+                }
 
-                    i += w;
-                    n += w;
+                i += w;
+                n += w;
+            }
+        }
+
+        // the quads of a slice are counted first, so they are written
+        // straight into their final place
+        size_t size = vertices.size();
+        vertices.resize(size + quadCount * quadSize(vertices));
+        Vertex* out = vertices.data() + size;
+        x[d] = plane;
+        for (size_t q = 0; q < quadCount; q++) {
+            const MaskQuad& quad = quads[q];
+            x[u] = origin[u] + quad.i;
+            x[v] = origin[v] + quad.j;
+
+            int du[3] = {0};
+            du[u] = quad.w;
+            int dv[3] = {0};
+            dv[v] = quad.h;
+
+            int tl[3] = {x[0], x[1], x[2]};
+            int tr[3] = {x[0] + du[0], x[1] + du[1], x[2] + du[2]};
+            int br[3] = {x[0] + du[0] + dv[0], x[1] + du[1] + dv[1],
+                         x[2] + du[2] + dv[2]};
+            int bl[3] = {x[0] + dv[0], x[1] + dv[1], x[2] + dv[2]};
+            // back to board cells, the last LOD cell may be cut short
+            for (int* corner : {tl, tr, br, bl}) {
+                for (int axis = 0; axis < 3; axis++) {
+                    corner[axis] = std::min(corner[axis] * grid.scale, mSide);
                 }
             }
+
+            int* positions[4] = {bl, br, tr, tl};
+            if (isBackFace) {
+                std::swap(positions[1], positions[3]);
+            }
+            emitQuad(out, positions, face, mSide, quad.state);
+            out += quadSize(vertices);
         }
     }
 }
 
+static py::array_t<uint8_t> transitionTable(const RuleBuffer& rule) {
+    py::array_t<uint8_t> table(
+        {RuleBuffer::STATE_COUNT, RuleBuffer::NEIGHBOR_COUNTS});
+    std::copy(rule.table.begin(), rule.table.end(), table.mutable_data());
+    return table;
+}
+
 PYBIND11_MODULE(_board, m) {
+    m.def("compile_rule", [](py::object rule) {
+        return transitionTable(RuleBuffer::fromRule(rule));
+    });
+
     py::class_<Board>(m, "Board")
         .def(py::init<int, py::object>())
         .def("update", &Board::update)
+        .def("step", &Board::step, "generations"_a = 1, "remesh"_a = false,
+             py::call_guard<py::gil_scoped_release>())
+        .def("get_generation", &Board::getGeneration)
+        .def("set_generation", &Board::setGeneration)
+        .def("stats", &Board::getStats)
+        .def("reset_stats", &Board::resetStats)
         .def("render", &Board::render)
         .def("clear", &Board::clear)
         .def("randomise",
@@ -396,7 +1004,108 @@ PYBIND11_MODULE(_board, m) {
         .def("set_rule", &Board::setRule)
         .def("get_rule", &Board::getRule)
         .def("get_quad_count", &Board::getQuadCount)
+        .def("get_mesh_version", &Board::getMeshVersion)
         .def("get_cell_state", &Board::getCellState)
         .def("set_cell_state", &Board::setCellState)
-        .def_readonly("vertex_buffer", &Board::mVertexBuffer);
+        .def("get_cells", &Board::getCells, "copy"_a = false)
+        .def("set_cells", &Board::setCells)
+        .def("save", &Board::save, "path"_a, "compress"_a = true)
+        .def("load", &Board::load, "path"_a)
+        .def_property_readonly(
+            "cells", [](Board& board) { return board.getCells(false); })
+        .def("set_alive_plane", &Board::setAlivePlane)
+        .def("has_alive_plane", &Board::hasAlivePlane)
+        .def("get_memory_report", &Board::getMemoryReport)
+        .def("set_thread_count", &Board::setThreadCount,
+             "threadCount"_a = 0)
+        .def("get_thread_count", &Board::getThreadCount)
+        .def("set_grain_size", &Board::setGrainSize)
+        .def("get_grain_size", &Board::getGrainSize)
+        .def("get_chunk_count", &Board::getChunkCount)
+        .def("get_active_chunk_count", &Board::getActiveChunkCount)
+        .def("get_remeshed_chunk_count", &Board::getRemeshedChunkCount)
+        .def("get_transition_table",
+             [](const Board& board) {
+                 return transitionTable(board.getRuleBuffer());
+             })
+        .def_property_readonly("vertex_buffer", &Board::getVertexBuffer)
+        .def("set_packed_vertices", &Board::setPackedVertices)
+        .def("has_packed_vertices", &Board::hasPackedVertices)
+        .def("set_lod", &Board::setLod)
+        .def("has_lod", &Board::hasLod)
+        .def("get_lod_quad_count", &Board::getLodQuadCount)
+        .def_property_readonly("packed_vertex_buffer",
+                               &Board::getPackedVertexBuffer);
+
+    py::class_<SparseBoard>(m, "SparseBoard")
+        .def(py::init<int, py::object, bool>(), "side"_a, "rule"_a,
+             "bounded"_a = true)
+        .def("update", &SparseBoard::update)
+        .def("step", &SparseBoard::step, "generations"_a = 1,
+             "remesh"_a = false, py::call_guard<py::gil_scoped_release>())
+        .def("get_generation", &SparseBoard::getGeneration)
+        .def("render", &SparseBoard::render)
+        .def("clear", &SparseBoard::clear)
+        .def("randomise",
+             [](SparseBoard& board, float radius, float density) {
+                 board.randomise(radius, density);
+             })
+        .def("set_side", &SparseBoard::setSide)
+        .def("get_side", &SparseBoard::getSide)
+        .def("set_rule", &SparseBoard::setRule)
+        .def("get_rule", &SparseBoard::getRule)
+        .def("is_bounded", &SparseBoard::isBounded)
+        .def("get_population", &SparseBoard::getPopulation)
+        .def("get_quad_count", &SparseBoard::getQuadCount)
+        .def("get_mesh_version", &SparseBoard::getMeshVersion)
+        .def("get_cell_state", &SparseBoard::getCellState)
+        .def("set_cell_state", &SparseBoard::setCellState)
+        // copy is accepted for symmetry with Board; the result is always a copy
+        .def(
+            "get_cells",
+            [](const SparseBoard& board, bool) { return board.getCells(); },
+            "copy"_a = true)
+        .def("set_cells", &SparseBoard::setCells)
+        .def("get_memory_report", &SparseBoard::getMemoryReport)
+        .def("get_transition_table",
+             [](const SparseBoard& board) {
+                 return transitionTable(board.getRuleBuffer());
+             })
+        .def_property_readonly("vertex_buffer",
+                               &SparseBoard::getVertexBuffer);
+
+    py::class_<HashLife>(m, "HashLife")
+        .def(py::init<int, py::object, size_t>(), "side"_a, "rule"_a,
+             "cache_limit"_a = HashLife::DEFAULT_CACHE_LIMIT)
+        .def_static(
+            "from_board",
+            [](Board& board, size_t cacheLimit) {
+                std::unique_ptr<HashLife> hashLife(
+                    new HashLife(board.getSide(), board.getRule(), cacheLimit));
+                hashLife->setCells(board.getCells(false));
+                hashLife->setGeneration(board.getGeneration());
+                return hashLife;
+            },
+            "board"_a, "cache_limit"_a = HashLife::DEFAULT_CACHE_LIMIT)
+        .def("to_board",
+             [](const HashLife& hashLife) {
+                 std::unique_ptr<Board> board(
+                     new Board(hashLife.getSide(), hashLife.getRule()));
+                 board->setCells(hashLife.getCells());
+                 board->setGeneration(hashLife.getGeneration());
+                 return board;
+             })
+        .def("step", &HashLife::step, "step_level"_a = 0,
+             py::call_guard<py::gil_scoped_release>())
+        .def("get_generation", &HashLife::getGeneration)
+        .def("get_side", &HashLife::getSide)
+        .def("get_rule", &HashLife::getRule)
+        .def("clear", &HashLife::clear)
+        .def("get_cells", &HashLife::getCells)
+        .def("set_cells", &HashLife::setCells)
+        .def("get_node_count", &HashLife::getNodeCount)
+        .def("set_cache_limit", &HashLife::setCacheLimit)
+        .def("get_cache_limit", &HashLife::getCacheLimit)
+        .def("clear_cache", &HashLife::clearCache)
+        .def("stats", &HashLife::getStats);
 }
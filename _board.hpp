@@ -3,12 +3,26 @@
 #include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 
+#include <cstdint>
+#include <mutex>
+#include <functional>
+#include <memory>
+#include <string>
+#include <unordered_set>
 #include <vector>
 
+#include "./_mesh.hpp"
+#include "./_rule.hpp"
+#include "./_stats.hpp"
+#include "./_thread_pool.hpp"
+
 class Board {
  public:
     Board(int side, pybind11::object rule);
     void update();
+    // Advances the board by the given number of generations. The mesh is
+    // only rebuilt when remesh is set, otherwise on its next use.
+    void step(size_t generations, bool remesh);
     void randomise(float radius, float density);
     void randomise(pybind11::object rule);
     void render();
@@ -17,37 +31,178 @@ class Board {
     void setSide(size_t side);
     int getCellState(size_t x, size_t y, size_t z) const;
     void setCellState(int state, size_t x, size_t y, size_t z);
+    // A (side, side, side) array indexed [x, y, z]. Without copy it is a
+    // read-only view of the cells that follows every update. Changing the
+    // side moves the cells, so setSide and load refuse to while a view (or
+    // an array made from one) is still alive.
+    pybind11::array getCells(bool copy);
+    void setCells(pybind11::array cells);
+    // Writes the side, rule, generation and cells to a snapshot file, see
+    // _snapshot.hpp.
+    void save(const std::string& path, bool compress) const;
+    // Restores a snapshot, taking its side and generation. The rule is only
+    // replaced when the snapshot was saved under another rule name or format.
+    void load(const std::string& path);
+    void setAlivePlane(bool enabled);
+    pybind11::dict getMemoryReport() const;
+    // Per phase timings (monotonic nanoseconds) and counters, each with its
+    // last value, total, count and an average over the last samples.
+    pybind11::dict getStats() const;
+    void resetStats();
+    void setThreadCount(size_t threadCount);
+    inline size_t getThreadCount() const {
+        return mThreadPool->getThreadCount();
+    }
+    inline void setGrainSize(size_t grainSize) { mGrainSize = grainSize; }
+    inline size_t getGrainSize() const { return mGrainSize; }
+    inline size_t getChunkCount() const { return mChunkChanged.size(); }
+    inline size_t getActiveChunkCount() const { return mActiveChunks.size(); }
+    inline size_t getRemeshedChunkCount() const { return mRemeshChunks.size(); }
+    inline bool hasAlivePlane() const { return mUseAlivePlane; }
     inline pybind11::object getRule() const { return mRule; }
-    inline size_t getQuadCount() const { return mQuadCount; }
+    inline const RuleBuffer& getRuleBuffer() const { return mRuleBuffer; }
+    inline size_t getQuadCount() {
+        tryEnsureMesh();
+        return mPackedVertices ? mPackedMesh.getQuadCount()
+                               : mMesh.getQuadCount();
+    }
+    // (vertex count, FLOATS_PER_VERTEX) float32, see MeshBuffer::frontArray
+    inline pybind11::array getVertexBuffer() {
+        tryEnsureMesh();
+        return mMesh.frontArray(FLOATS_PER_VERTEX);
+    }
+    // Switches the mesh between 9 floats per vertex and the two word
+    // packed format. Only the buffer of the current format is filled.
+    void setPackedVertices(bool enabled);
+    inline bool hasPackedVertices() const { return mPackedVertices; }
+    // Also builds a mesh of the board down-sampled to 2x2x2 blocks, which
+    // the renderer draws for chunks far from the camera.
+    void setLod(bool enabled);
+    inline bool hasLod() const { return mLod; }
+    inline size_t getLodQuadCount() {
+        tryEnsureMesh();
+        return mPackedVertices ? mPackedLodMesh.getQuadCount()
+                               : mLodMesh.getQuadCount();
+    }
+    // changes every time a new mesh is published
+    inline uint64_t getMeshVersion() const {
+        return mPackedVertices ? mPackedMesh.getVersion() : mMesh.getVersion();
+    }
+    // (vertex count, 2) uint32
+    inline pybind11::array getPackedVertexBuffer() {
+        tryEnsureMesh();
+        return mPackedMesh.frontArray(WORDS_PER_PACKED_VERTEX);
+    }
+    inline size_t getGeneration() const { return mGeneration; }
+    inline void setGeneration(size_t generation) { mGeneration = generation; }
     inline size_t getSide() const { return mSide; }
     inline size_t getSize() const { return mSide * mSide * mSide; }
 
  public:
-    std::vector<float> mVertexBuffer;
+    static constexpr size_t CHUNK_SIZE = 16;
+    // the largest side setSide and load accept, two 8 GiB cell buffers
+    static constexpr size_t MAX_SIDE = 2048;
+    // board cells along an axis of one cell of the LOD mesh
+    static constexpr size_t LOD_SCALE = 2;
 
  private:
-    enum class Face { BACK, FRONT, RIGHT, LEFT, UP, DOWN, COUNT };
-    struct Rule {
-        std::unordered_set<int> spawn;
-        std::unordered_set<int> survival;
-        uint32_t maxState;
-        std::string neighbor;
+    // per-thread buffers for updating one chunk with a one cell halo
+    struct ChunkScratch {
+        std::vector<size_t> coords[3];
+        std::vector<uint8_t> alive;
+        std::vector<uint8_t> sumsX;
+        std::vector<uint8_t> sumsXY;
+    };
+
+    // the cells a mesh is built from: the board itself, or the coarse grid
+    // of the LOD mesh where every cell stands for scale board cells per axis
+    struct MeshGrid {
+        const uint8_t* cells;
+        int side;
+        int chunkSize;
+        int scale;
     };
 
  private:
-    void calculateGreedyMeshes();
-    int applyRule(int neighborCount, int cellState);
-    int countNeighbors(int index);
+    // returns how many cells changed
+    size_t advance();
+    void ensureMesh();
+    void tryEnsureMesh();
+    // returns the quads it meshed
+    size_t calculateGreedyMeshes();
+    template <typename Vertex>
+    size_t meshChunks(const std::vector<size_t>& chunks, const MeshGrid& grid,
+                      std::vector<std::vector<Vertex>>& spans,
+                      MeshBuffer<Vertex>& mesh, size_t elementsPerQuad);
+    template <typename Vertex>
+    void meshChunkAxis(const MeshGrid& grid, size_t chunk, int axis,
+                       std::vector<Vertex>& vertices) const;
+    void updateLodCells(const std::vector<size_t>& chunks);
+    void clearLod();
+    // throws std::invalid_argument for a side the board cannot take
+    void checkSide(size_t side) const;
+    // throws while a view from getCells(false) could still see mCells
+    void checkNoCellViews() const;
+    void resetChunks();
+    void markChunkChanged(size_t x, size_t y, size_t z);
+    void markAllChunksChanged();
+    void collectActiveChunks();
+    size_t updateChunk(size_t chunk, ChunkScratch& scratch);
+    void copyChunk(size_t chunk);
+    void packAlivePlane();
+    inline bool isAlive(size_t index) const {
+        if (mUseAlivePlane) {
+            return (mAlivePlane[index >> 6] >> (index & 63)) & 1;
+        }
+        return mCells[index] == 1;
+    }
     int getIndex(int x, int y, int z);
     std::vector<int> getCoordinate(int index);
     void setRuleBuffer(pybind11::object rule);
     size_t coordToIndex(size_t x, size_t y, size_t z) const;
+    size_t grainSizeFor(size_t itemCount) const;
 
  private:
     int mSide;
-    size_t mQuadCount;
+    size_t mGeneration;
+    bool mMeshDirty;
+    bool mPackedVertices;
+    MeshBuffer<float> mMesh;
+    MeshBuffer<uint32_t> mPackedMesh;
+    bool mLod;
+    // the LOD mesh has to be rebuilt for every chunk, not only changed ones
+    bool mLodStale;
+    MeshBuffer<float> mLodMesh;
+    MeshBuffer<uint32_t> mPackedLodMesh;
+    // held while stepping so that render() can tell a step is running on
+    // another thread and keep drawing the last published mesh
+    std::mutex mStateMutex;
+    // stats are written while stepping and read from the render thread
+    mutable std::mutex mStatsMutex;
+    BoardStats mStats;
     pybind11::object mRule;
-    Rule mRuleBuffer;
-    std::vector<int> mCells;
-    std::vector<int> mCellsBuffer;
+    RuleBuffer mRuleBuffer;
+    bool mUseAlivePlane;
+    std::vector<uint8_t> mCells;
+    std::vector<uint8_t> mCellsBuffer;
+    // shared by every view of mCells, so its use count tells whether any
+    // are still alive
+    std::shared_ptr<const void> mCellViews;
+    std::vector<uint64_t> mAlivePlane;
+    size_t mChunksPerSide;
+    std::vector<uint8_t> mChunkChanged;
+    std::vector<uint8_t> mChunkChangedNext;
+    std::vector<size_t> mActiveChunks;
+    // chunks changed since their mesh was last built
+    std::vector<uint8_t> mChunkMeshDirty;
+    // the mesh of each chunk, one span per axis
+    std::vector<std::vector<float>> mChunkMeshes;
+    std::vector<std::vector<uint32_t>> mPackedChunkMeshes;
+    // the board down-sampled by LOD_SCALE and the LOD mesh of each chunk
+    std::vector<uint8_t> mLodCells;
+    std::vector<std::vector<float>> mLodChunkMeshes;
+    std::vector<std::vector<uint32_t>> mPackedLodChunkMeshes;
+    std::vector<size_t> mRemeshChunks;
+    std::unique_ptr<ThreadPool> mThreadPool;
+    size_t mGrainSize;
 };
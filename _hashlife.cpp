@@ -0,0 +1,354 @@
+#include "./_hashlife.hpp"
+
+#include <algorithm>
+#include <stdexcept>
+
+namespace py = pybind11;
+using namespace pybind11::literals;
+
+namespace {
+
+inline int octantOf(int x, int y, int z) { return x | y << 1 | z << 2; }
+
+}  // namespace
+
+const size_t HashLife::DEFAULT_CACHE_LIMIT;
+const int HashLife::MAX_STEP_LEVEL;
+const HashLife::NodeId HashLife::LEAF_COUNT;
+const int8_t HashLife::NO_RESULT;
+
+HashLife::HashLife(int side, py::object rule, size_t cacheLimit)
+    : mSide(side),
+      mSideLevel(0),
+      mGeneration(0),
+      mRule(rule),
+      mCacheLimit(cacheLimit),
+      mHits(0),
+      mMisses(0),
+      mCollections(0) {
+    if (side < 2 || (side & (side - 1)) != 0) {
+        throw std::invalid_argument("side must be a power of two");
+    }
+    while ((size_t(1) << mSideLevel) < mSide) {
+        mSideLevel++;
+    }
+    mRuleBuffer = RuleBuffer::fromRule(rule);
+    resetNodes();
+    clear();
+}
+
+void HashLife::resetNodes() {
+    mNodes.clear();
+    mNodeTable.clear();
+    mEmptyNodes.clear();
+    for (NodeId state = 0; state < LEAF_COUNT; state++) {
+        mNodes.push_back(Node{Children{}, 0, NO_RESULT, 0});
+    }
+}
+
+void HashLife::clear() {
+    mGeneration = 0;
+    mRoot = emptyNode(mSideLevel);
+}
+
+void HashLife::clearCache() {
+    collectGarbage();
+    mHits = 0;
+    mMisses = 0;
+}
+
+HashLife::NodeId HashLife::makeNode(const Children& children) {
+    auto found = mNodeTable.find(children);
+    if (found != mNodeTable.end()) {
+        return found->second;
+    }
+    NodeId id = mNodes.size();
+    uint8_t level = mNodes[children[0]].level + 1;
+    mNodes.push_back(Node{children, 0, NO_RESULT, level});
+    mNodeTable.emplace(children, id);
+    return id;
+}
+
+HashLife::NodeId HashLife::child(NodeId node, int octant) const {
+    return mNodes[node].children[octant];
+}
+
+HashLife::NodeId HashLife::emptyNode(int level) {
+    while (static_cast<int>(mEmptyNodes.size()) <= level) {
+        if (mEmptyNodes.empty()) {
+            mEmptyNodes.push_back(0);
+            continue;
+        }
+        Children children;
+        children.fill(mEmptyNodes.back());
+        mEmptyNodes.push_back(makeNode(children));
+    }
+    return mEmptyNodes[level];
+}
+
+// The torus repeated 2^(level - mSideLevel) times along every axis.
+HashLife::NodeId HashLife::tiledNode(int level) {
+    NodeId node = mRoot;
+    for (int i = mSideLevel; i < level; i++) {
+        Children children;
+        children.fill(node);
+        node = makeNode(children);
+    }
+    return node;
+}
+
+// The half size node in the middle of node, made of the inner octant of
+// each child.
+HashLife::NodeId HashLife::centerNode(NodeId node) {
+    Children children;
+    for (int octant = 0; octant < 8; octant++) {
+        children[octant] = child(child(node, octant), 7 - octant);
+    }
+    return makeNode(children);
+}
+
+// Returns the center half of node advanced by 2^stepLevel generations.
+// A node of level L only knows enough of its surroundings to look
+// 2^(L - 2) generations ahead, so stepLevel must not exceed L - 2.
+HashLife::NodeId HashLife::successor(NodeId node, int stepLevel) {
+    const Node& current = mNodes[node];
+    if (current.resultStep == stepLevel) {
+        mHits++;
+        return current.result;
+    }
+    mMisses++;
+    int level = current.level;
+    NodeId result;
+    if (level == 2) {
+        result = leafSuccessor(node);
+    } else {
+        // the 4x4x4 grid of grandchildren
+        NodeId grid[4][4][4];
+        for (int z = 0; z < 4; z++) {
+            for (int y = 0; y < 4; y++) {
+                for (int x = 0; x < 4; x++) {
+                    grid[x][y][z] =
+                        child(child(node, octantOf(x >> 1, y >> 1, z >> 1)),
+                              octantOf(x & 1, y & 1, z & 1));
+                }
+            }
+        }
+        // 27 overlapping nodes of half the size, each advanced by the first
+        // half of the jump at full speed, or only centered for a shorter one
+        bool fullSpeed = stepLevel == level - 2;
+        NodeId middle[3][3][3];
+        for (int z = 0; z < 3; z++) {
+            for (int y = 0; y < 3; y++) {
+                for (int x = 0; x < 3; x++) {
+                    Children children;
+                    for (int octant = 0; octant < 8; octant++) {
+                        children[octant] = grid[x + (octant & 1)]
+                                               [y + (octant >> 1 & 1)]
+                                               [z + (octant >> 2)];
+                    }
+                    NodeId part = makeNode(children);
+                    middle[x][y][z] = fullSpeed ? successor(part, level - 3)
+                                                : centerNode(part);
+                }
+            }
+        }
+        // the eight octants of the result run the rest of the jump
+        int nextStep = fullSpeed ? level - 3 : stepLevel;
+        Children resultChildren;
+        for (int octant = 0; octant < 8; octant++) {
+            int x = octant & 1;
+            int y = octant >> 1 & 1;
+            int z = octant >> 2;
+            Children children;
+            for (int part = 0; part < 8; part++) {
+                children[part] = middle[x + (part & 1)][y + (part >> 1 & 1)]
+                                       [z + (part >> 2)];
+            }
+            resultChildren[octant] = successor(makeNode(children), nextStep);
+        }
+        result = makeNode(resultChildren);
+    }
+    // makeNode may have grown mNodes, so current is no longer valid
+    mNodes[node].result = result;
+    mNodes[node].resultStep = stepLevel;
+    return result;
+}
+
+// Runs one generation of the 4x4x4 cells of a level 2 node directly and
+// returns the middle 2x2x2 cells.
+HashLife::NodeId HashLife::leafSuccessor(NodeId node) {
+    uint8_t cells[4][4][4];
+    for (int z = 0; z < 4; z++) {
+        for (int y = 0; y < 4; y++) {
+            for (int x = 0; x < 4; x++) {
+                cells[x][y][z] =
+                    child(child(node, octantOf(x >> 1, y >> 1, z >> 1)),
+                          octantOf(x & 1, y & 1, z & 1));
+            }
+        }
+    }
+    Children children;
+    for (int octant = 0; octant < 8; octant++) {
+        int x = 1 + (octant & 1);
+        int y = 1 + (octant >> 1 & 1);
+        int z = 1 + (octant >> 2);
+        int count = 0;
+        if (mRuleBuffer.isMoore()) {
+            for (int dz = -1; dz <= 1; dz++) {
+                for (int dy = -1; dy <= 1; dy++) {
+                    for (int dx = -1; dx <= 1; dx++) {
+                        count += cells[x + dx][y + dy][z + dz] == 1;
+                    }
+                }
+            }
+            count -= cells[x][y][z] == 1;
+        } else {
+            count = (cells[x - 1][y][z] == 1) + (cells[x + 1][y][z] == 1) +
+                    (cells[x][y - 1][z] == 1) + (cells[x][y + 1][z] == 1) +
+                    (cells[x][y][z - 1] == 1) + (cells[x][y][z + 1] == 1);
+        }
+        children[octant] = mRuleBuffer.next(cells[x][y][z], count);
+    }
+    return makeNode(children);
+}
+
+void HashLife::step(int stepLevel) {
+    if (stepLevel < 0 || stepLevel > MAX_STEP_LEVEL) {
+        throw std::invalid_argument("step level must be between 0 and 60");
+    }
+    // nodes in use by a running jump cannot be evicted, so the limit is
+    // enforced between jumps
+    if (getNodeCount() > mCacheLimit) {
+        collectGarbage();
+    }
+    // the result is the center of a node at least twice the side, so a
+    // big enough block of tiles covers everything the jump can see
+    int level = std::max(mSideLevel + 1, stepLevel + 2);
+    NodeId result = successor(tiledNode(level), stepLevel);
+    if (level == mSideLevel + 1) {
+        // the center is the torus shifted by half its side
+        Children children;
+        for (int octant = 0; octant < 8; octant++) {
+            children[octant] = child(result, 7 - octant);
+        }
+        result = makeNode(children);
+    } else {
+        // the center starts on a tile border, so any tile is the torus
+        for (int i = level - 1; i > mSideLevel; i--) {
+            result = child(result, 0);
+        }
+    }
+    mRoot = result;
+    mGeneration += size_t(1) << stepLevel;
+}
+
+// Drops every node the board no longer uses along with all remembered
+// results.
+void HashLife::collectGarbage() {
+    std::vector<Node> nodes(mNodes.begin(), mNodes.begin() + LEAF_COUNT);
+    std::unordered_map<NodeId, NodeId> remap;
+    mNodeTable.clear();
+    mEmptyNodes.clear();
+    mRoot = copyReachable(mRoot, nodes, remap);
+    mNodes.swap(nodes);
+    mCollections++;
+}
+
+HashLife::NodeId HashLife::copyReachable(
+    NodeId node, std::vector<Node>& nodes,
+    std::unordered_map<NodeId, NodeId>& remap) {
+    if (node < LEAF_COUNT) {
+        return node;
+    }
+    auto found = remap.find(node);
+    if (found != remap.end()) {
+        return found->second;
+    }
+    Node copy = mNodes[node];
+    for (NodeId& child : copy.children) {
+        child = copyReachable(child, nodes, remap);
+    }
+    copy.resultStep = NO_RESULT;
+    NodeId id = nodes.size();
+    nodes.push_back(copy);
+    mNodeTable.emplace(copy.children, id);
+    remap.emplace(node, id);
+    return id;
+}
+
+HashLife::NodeId HashLife::buildNode(const uint8_t* cells, size_t x, size_t y,
+                                     size_t z, int level) {
+    if (level == 0) {
+        return cells[x + mSide * (y + mSide * z)];
+    }
+    size_t half = size_t(1) << (level - 1);
+    Children children;
+    for (int octant = 0; octant < 8; octant++) {
+        children[octant] =
+            buildNode(cells, x + (octant & 1) * half,
+                      y + (octant >> 1 & 1) * half, z + (octant >> 2) * half,
+                      level - 1);
+    }
+    return makeNode(children);
+}
+
+void HashLife::writeCells(NodeId node, uint8_t* cells, size_t x, size_t y,
+                          size_t z) const {
+    const Node& current = mNodes[node];
+    if (current.level == 0) {
+        cells[x + mSide * (y + mSide * z)] = node;
+        return;
+    }
+    // cells start out empty
+    if (static_cast<int>(mEmptyNodes.size()) > current.level &&
+        mEmptyNodes[current.level] == node) {
+        return;
+    }
+    size_t half = size_t(1) << (current.level - 1);
+    for (int octant = 0; octant < 8; octant++) {
+        writeCells(current.children[octant], cells, x + (octant & 1) * half,
+                   y + (octant >> 1 & 1) * half, z + (octant >> 2) * half);
+    }
+}
+
+py::array HashLife::getCells() const {
+    size_t side = mSide;
+    py::array_t<uint8_t, py::array::f_style> cells({side, side, side});
+    std::fill(cells.mutable_data(), cells.mutable_data() + cells.size(), 0);
+    writeCells(mRoot, cells.mutable_data(), 0, 0, 0);
+    return cells;
+}
+
+void HashLife::setCells(py::array cells) {
+    if (cells.ndim() != 3 || static_cast<size_t>(cells.shape(0)) != mSide ||
+        static_cast<size_t>(cells.shape(1)) != mSide ||
+        static_cast<size_t>(cells.shape(2)) != mSide) {
+        throw std::invalid_argument("cells must have shape (side, side, side)");
+    }
+    auto states =
+        py::array_t<int64_t, py::array::f_style | py::array::forcecast>(cells);
+    const int64_t* data = states.data();
+    std::vector<uint8_t> bytes(states.size());
+    for (size_t index = 0; index < bytes.size(); index++) {
+        if (data[index] < 0 || data[index] > UINT8_MAX) {
+            throw std::invalid_argument("cell state must be between 0 and 255");
+        }
+        bytes[index] = data[index];
+    }
+    mRoot = buildNode(bytes.data(), 0, 0, 0, mSideLevel);
+}
+
+py::dict HashLife::getStats() const {
+    size_t lookups = mHits + mMisses;
+    double hitRate = lookups ? static_cast<double>(mHits) / lookups : 0.0;
+    // a node of std::unordered_map holds the key, the id, a next pointer and
+    // the cached hash
+    size_t entrySize = sizeof(Children) + sizeof(NodeId) + 2 * sizeof(void*);
+    size_t memory = mNodes.capacity() * sizeof(Node) +
+                    mNodeTable.size() * entrySize +
+                    mNodeTable.bucket_count() * sizeof(void*);
+    return py::dict("nodes"_a = getNodeCount(), "cache_limit"_a = mCacheLimit,
+                    "hits"_a = mHits, "misses"_a = mMisses,
+                    "hit_rate"_a = hitRate, "collections"_a = mCollections,
+                    "memory"_a = memory);
+}
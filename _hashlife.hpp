@@ -0,0 +1,99 @@
+#pragma once
+
+#include <pybind11/numpy.h>
+#include <pybind11/pybind11.h>
+
+#include <array>
+#include <cstdint>
+#include <unordered_map>
+#include <vector>
+
+#include "./_rule.hpp"
+
+// A HashLife engine for the same rules as Board. The board is a canonical
+// octree: equal regions share one node, and every node remembers the center
+// it turns into after 2^j generations, so repeating and still regions are
+// only ever computed once. The board is a torus like Board, which needs a
+// power of two side.
+class HashLife {
+ public:
+    static const size_t DEFAULT_CACHE_LIMIT = size_t(1) << 20;
+    // jumps past 2^MAX_STEP_LEVEL generations would overflow the generation
+    static const int MAX_STEP_LEVEL = 60;
+
+    HashLife(int side, pybind11::object rule,
+             size_t cacheLimit = DEFAULT_CACHE_LIMIT);
+    // Advances the board by 2^stepLevel generations.
+    void step(int stepLevel);
+    void clear();
+    pybind11::array getCells() const;
+    void setCells(pybind11::array cells);
+    pybind11::dict getStats() const;
+    void clearCache();
+    inline void setCacheLimit(size_t cacheLimit) { mCacheLimit = cacheLimit; }
+    inline size_t getCacheLimit() const { return mCacheLimit; }
+    inline size_t getNodeCount() const { return mNodes.size() - LEAF_COUNT; }
+    inline pybind11::object getRule() const { return mRule; }
+    inline size_t getGeneration() const { return mGeneration; }
+    inline void setGeneration(size_t generation) { mGeneration = generation; }
+    inline size_t getSide() const { return mSide; }
+
+ private:
+    using NodeId = uint32_t;
+    using Children = std::array<NodeId, 8>;
+
+    struct Node {
+        Children children;
+        NodeId result;
+        // the step level result was computed for, or NO_RESULT
+        int8_t resultStep;
+        uint8_t level;
+    };
+
+    struct ChildrenHash {
+        size_t operator()(const Children& children) const {
+            uint64_t hash = 0;
+            for (NodeId child : children) {
+                hash = (hash ^ child) * 0x100000001b3ull;
+                hash ^= hash >> 29;
+            }
+            return hash;
+        }
+    };
+
+    // level 0 nodes are single cells and their id is their state
+    static const NodeId LEAF_COUNT = RuleBuffer::STATE_COUNT;
+    static const int8_t NO_RESULT = -1;
+
+ private:
+    void resetNodes();
+    NodeId makeNode(const Children& children);
+    NodeId child(NodeId node, int octant) const;
+    NodeId emptyNode(int level);
+    NodeId tiledNode(int level);
+    NodeId centerNode(NodeId node);
+    NodeId successor(NodeId node, int stepLevel);
+    NodeId leafSuccessor(NodeId node);
+    NodeId buildNode(const uint8_t* cells, size_t x, size_t y, size_t z,
+                     int level);
+    void writeCells(NodeId node, uint8_t* cells, size_t x, size_t y, size_t z)
+        const;
+    void collectGarbage();
+    NodeId copyReachable(NodeId node, std::vector<Node>& nodes,
+                         std::unordered_map<NodeId, NodeId>& remap);
+
+ private:
+    size_t mSide;
+    int mSideLevel;
+    size_t mGeneration;
+    pybind11::object mRule;
+    RuleBuffer mRuleBuffer;
+    NodeId mRoot;
+    std::vector<Node> mNodes;
+    std::unordered_map<Children, NodeId, ChildrenHash> mNodeTable;
+    std::vector<NodeId> mEmptyNodes;
+    size_t mCacheLimit;
+    size_t mHits;
+    size_t mMisses;
+    size_t mCollections;
+};
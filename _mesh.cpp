@@ -0,0 +1,139 @@
+#include "./_mesh.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <array>
+#include <atomic>
+
+namespace py = pybind11;
+
+// Renderer.draw_mesh, imported on the first draw so that boards can be used
+// without OpenGL. It is never freed, as it would outlive the interpreter.
+static py::object& drawMesh() {
+    static py::object* drawMesh = new py::object(
+        py::module_::import("engine.renderer").attr("Renderer").attr(
+            "draw_mesh"));
+    return *drawMesh;
+}
+
+Face faceFor(int axis, bool isBackFace) {
+    if (axis == 0) {
+        return isBackFace ? Face::LEFT : Face::RIGHT;
+    } else if (axis == 1) {
+        return isBackFace ? Face::DOWN : Face::UP;
+    }
+    return isBackFace ? Face::BACK : Face::FRONT;
+}
+
+namespace {
+
+// the uv and normal of every vertex of a quad showing each face, with the
+// positions and the state left to fill in
+using QuadTemplate = std::array<float, FLOATS_PER_QUAD>;
+
+std::array<QuadTemplate, size_t(Face::COUNT)> buildQuadTemplates() {
+    const float uvs[4][2] = {{0, 0}, {1, 0}, {1, 1}, {0, 1}};
+    // in Face order: back, front, right, left, up, down
+    const float normals[][3] = {{0, 0, -1}, {0, 0, 1},  {1, 0, 0},
+                                {-1, 0, 0}, {0, 1, 0}, {0, -1, 0}};
+    std::array<QuadTemplate, size_t(Face::COUNT)> templates;
+    for (size_t face = 0; face < templates.size(); face++) {
+        for (int corner = 0; corner < 4; corner++) {
+            float* vertex = &templates[face][corner * FLOATS_PER_VERTEX];
+            float attributes[FLOATS_PER_VERTEX] = {
+                0,
+                0,
+                0,
+                uvs[corner][0],
+                uvs[corner][1],
+                normals[face][0],
+                normals[face][1],
+                normals[face][2],
+                0};
+            std::copy(attributes, attributes + FLOATS_PER_VERTEX, vertex);
+        }
+    }
+    return templates;
+}
+
+const std::array<QuadTemplate, size_t(Face::COUNT)> QUAD_TEMPLATES =
+    buildQuadTemplates();
+
+}  // namespace
+
+void writeQuad(float* out, int* positions[4], Face face, int side,
+               uint8_t state) {
+    std::copy(QUAD_TEMPLATES[size_t(face)].begin(),
+              QUAD_TEMPLATES[size_t(face)].end(), out);
+    float offset = side / 2.0f + 0.5f;
+    for (int corner = 0; corner < 4; corner++) {
+        float* vertex = out + corner * FLOATS_PER_VERTEX;
+        vertex[0] = positions[corner][0] - offset;
+        vertex[1] = positions[corner][1] - offset;
+        vertex[2] = positions[corner][2] - offset;
+        vertex[FLOATS_PER_VERTEX - 1] = state;
+    }
+}
+
+void writePackedQuad(uint32_t* out, int* positions[4], Face face,
+                     uint8_t state) {
+    uint32_t attributes = static_cast<uint32_t>(face) | uint32_t(state) << 8;
+    for (uint32_t corner = 0; corner < 4; corner++) {
+        out[corner * 2] = positions[corner][0] | positions[corner][1] << 10 |
+                          positions[corner][2] << 20 | corner << 30;
+        out[corner * 2 + 1] = attributes;
+    }
+}
+
+void appendQuad(std::vector<float>& vertices, int* positions[4], Face face,
+                int side, uint8_t state) {
+    size_t size = vertices.size();
+    vertices.resize(size + FLOATS_PER_QUAD);
+    writeQuad(vertices.data() + size, positions, face, side, state);
+}
+
+void appendPackedQuad(std::vector<uint32_t>& vertices, int* positions[4],
+                      Face face, uint8_t state) {
+    size_t size = vertices.size();
+    vertices.resize(size + WORDS_PER_PACKED_QUAD);
+    writePackedQuad(vertices.data() + size, positions, face, state);
+}
+
+uint64_t nextMeshId() {
+    static std::atomic<uint64_t> meshCount(0);
+    return ++meshCount;
+}
+
+template <typename Vertex>
+static size_t drawVertices(const std::vector<Vertex>& vertices,
+                           uint64_t meshId, uint64_t version, int side,
+                           const std::vector<uint32_t>& chunkOffsets,
+                           int chunkSize, const char* part, bool packed) {
+    py::object offsets = py::none();
+    if (!chunkOffsets.empty()) {
+        offsets = py::memoryview::from_memory(
+            chunkOffsets.data(), sizeof(uint32_t) * chunkOffsets.size());
+    }
+    py::object uploaded = drawMesh()(
+        meshId, version,
+        py::memoryview::from_memory(vertices.data(),
+                                    sizeof(Vertex) * vertices.size()),
+        side, packed, chunkSize, offsets, part);
+    return uploaded.is_none() ? 0 : uploaded.cast<size_t>();
+}
+
+size_t drawVertexBuffer(const std::vector<float>& vertices, uint64_t meshId,
+                        uint64_t version, int side,
+                        const std::vector<uint32_t>& chunkOffsets,
+                        int chunkSize, const char* part) {
+    return drawVertices(vertices, meshId, version, side, chunkOffsets,
+                        chunkSize, part, false);
+}
+
+size_t drawVertexBuffer(const std::vector<uint32_t>& vertices,
+                        uint64_t meshId, uint64_t version, int side,
+                        const std::vector<uint32_t>& chunkOffsets,
+                        int chunkSize, const char* part) {
+    return drawVertices(vertices, meshId, version, side, chunkOffsets,
+                        chunkSize, part, true);
+}
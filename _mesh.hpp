@@ -0,0 +1,184 @@
+#pragma once
+
+#include <pybind11/numpy.h>
+
+#include <cstddef>
+#include <cstdint>
+#include <memory>
+#include <mutex>
+#include <utility>
+#include <vector>
+
+enum class Face { BACK, FRONT, RIGHT, LEFT, UP, DOWN, COUNT };
+
+// position, uv, normal and cell state of one vertex, four vertices per quad.
+// The shaders look the color of a state up in the palette texture.
+const size_t FLOATS_PER_VERTEX = 3 + 2 + 3 + 1;
+const size_t FLOATS_PER_QUAD = 4 * FLOATS_PER_VERTEX;
+
+// The packed format stores a vertex in two words: the position with 10 bits
+// per axis and the corner of the quad, then the face and the cell state.
+// flat_packed.glsl unpacks it.
+const size_t WORDS_PER_PACKED_VERTEX = 2;
+const size_t WORDS_PER_PACKED_QUAD = 4 * WORDS_PER_PACKED_VERTEX;
+const int MAX_PACKED_SIDE = 1023;
+
+// The face a quad on an axis-aligned slice shows, alternating with the
+// parity of the slice.
+Face faceFor(int axis, bool isBackFace);
+
+// Writes the four vertices (position, uv, normal, state) of a quad whose
+// corners are given in bottom-left, bottom-right, top-right, top-left
+// order to out, which has room for FLOATS_PER_QUAD floats. Positions are in
+// cell units and get centered on a board of side. The uvs and normals are
+// copied from a precomputed quad of the same face.
+void writeQuad(float* out, int* positions[4], Face face, int side,
+               uint8_t state);
+
+// The same quad in the packed format, WORDS_PER_PACKED_QUAD words.
+void writePackedQuad(uint32_t* out, int* positions[4], Face face,
+                     uint8_t state);
+
+// The same, appended to the end of vertices.
+void appendQuad(std::vector<float>& vertices, int* positions[4], Face face,
+                int side, uint8_t state);
+void appendPackedQuad(std::vector<uint32_t>& vertices, int* positions[4],
+                      Face face, uint8_t state);
+
+// Draws the vertices with Renderer.draw_mesh, which keeps them on the GPU
+// and only uploads them again when meshId or version changes. When the mesh
+// is laid out chunk by chunk, chunkOffsets holds the first quad of every
+// chunk plus the quad count, so the renderer can skip chunks; part tells it
+// which chunks this mesh is meant for ("all", or "near" and "far" when a
+// coarser mesh is drawn for the distant chunks). Returns the bytes uploaded.
+size_t drawVertexBuffer(const std::vector<float>& vertices, uint64_t meshId,
+                        uint64_t version, int side,
+                        const std::vector<uint32_t>& chunkOffsets,
+                        int chunkSize, const char* part);
+size_t drawVertexBuffer(const std::vector<uint32_t>& vertices,
+                        uint64_t meshId, uint64_t version, int side,
+                        const std::vector<uint32_t>& chunkOffsets,
+                        int chunkSize, const char* part);
+
+// A process wide unique id for every MeshBuffer.
+uint64_t nextMeshId();
+
+// Two vertex buffers: a mesher fills back() on any thread and publishes it
+// when it is complete, while render() keeps drawing the last published
+// front buffer. Publishing only swaps the two buffers, so a slow mesher
+// never holds up drawing. Every publish bumps the version, so the renderer
+// can tell when the front buffer holds a new mesh. Arrays handed out by
+// frontArray() share a buffer, which the mesher then leaves alone and
+// replaces with a new one.
+template <typename Vertex>
+class MeshBuffer {
+ public:
+    MeshBuffer()
+        : mFront(std::make_shared<std::vector<Vertex>>()),
+          mBack(std::make_shared<std::vector<Vertex>>()),
+          mId(nextMeshId()) {}
+
+    inline std::vector<Vertex>& back() {
+        if (mBack.use_count() > 1) {
+            mBack = std::make_shared<std::vector<Vertex>>();
+        }
+        return *mBack;
+    }
+
+    // A read-only array of the published vertices with elementsPerVertex
+    // columns. It does not copy them, and stays valid and unchanged after
+    // later publishes.
+    pybind11::array frontArray(size_t elementsPerVertex) const {
+        std::shared_ptr<const std::vector<Vertex>> vertices;
+        {
+            std::lock_guard<std::mutex> lock(mMutex);
+            vertices = mFront;
+        }
+        std::vector<size_t> shape{vertices->size() / elementsPerVertex,
+                                  elementsPerVertex};
+        pybind11::array array;
+        if (vertices->empty()) {
+            array = pybind11::array_t<Vertex>(shape);
+        } else {
+            auto* owner =
+                new std::shared_ptr<const std::vector<Vertex>>(vertices);
+            pybind11::capsule base(owner, [](void* owner) {
+                delete static_cast<std::shared_ptr<const std::vector<Vertex>>*>(
+                    owner);
+            });
+            array = pybind11::array_t<Vertex>(shape, vertices->data(), base);
+        }
+        array.attr("setflags")(false);
+        return array;
+    }
+
+    // the first quad of every chunk in back(), plus the quad count; empty
+    // when the mesh is not split into chunks
+    inline std::vector<uint32_t>& backChunkOffsets() {
+        return mBackChunkOffsets;
+    }
+
+    void publish(size_t quadCount) {
+        std::lock_guard<std::mutex> lock(mMutex);
+        mFront.swap(mBack);
+        std::swap(mFrontChunkOffsets, mBackChunkOffsets);
+        mQuadCount = quadCount;
+        mVersion++;
+    }
+
+    // Returns the bytes uploaded to the GPU, 0 when it already had the mesh.
+    // The lock is not held while the renderer runs: Python may hand the GIL
+    // to a thread that then waits for the lock in one of the getters.
+    size_t draw(int side, int chunkSize = 0, const char* part = "all") {
+        std::shared_ptr<const std::vector<Vertex>> vertices;
+        std::vector<uint32_t> chunkOffsets;
+        uint64_t version;
+        {
+            std::lock_guard<std::mutex> lock(mMutex);
+            // the mesher leaves a shared front buffer alone after a publish
+            vertices = mFront;
+            chunkOffsets = mFrontChunkOffsets;
+            version = mVersion;
+        }
+        return drawVertexBuffer(*vertices, mId, version, side, chunkOffsets,
+                                chunkSize, part);
+    }
+
+    inline uint64_t getVersion() const {
+        std::lock_guard<std::mutex> lock(mMutex);
+        return mVersion;
+    }
+
+    // frees both buffers
+    void clear() {
+        std::lock_guard<std::mutex> lock(mMutex);
+        mFront = std::make_shared<std::vector<Vertex>>();
+        mBack = std::make_shared<std::vector<Vertex>>();
+        std::vector<uint32_t>().swap(mFrontChunkOffsets);
+        std::vector<uint32_t>().swap(mBackChunkOffsets);
+        mQuadCount = 0;
+        mVersion++;
+    }
+
+    inline size_t getQuadCount() const {
+        std::lock_guard<std::mutex> lock(mMutex);
+        return mQuadCount;
+    }
+
+    inline size_t capacityBytes() const {
+        std::lock_guard<std::mutex> lock(mMutex);
+        return (mFront->capacity() + mBack->capacity()) * sizeof(Vertex) +
+               (mFrontChunkOffsets.capacity() + mBackChunkOffsets.capacity()) *
+                   sizeof(uint32_t);
+    }
+
+ private:
+    std::shared_ptr<std::vector<Vertex>> mFront;
+    std::shared_ptr<std::vector<Vertex>> mBack;
+    std::vector<uint32_t> mFrontChunkOffsets;
+    std::vector<uint32_t> mBackChunkOffsets;
+    size_t mQuadCount = 0;
+    const uint64_t mId;
+    uint64_t mVersion = 0;
+    mutable std::mutex mMutex;
+};
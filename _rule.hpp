@@ -0,0 +1,63 @@
+#pragma once
+
+#include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
+
+#include <cstdint>
+#include <stdexcept>
+#include <string>
+#include <unordered_set>
+#include <vector>
+
+// A rule.Rule compiled into a flat table of the next state for every
+// (state, alive neighbor count) pair, so the update kernels can run without
+// the GIL and without branching on the rule.
+struct RuleBuffer {
+    static const int STATE_COUNT = UINT8_MAX + 1;
+    // a cell can see at most 26 alive neighbors
+    static const int NEIGHBOR_COUNTS = 27;
+
+    std::vector<uint8_t> table;
+    uint32_t maxState = 2;
+    bool moore = true;
+
+    static RuleBuffer fromRule(pybind11::object rule) {
+        auto spawn = rule.attr("spawn").cast<std::unordered_set<int>>();
+        auto survival = rule.attr("survival").cast<std::unordered_set<int>>();
+        auto neighbor = rule.attr("neighbor").cast<std::string>();
+
+        RuleBuffer buffer;
+        buffer.maxState = rule.attr("max_state").cast<uint32_t>();
+        if (buffer.maxState > STATE_COUNT) {
+            throw std::invalid_argument("max_state must not exceed 256");
+        }
+        buffer.moore = neighbor == "M";
+        buffer.table.resize(STATE_COUNT * NEIGHBOR_COUNTS);
+        for (int state = 0; state < STATE_COUNT; state++) {
+            for (int count = 0; count < NEIGHBOR_COUNTS; count++) {
+                int next = state;
+                // survival has always been checked against one neighbor
+                // less than the cell really has
+                if (state == 0 && spawn.count(count)) {
+                    next = 1;
+                } else if (state > 1 ||
+                           (state == 1 && !survival.count(count - 1))) {
+                    next = state + 1;
+                    if (next >= static_cast<int>(buffer.maxState)) {
+                        next = 0;
+                    }
+                }
+                buffer.table[state * NEIGHBOR_COUNTS + count] = next;
+            }
+        }
+        return buffer;
+    }
+
+    inline bool isMoore() const { return moore; }
+
+    // neighborCount is the number of alive cells around the cell, not
+    // counting the cell itself
+    inline uint8_t next(uint8_t state, int neighborCount) const {
+        return table[state * NEIGHBOR_COUNTS + neighborCount];
+    }
+};
@@ -0,0 +1,171 @@
+#include "./_snapshot.hpp"
+
+#include <fcntl.h>
+#include <pybind11/pybind11.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <zlib.h>
+
+#include <cerrno>
+#include <cstdint>
+#include <cstdio>
+#include <cstring>
+#include <stdexcept>
+#include <vector>
+
+namespace py = pybind11;
+
+namespace {
+
+const char MAGIC[8] = {'C', 'A', '3', 'D', 'S', 'N', 'A', 'P'};
+const uint32_t VERSION = 1;
+const uint32_t FLAG_ZLIB = 1;
+const size_t HEADER_SIZE = 8 + 4 + 4 + 4 + 8 + 4 + 4 + 8;
+
+// side^3, or 0 when it does not fit in a size_t
+size_t cellCountFor(uint64_t side) {
+    size_t count = 1;
+    for (int axis = 0; axis < 3; axis++) {
+        if (side != 0 && count > SIZE_MAX / side) {
+            return 0;
+        }
+        count *= side;
+    }
+    return count;
+}
+
+[[noreturn]] void raiseOSError(const std::string& path) {
+    PyErr_SetFromErrnoWithFilename(PyExc_OSError, path.c_str());
+    throw py::error_already_set();
+}
+
+template <typename T>
+void put(std::vector<uint8_t>& bytes, T value) {
+    for (size_t i = 0; i < sizeof(T); i++) {
+        bytes.push_back(static_cast<uint8_t>(value >> (8 * i)));
+    }
+}
+
+template <typename T>
+T get(const uint8_t* bytes) {
+    T value = 0;
+    for (size_t i = 0; i < sizeof(T); i++) {
+        value |= static_cast<T>(bytes[i]) << (8 * i);
+    }
+    return value;
+}
+
+}  // namespace
+
+void writeSnapshot(const std::string& path, const SnapshotHeader& header,
+                   const uint8_t* cells, size_t cellCount) {
+    std::vector<uint8_t> payload;
+    if (header.compressed) {
+        uLongf size = compressBound(cellCount);
+        payload.resize(size);
+        // the fastest level already shrinks mostly empty boards a lot
+        if (compress2(payload.data(), &size, cells, cellCount,
+                      Z_BEST_SPEED) != Z_OK) {
+            throw std::runtime_error("could not compress the snapshot");
+        }
+        payload.resize(size);
+    }
+    size_t payloadSize = header.compressed ? payload.size() : cellCount;
+
+    std::vector<uint8_t> bytes(MAGIC, MAGIC + sizeof(MAGIC));
+    put<uint32_t>(bytes, VERSION);
+    put<uint32_t>(bytes, header.compressed ? FLAG_ZLIB : 0);
+    put<uint32_t>(bytes, header.side);
+    put<uint64_t>(bytes, header.generation);
+    put<uint32_t>(bytes, header.ruleName.size());
+    put<uint32_t>(bytes, header.ruleFormat.size());
+    put<uint64_t>(bytes, payloadSize);
+    bytes.insert(bytes.end(), header.ruleName.begin(), header.ruleName.end());
+    bytes.insert(bytes.end(), header.ruleFormat.begin(),
+                 header.ruleFormat.end());
+
+    FILE* file = std::fopen(path.c_str(), "wb");
+    if (!file) {
+        raiseOSError(path);
+    }
+    const uint8_t* data = header.compressed ? payload.data() : cells;
+    bool written =
+        std::fwrite(bytes.data(), 1, bytes.size(), file) == bytes.size() &&
+        std::fwrite(data, 1, payloadSize, file) == payloadSize;
+    if (std::fclose(file) != 0 || !written) {
+        raiseOSError(path);
+    }
+}
+
+MappedSnapshot::MappedSnapshot(const std::string& path)
+    : mData(nullptr), mSize(0), mPayload(nullptr), mPayloadSize(0) {
+    int fd = open(path.c_str(), O_RDONLY);
+    if (fd < 0) {
+        raiseOSError(path);
+    }
+    struct stat info;
+    if (fstat(fd, &info) != 0) {
+        int error = errno;
+        close(fd);
+        errno = error;
+        raiseOSError(path);
+    }
+    mSize = info.st_size;
+    if (mSize < HEADER_SIZE) {
+        close(fd);
+        throw std::invalid_argument(path + " is not a board snapshot");
+    }
+    void* data = mmap(nullptr, mSize, PROT_READ, MAP_PRIVATE, fd, 0);
+    int error = errno;
+    close(fd);
+    if (data == MAP_FAILED) {
+        errno = error;
+        raiseOSError(path);
+    }
+    mData = static_cast<const uint8_t*>(data);
+
+    const uint8_t* bytes = mData;
+    if (std::memcmp(bytes, MAGIC, sizeof(MAGIC)) != 0) {
+        munmap(data, mSize);
+        throw std::invalid_argument(path + " is not a board snapshot");
+    }
+    uint32_t version = get<uint32_t>(bytes + 8);
+    uint32_t flags = get<uint32_t>(bytes + 12);
+    mHeader.side = get<uint32_t>(bytes + 16);
+    mHeader.generation = get<uint64_t>(bytes + 20);
+    uint64_t nameSize = get<uint32_t>(bytes + 28);
+    uint64_t formatSize = get<uint32_t>(bytes + 32);
+    mPayloadSize = get<uint64_t>(bytes + 36);
+    mHeader.compressed = flags & FLAG_ZLIB;
+    // a side of 0 or one whose cells cannot be counted is never saved
+    if (version != VERSION || cellCountFor(mHeader.side) == 0 ||
+        mPayloadSize > mSize ||
+        HEADER_SIZE + nameSize + formatSize + mPayloadSize != mSize) {
+        munmap(data, mSize);
+        throw std::invalid_argument(path + " is not a valid board snapshot");
+    }
+    const char* strings = reinterpret_cast<const char*>(bytes + HEADER_SIZE);
+    mHeader.ruleName.assign(strings, nameSize);
+    mHeader.ruleFormat.assign(strings + nameSize, formatSize);
+    mPayload = bytes + HEADER_SIZE + nameSize + formatSize;
+}
+
+MappedSnapshot::~MappedSnapshot() {
+    munmap(const_cast<uint8_t*>(mData), mSize);
+}
+
+void MappedSnapshot::readCells(uint8_t* cells, size_t cellCount) const {
+    if (!mHeader.compressed) {
+        if (mPayloadSize != cellCount) {
+            throw std::invalid_argument("the snapshot has the wrong size");
+        }
+        std::memcpy(cells, mPayload, cellCount);
+        return;
+    }
+    uLongf size = cellCount;
+    if (uncompress(cells, &size, mPayload, mPayloadSize) != Z_OK ||
+        size != cellCount) {
+        throw std::invalid_argument("the snapshot payload is corrupt");
+    }
+}
@@ -0,0 +1,54 @@
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+
+// A board saved to disk: a fixed header, the rule name and format, then the
+// cell states in index order (x + side * (y + side * z)), one byte per
+// cell, either as they are or zlib compressed. All integers are little
+// endian.
+//
+//   char[8]  magic "CA3DSNAP"
+//   uint32   version
+//   uint32   flags, bit 0 set when the payload is zlib compressed
+//   uint32   side
+//   uint64   generation
+//   uint32   length of the rule name
+//   uint32   length of the rule format
+//   uint64   length of the payload
+//   ...      rule name, rule format, payload
+struct SnapshotHeader {
+    uint32_t side = 0;
+    uint64_t generation = 0;
+    std::string ruleName;
+    std::string ruleFormat;
+    bool compressed = true;
+};
+
+// Raises OSError when the file cannot be written.
+void writeSnapshot(const std::string& path, const SnapshotHeader& header,
+                   const uint8_t* cells, size_t cellCount);
+
+// A snapshot file mapped into memory, so loading reads the payload straight
+// from the page cache instead of copying the file first. Throws
+// std::invalid_argument for files that are not snapshots and raises
+// OSError when the file cannot be opened.
+class MappedSnapshot {
+ public:
+    explicit MappedSnapshot(const std::string& path);
+    ~MappedSnapshot();
+    MappedSnapshot(const MappedSnapshot&) = delete;
+    MappedSnapshot& operator=(const MappedSnapshot&) = delete;
+
+    inline const SnapshotHeader& getHeader() const { return mHeader; }
+    // Fills cells with the side^3 states of the snapshot.
+    void readCells(uint8_t* cells, size_t cellCount) const;
+
+ private:
+    SnapshotHeader mHeader;
+    const uint8_t* mData;
+    size_t mSize;
+    const uint8_t* mPayload;
+    size_t mPayloadSize;
+};
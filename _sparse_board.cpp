@@ -0,0 +1,329 @@
+#include "./_sparse_board.hpp"
+
+#include <algorithm>
+#include <cmath>
+#include <stdexcept>
+
+#include "./_mesh.hpp"
+
+namespace py = pybind11;
+using namespace pybind11::literals;
+
+namespace {
+
+const int COORD_BITS = 21;
+const int64_t COORD_BIAS = int64_t(1) << (COORD_BITS - 1);
+const uint64_t COORD_MASK = (uint64_t(1) << COORD_BITS) - 1;
+
+const int mooreOffsets[26][3] = {
+    {1, -1, -1}, {1, -1, 0},  {1, -1, 1},  {1, 0, -1},  {1, 0, 0},
+    {1, 0, 1},   {1, 1, -1},  {1, 1, 0},   {1, 1, 1},   {-1, -1, -1},
+    {-1, -1, 0}, {-1, -1, 1}, {-1, 0, -1}, {-1, 0, 0},  {-1, 0, 1},
+    {-1, 1, -1}, {-1, 1, 0},  {-1, 1, 1},  {0, -1, -1}, {0, -1, 0},
+    {0, -1, 1},  {0, 1, -1},  {0, 1, 0},   {0, 1, 1},   {0, 0, 1},
+    {0, 0, -1}};
+
+const int vnOffsets[6][3] = {{1, 0, 0},  {-1, 0, 0}, {0, 1, 0},
+                             {0, -1, 0}, {0, 0, 1},  {0, 0, -1}};
+
+bool inRange(int64_t value) {
+    return value >= -COORD_BIAS && value < COORD_BIAS;
+}
+
+}  // namespace
+
+SparseBoard::SparseBoard(int side, py::object rule, bool bounded)
+    : mSide(side),
+      mBounded(bounded),
+      mGeneration(0),
+      mMeshDirty(false),
+      mRule(rule) {
+    mRuleBuffer = RuleBuffer::fromRule(rule);
+}
+
+uint64_t SparseBoard::toKey(int64_t x, int64_t y, int64_t z) const {
+    return (static_cast<uint64_t>(x + COORD_BIAS) & COORD_MASK) |
+           (static_cast<uint64_t>(y + COORD_BIAS) & COORD_MASK)
+               << COORD_BITS |
+           (static_cast<uint64_t>(z + COORD_BIAS) & COORD_MASK)
+               << (2 * COORD_BITS);
+}
+
+void SparseBoard::fromKey(uint64_t key, int64_t coordinate[3]) const {
+    for (int axis = 0; axis < 3; axis++) {
+        coordinate[axis] =
+            static_cast<int64_t>((key >> (axis * COORD_BITS)) & COORD_MASK) -
+            COORD_BIAS;
+    }
+}
+
+int64_t SparseBoard::wrap(int64_t value) const {
+    return ((value % mSide) + mSide) % mSide;
+}
+
+void SparseBoard::update() { step(1, true); }
+
+void SparseBoard::step(size_t generations, bool remesh) {
+    std::lock_guard<std::mutex> lock(mStateMutex);
+    for (size_t i = 0; i < generations; i++) {
+        advance();
+    }
+    if (generations > 0) {
+        mMeshDirty = true;
+    }
+    if (remesh) {
+        ensureMesh();
+    }
+}
+
+void SparseBoard::ensureMesh() {
+    if (mMeshDirty) {
+        calculateMeshes();
+    }
+}
+
+void SparseBoard::tryEnsureMesh() {
+    // a step running on another thread publishes its own mesh
+    std::unique_lock<std::mutex> lock(mStateMutex, std::try_to_lock);
+    if (lock.owns_lock()) {
+        ensureMesh();
+    }
+}
+
+void SparseBoard::advance() {
+    const int(*offsets)[3] = mRuleBuffer.isMoore() ? mooreOffsets : vnOffsets;
+    int offsetCount = mRuleBuffer.isMoore() ? 26 : 6;
+
+    // every alive cell adds one to each of its neighbors
+    CellMap neighborCounts;
+    neighborCounts.reserve(mCells.size() * offsetCount);
+    for (const auto& cell : mCells) {
+        if (cell.second != 1) {
+            continue;
+        }
+        int64_t coordinate[3];
+        fromKey(cell.first, coordinate);
+        for (int i = 0; i < offsetCount; i++) {
+            int64_t x = coordinate[0] + offsets[i][0];
+            int64_t y = coordinate[1] + offsets[i][1];
+            int64_t z = coordinate[2] + offsets[i][2];
+            if (mBounded) {
+                x = wrap(x);
+                y = wrap(y);
+                z = wrap(z);
+            } else if (!inRange(x) || !inRange(y) || !inRange(z)) {
+                continue;
+            }
+            neighborCounts[toKey(x, y, z)]++;
+        }
+    }
+
+    // only cells with a state or an alive neighbor can be non-zero next
+    CellMap next;
+    next.reserve(mCells.size());
+    for (const auto& count : neighborCounts) {
+        auto cell = mCells.find(count.first);
+        int state = cell == mCells.end() ? 0 : cell->second;
+        int nextState = mRuleBuffer.next(state, count.second);
+        if (nextState) {
+            next.emplace(count.first, nextState);
+        }
+    }
+    for (const auto& cell : mCells) {
+        if (neighborCounts.count(cell.first)) {
+            continue;
+        }
+        int nextState = mRuleBuffer.next(cell.second, 0);
+        if (nextState) {
+            next.emplace(cell.first, nextState);
+        }
+    }
+    mCells.swap(next);
+    mGeneration++;
+}
+
+void SparseBoard::render() {
+    tryEnsureMesh();
+    mMesh.draw(mSide);
+}
+
+void SparseBoard::clear() {
+    mMeshDirty = true;
+    mGeneration = 0;
+    CellMap().swap(mCells);
+}
+
+void SparseBoard::setSide(size_t side) {
+    mSide = side;
+    clear();
+    randomise(mRule);
+}
+
+void SparseBoard::setRule(py::object rule) {
+    mRuleBuffer = RuleBuffer::fromRule(rule);
+    mRule = rule;
+    clear();
+    randomise(rule);
+}
+
+int SparseBoard::getCellState(int64_t x, int64_t y, int64_t z) const {
+    if (!inRange(x) || !inRange(y) || !inRange(z)) {
+        return 0;
+    }
+    auto cell = mCells.find(toKey(x, y, z));
+    return cell == mCells.end() ? 0 : cell->second;
+}
+
+void SparseBoard::setCellState(int state, int64_t x, int64_t y, int64_t z) {
+    if (state < 0 || state > UINT8_MAX) {
+        throw std::invalid_argument("cell state must be between 0 and 255");
+    }
+    if (mBounded) {
+        x = wrap(x);
+        y = wrap(y);
+        z = wrap(z);
+    } else if (!inRange(x) || !inRange(y) || !inRange(z)) {
+        throw std::out_of_range("cell coordinate out of range");
+    }
+    if (state == 0) {
+        mCells.erase(toKey(x, y, z));
+    } else {
+        mCells[toKey(x, y, z)] = state;
+    }
+    mMeshDirty = true;
+}
+
+void SparseBoard::requireBounded() const {
+    if (!mBounded) {
+        throw std::logic_error("an unbounded board has no dense cell array");
+    }
+}
+
+py::array SparseBoard::getCells() const {
+    requireBounded();
+    size_t side = mSide;
+    py::array_t<uint8_t, py::array::f_style> cells({side, side, side});
+    std::fill(cells.mutable_data(), cells.mutable_data() + cells.size(), 0);
+    auto view = cells.mutable_unchecked<3>();
+    for (const auto& cell : mCells) {
+        int64_t coordinate[3];
+        fromKey(cell.first, coordinate);
+        view(coordinate[0], coordinate[1], coordinate[2]) = cell.second;
+    }
+    return cells;
+}
+
+void SparseBoard::setCells(py::array cells) {
+    requireBounded();
+    size_t side = mSide;
+    if (cells.ndim() != 3 || static_cast<size_t>(cells.shape(0)) != side ||
+        static_cast<size_t>(cells.shape(1)) != side ||
+        static_cast<size_t>(cells.shape(2)) != side) {
+        throw std::invalid_argument("cells must have shape (side, side, side)");
+    }
+    auto states = py::array_t<int64_t, py::array::forcecast>(cells);
+    auto view = states.unchecked<3>();
+    CellMap next;
+    for (size_t x = 0; x < side; x++) {
+        for (size_t y = 0; y < side; y++) {
+            for (size_t z = 0; z < side; z++) {
+                int64_t state = view(x, y, z);
+                if (state < 0 || state > UINT8_MAX) {
+                    throw std::invalid_argument(
+                        "cell state must be between 0 and 255");
+                }
+                if (state) {
+                    next.emplace(toKey(x, y, z), state);
+                }
+            }
+        }
+    }
+    mCells.swap(next);
+    mMeshDirty = true;
+}
+
+void SparseBoard::randomise(float radius, float density) {
+    float side = mSide;
+    float low = side / 2 - radius * side / 2;
+    float high = side / 2 + radius * side / 2;
+    int64_t begin = std::max<int64_t>(0, std::floor(low) + 1);
+    int64_t end = std::min<int64_t>(mSide, std::ceil(high));
+    for (int64_t z = begin; z < end; z++) {
+        for (int64_t y = begin; y < end; y++) {
+            for (int64_t x = begin; x < end; x++) {
+                if ((rand() % 100) / 100.0f < density) {
+                    mCells[toKey(x, y, z)] = 1;
+                }
+            }
+        }
+    }
+    mMeshDirty = true;
+}
+
+void SparseBoard::randomise(py::object rule) {
+    float density = rule.attr("initial_density").cast<float>();
+    float radius = rule.attr("initial_radius").cast<float>();
+    randomise(radius, density);
+}
+
+py::dict SparseBoard::getMemoryReport() const {
+    // a node of std::unordered_map holds the value, a next pointer and the
+    // cached hash
+    size_t nodeSize = sizeof(CellMap::value_type) + 2 * sizeof(void*);
+    size_t cells =
+        mCells.size() * nodeSize + mCells.bucket_count() * sizeof(void*);
+    size_t vertexBuffer = mMesh.capacityBytes();
+    return py::dict("cells"_a = cells, "vertex_buffer"_a = vertexBuffer,
+                    "total"_a = cells + vertexBuffer);
+}
+
+// Emits one quad for every face between a cell and an empty neighbor. The
+// faces are not merged, which keeps the cost proportional to the
+// population. Like Board, bounded boards close their faces at the border.
+void SparseBoard::calculateMeshes() {
+    std::vector<float>& vertices = mMesh.back();
+    vertices.clear();
+    size_t quadCount = 0;
+    for (const auto& cell : mCells) {
+        int64_t coordinate[3];
+        fromKey(cell.first, coordinate);
+        for (int d = 0; d < 3; d++) {
+            int u = (d + 1) % 3;
+            int v = (d + 2) % 3;
+            for (int step = -1; step <= 1; step += 2) {
+                int64_t neighbor[3] = {coordinate[0], coordinate[1],
+                                       coordinate[2]};
+                neighbor[d] += step;
+                bool outside = mBounded ? neighbor[d] < 0 ||
+                                              neighbor[d] >= mSide
+                                        : !inRange(neighbor[d]);
+                if (!outside && mCells.count(toKey(neighbor[0], neighbor[1],
+                                                   neighbor[2]))) {
+                    continue;
+                }
+
+                int tl[3] = {static_cast<int>(coordinate[0]),
+                             static_cast<int>(coordinate[1]),
+                             static_cast<int>(coordinate[2])};
+                tl[d] += step > 0;
+                int tr[3] = {tl[0], tl[1], tl[2]};
+                tr[u] += 1;
+                int br[3] = {tr[0], tr[1], tr[2]};
+                br[v] += 1;
+                int bl[3] = {tl[0], tl[1], tl[2]};
+                bl[v] += 1;
+
+                bool isBackFace = tl[d] & 1;
+                int* positions[4] = {bl, br, tr, tl};
+                if (isBackFace) {
+                    std::swap(positions[1], positions[3]);
+                }
+                appendQuad(vertices, positions, faceFor(d, isBackFace), mSide,
+                           cell.second);
+                quadCount++;
+            }
+        }
+    }
+    mMesh.publish(quadCount);
+    mMeshDirty = false;
+}
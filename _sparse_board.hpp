@@ -0,0 +1,79 @@
+#pragma once
+
+#include <pybind11/numpy.h>
+#include <pybind11/pybind11.h>
+
+#include <cstdint>
+#include <mutex>
+#include <unordered_map>
+#include <vector>
+
+#include "./_mesh.hpp"
+#include "./_rule.hpp"
+
+// A board that only stores cells with a non-zero state in a hash map, so
+// updating and meshing cost grows with the population instead of the
+// volume. Bounded boards wrap around a torus of mSide cells exactly like
+// Board; unbounded boards let patterns grow in every direction and only use
+// mSide to place randomised cells and to center the mesh.
+class SparseBoard {
+ public:
+    SparseBoard(int side, pybind11::object rule, bool bounded = true);
+    void update();
+    void step(size_t generations, bool remesh);
+    void randomise(float radius, float density);
+    void randomise(pybind11::object rule);
+    void render();
+    void clear();
+    void setRule(pybind11::object rule);
+    void setSide(size_t side);
+    int getCellState(int64_t x, int64_t y, int64_t z) const;
+    void setCellState(int state, int64_t x, int64_t y, int64_t z);
+    // Bounded boards only. The cells live in a hash map, so this is always
+    // a dense copy.
+    pybind11::array getCells() const;
+    void setCells(pybind11::array cells);
+    pybind11::dict getMemoryReport() const;
+    inline pybind11::object getRule() const { return mRule; }
+    inline const RuleBuffer& getRuleBuffer() const { return mRuleBuffer; }
+    inline size_t getQuadCount() {
+        tryEnsureMesh();
+        return mMesh.getQuadCount();
+    }
+    // (vertex count, FLOATS_PER_VERTEX) float32, see MeshBuffer::frontArray
+    inline pybind11::array getVertexBuffer() {
+        tryEnsureMesh();
+        return mMesh.frontArray(FLOATS_PER_VERTEX);
+    }
+    inline uint64_t getMeshVersion() const { return mMesh.getVersion(); }
+    inline size_t getGeneration() const { return mGeneration; }
+    inline size_t getSide() const { return mSide; }
+    inline bool isBounded() const { return mBounded; }
+    inline size_t getPopulation() const { return mCells.size(); }
+
+ private:
+    using CellMap = std::unordered_map<uint64_t, uint8_t>;
+
+ private:
+    void advance();
+    void ensureMesh();
+    void tryEnsureMesh();
+    void calculateMeshes();
+    uint64_t toKey(int64_t x, int64_t y, int64_t z) const;
+    void fromKey(uint64_t key, int64_t coordinate[3]) const;
+    int64_t wrap(int64_t value) const;
+    void requireBounded() const;
+
+ private:
+    int mSide;
+    bool mBounded;
+    size_t mGeneration;
+    bool mMeshDirty;
+    MeshBuffer<float> mMesh;
+    // held while stepping so that render() can tell a step is running on
+    // another thread and keep drawing the last published mesh
+    std::mutex mStateMutex;
+    pybind11::object mRule;
+    RuleBuffer mRuleBuffer;
+    CellMap mCells;
+};
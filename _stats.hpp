@@ -0,0 +1,71 @@
+#pragma once
+
+#include <pybind11/pybind11.h>
+
+#include <algorithm>
+#include <array>
+#include <chrono>
+#include <cstdint>
+
+// A counter of one phase: the total and count of all samples, the last
+// sample and the average of the last WINDOW samples.
+class PhaseCounter {
+ public:
+    static constexpr size_t WINDOW = 60;
+
+    void add(uint64_t value) {
+        size_t slot = mCount % WINDOW;
+        mWindowSum += value - mWindow[slot];
+        mWindow[slot] = value;
+        mTotal += value;
+        mLast = value;
+        mCount++;
+    }
+
+    double average() const {
+        size_t samples = std::min<size_t>(mCount, WINDOW);
+        return samples ? static_cast<double>(mWindowSum) / samples : 0.0;
+    }
+
+    pybind11::dict toDict() const {
+        using namespace pybind11::literals;
+        return pybind11::dict("last"_a = mLast, "average"_a = average(),
+                              "total"_a = mTotal, "count"_a = mCount);
+    }
+
+ private:
+    std::array<uint64_t, WINDOW> mWindow{};
+    uint64_t mWindowSum = 0;
+    uint64_t mTotal = 0;
+    uint64_t mLast = 0;
+    uint64_t mCount = 0;
+};
+
+// What the phases of a board cost. Update counters get one sample per
+// generation, mesh counters one per mesh build and render counters one per
+// render call.
+struct BoardStats {
+    PhaseCounter updateNs;
+    PhaseCounter cellsChanged;
+    PhaseCounter meshNs;
+    PhaseCounter quads;
+    PhaseCounter renderNs;
+    PhaseCounter bytesUploaded;
+
+    pybind11::dict toDict() const {
+        using namespace pybind11::literals;
+        return pybind11::dict(
+            "update_ns"_a = updateNs.toDict(),
+            "cells_changed"_a = cellsChanged.toDict(),
+            "mesh_ns"_a = meshNs.toDict(), "quads"_a = quads.toDict(),
+            "render_ns"_a = renderNs.toDict(),
+            "bytes_uploaded"_a = bytesUploaded.toDict());
+    }
+
+    // nanoseconds of the monotonic clock since start
+    static uint64_t elapsedNs(std::chrono::steady_clock::time_point start) {
+        return std::chrono::duration_cast<std::chrono::nanoseconds>(
+                   std::chrono::steady_clock::now() - start)
+            .count();
+    }
+};
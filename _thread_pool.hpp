@@ -0,0 +1,177 @@
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <cstdint>
+#include <deque>
+#include <functional>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <utility>
+#include <vector>
+
+// A fixed set of worker threads that split a range of work items into
+// chunks. Every thread owns a queue of chunks and steals from the others
+// when its own queue runs dry. The calling thread takes part as worker 0,
+// so a pool of one thread runs everything inline.
+class ThreadPool {
+ public:
+    using Task = std::function<void(size_t begin, size_t end)>;
+
+    explicit ThreadPool(size_t threadCount = defaultThreadCount())
+        : mTask(nullptr), mPending(0), mEpoch(0), mStopping(false) {
+        start(threadCount);
+    }
+
+    ~ThreadPool() { stop(); }
+
+    ThreadPool(const ThreadPool&) = delete;
+    ThreadPool& operator=(const ThreadPool&) = delete;
+
+    static size_t defaultThreadCount() {
+        return std::max(1u, std::thread::hardware_concurrency());
+    }
+
+    inline size_t getThreadCount() const { return mQueues.size(); }
+
+    void setThreadCount(size_t threadCount) {
+        if (threadCount == 0) {
+            threadCount = defaultThreadCount();
+        }
+        if (threadCount == getThreadCount()) {
+            return;
+        }
+        stop();
+        start(threadCount);
+    }
+
+    // Runs task(begin, end) over [first, last) in chunks of grain items and
+    // blocks until every chunk has finished. Must not be called re-entrantly
+    // from inside a task.
+    void parallelFor(size_t first, size_t last, size_t grain, const Task& task) {
+        if (first >= last) {
+            return;
+        }
+        grain = std::max<size_t>(grain, 1);
+        size_t chunkCount = (last - first + grain - 1) / grain;
+        if (chunkCount == 1 || mQueues.size() == 1) {
+            for (size_t begin = first; begin < last; begin += grain) {
+                task(begin, std::min(begin + grain, last));
+            }
+            return;
+        }
+
+        std::unique_lock<std::mutex> lock(mMutex);
+        mTask = &task;
+        mPending = chunkCount;
+        // hand out contiguous runs of chunks so that neighbouring items
+        // usually stay on the same thread
+        size_t perQueue = (chunkCount + mQueues.size() - 1) / mQueues.size();
+        for (size_t chunk = 0; chunk < chunkCount; chunk++) {
+            size_t begin = first + chunk * grain;
+            Queue& queue = *mQueues[chunk / perQueue];
+            std::lock_guard<std::mutex> queueLock(queue.mutex);
+            queue.ranges.emplace_back(begin, std::min(begin + grain, last));
+        }
+        mEpoch++;
+        lock.unlock();
+        mWake.notify_all();
+
+        while (runOne(0)) {
+        }
+        lock.lock();
+        mDone.wait(lock, [this] { return mPending == 0; });
+        mTask = nullptr;
+    }
+
+ private:
+    struct Queue {
+        std::mutex mutex;
+        std::deque<std::pair<size_t, size_t>> ranges;
+    };
+
+    void start(size_t threadCount) {
+        mStopping = false;
+        mQueues.clear();
+        for (size_t id = 0; id < threadCount; id++) {
+            mQueues.emplace_back(new Queue());
+        }
+        for (size_t id = 1; id < threadCount; id++) {
+            mWorkers.emplace_back(&ThreadPool::workerLoop, this, id);
+        }
+    }
+
+    void stop() {
+        {
+            std::lock_guard<std::mutex> lock(mMutex);
+            mStopping = true;
+        }
+        mWake.notify_all();
+        for (auto& worker : mWorkers) {
+            worker.join();
+        }
+        mWorkers.clear();
+    }
+
+    void workerLoop(size_t id) {
+        uint64_t seenEpoch = 0;
+        while (true) {
+            {
+                std::unique_lock<std::mutex> lock(mMutex);
+                mWake.wait(lock, [&] {
+                    return mStopping || mEpoch != seenEpoch;
+                });
+                if (mStopping) {
+                    return;
+                }
+                seenEpoch = mEpoch;
+            }
+            while (runOne(id)) {
+            }
+        }
+    }
+
+    // Pops a chunk from the front of our own queue, or steals one from the
+    // back of another queue, and runs it. Returns false when no work is left.
+    bool runOne(size_t id) {
+        std::pair<size_t, size_t> range;
+        bool found = false;
+        for (size_t i = 0; i < mQueues.size() && !found; i++) {
+            Queue& queue = *mQueues[(id + i) % mQueues.size()];
+            std::lock_guard<std::mutex> queueLock(queue.mutex);
+            if (queue.ranges.empty()) {
+                continue;
+            }
+            if (i == 0) {
+                range = queue.ranges.front();
+                queue.ranges.pop_front();
+            } else {
+                range = queue.ranges.back();
+                queue.ranges.pop_back();
+            }
+            found = true;
+        }
+        if (!found) {
+            return false;
+        }
+        (*mTask)(range.first, range.second);
+        if (--mPending == 0) {
+            std::lock_guard<std::mutex> lock(mMutex);
+            mDone.notify_all();
+        }
+        return true;
+    }
+
+ private:
+    std::vector<std::unique_ptr<Queue>> mQueues;
+    std::vector<std::thread> mWorkers;
+    std::mutex mMutex;
+    std::condition_variable mWake;
+    std::condition_variable mDone;
+    const Task* mTask;
+    std::atomic<size_t> mPending;
+    uint64_t mEpoch;
+    bool mStopping;
+};
@@ -4,18 +4,21 @@
 layout(location = 0) in vec3 a_Position;
 layout(location = 1) in vec2 a_UV;
 layout(location = 2) in vec3 a_Normal;
-layout(location = 3) in vec4 a_Color;
+layout(location = 3) in float a_State;
 
 out vec2 v_UV;
 out vec4 v_Color;
 
 uniform mat4 u_ViewProjection;
 uniform mat4 u_Transform;
+// one column per cell state, one row per axis: z, x, y
+uniform sampler2D u_Palette;
 
 void main()
 {
     v_UV = a_UV;
-    v_Color = a_Color;
+    int axis = int(dot(abs(a_Normal), vec3(1.0, 2.0, 0.0)));
+    v_Color = texelFetch(u_Palette, ivec2(int(a_State), axis), 0);
     gl_Position = u_ViewProjection * u_Transform * vec4(a_Position, 1.0);
 }
 #endif
@@ -0,0 +1,50 @@
+// Vertex Shader
+//--------------------------------------------------
+#ifdef VERTEX_SHADER
+// x: position (10 bits per axis) and quad corner (2 bits)
+// y: face (bits 0-2) and cell state (bits 8-15)
+layout(location = 0) in uvec2 a_Packed;
+
+out vec2 v_UV;
+out vec4 v_Color;
+
+uniform mat4 u_ViewProjection;
+uniform mat4 u_Transform;
+// one column per cell state, one row per axis: z, x, y
+uniform sampler2D u_Palette;
+
+const vec2 c_CornerUVs[4] = vec2[4](
+    vec2(0.0, 0.0), vec2(1.0, 0.0), vec2(1.0, 1.0), vec2(0.0, 1.0)
+);
+
+void main()
+{
+    uvec3 position = uvec3(a_Packed.x, a_Packed.x >> 10, a_Packed.x >> 20)
+        & 1023u;
+    uint corner = a_Packed.x >> 30;
+    // faces come in pairs per axis, in the order of Face in _mesh.hpp
+    uint axis = (a_Packed.y & 7u) >> 1;
+    uint state = (a_Packed.y >> 8) & 255u;
+    v_UV = c_CornerUVs[corner];
+    v_Color = texelFetch(u_Palette, ivec2(state, axis), 0);
+    gl_Position = u_ViewProjection * u_Transform * vec4(vec3(position), 1.0);
+}
+#endif
+//--------------------------------------------------
+
+// Fragment Shader
+//--------------------------------------------------
+#ifdef FRAGMENT_SHADER
+in vec2 v_UV;
+in vec4 v_Color;
+
+out vec4 color;
+
+uniform sampler2D u_Texture;
+
+void main()
+{
+    color = texture(u_Texture, v_UV) * v_Color;
+}
+#endif
+//--------------------------------------------------
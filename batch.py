@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Sweeps rules x sides x seeds without a window. Every job runs one board
+# for a number of generations in a worker process and becomes one JSON line
+# in the output file:
+#
+#   ./batch.py --rules Amoeba Cloud --sides 32 64 --seeds 0 1 2 \
+#       --generations 500 --output sweep.jsonl
+#
+# Jobs already in the output file are skipped, so an interrupted sweep picks
+# up where it stopped when run again with the same arguments. Only the
+# native board is used, nothing imports OpenGL or imgui.
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import argparse
+import json
+import os
+import time
+import numpy as np
+from board import create_board
+from rule import Rule, load_rules
+
+# a run has exploded once this share of the volume is populated
+EXPLOSION_SHARE = 0.5
+
+JobKey = Tuple[str, int, int, int]
+
+
+# The cells Board.randomise would start from, but drawn from a seeded
+# generator so that every job can be repeated.
+def initial_cells(side: int, rule: Rule, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    coordinate = np.arange(side)
+    low = side / 2 - rule.initial_radius * side / 2
+    high = side / 2 + rule.initial_radius * side / 2
+    inside = (coordinate > low) & (coordinate < high)
+    cube = (inside[:, None, None] & inside[None, :, None]
+            & inside[None, None, :])
+    alive = rng.random((side, side, side)) < rule.initial_density
+    return (cube & alive).astype(np.uint8)
+
+
+def population(board) -> int:
+    if hasattr(board, "get_population"):
+        return board.get_population()
+    return int(np.count_nonzero(board.cells))
+
+
+def run_job(rule: Rule, side: int, seed: int, generations: int,
+            board_threads=1) -> Dict:
+    board = create_board(side, rule)
+    if hasattr(board, "set_thread_count"):
+        board.set_thread_count(board_threads)
+    board.set_cells(initial_cells(side, rule, seed))
+    explosion_population = EXPLOSION_SHARE * side ** 3
+    extinct_generation: Optional[int] = None
+    explosion_generation: Optional[int] = None
+    # only the steps are timed, not the population count after each
+    elapsed = 0.0
+    generation = 0
+    while generation < generations:
+        start = time.perf_counter()
+        board.step(1, remesh=False)
+        elapsed += time.perf_counter() - start
+        generation += 1
+        count = population(board)
+        if explosion_generation is None and count >= explosion_population:
+            explosion_generation = generation
+        # nothing can come back from an empty board
+        if count == 0:
+            extinct_generation = generation
+            break
+    return {
+        "rule": rule.name,
+        "side": side,
+        "seed": seed,
+        "generations": generations,
+        "engine": type(board).__name__,
+        "population": population(board),
+        "steps_per_second": generation / elapsed if elapsed else None,
+        "extinct_generation": extinct_generation,
+        "explosion_generation": explosion_generation,
+    }
+
+
+def job_key(result: Dict) -> JobKey:
+    return (result["rule"], result["side"], result["seed"],
+            result["generations"])
+
+
+def finished_jobs(path: str) -> Set[JobKey]:
+    if not os.path.exists(path):
+        return set()
+    finished = set()
+    with open(path) as results:
+        for line in results:
+            # a line cut short by an interrupted run is simply redone
+            try:
+                finished.add(job_key(json.loads(line)))
+            except (ValueError, KeyError):
+                pass
+    return finished
+
+
+def run_sweep(rules: List[Rule], sides: Iterable[int], seeds: Iterable[int],
+              generations: int, output: str, workers: Optional[int] = None,
+              board_threads=1) -> int:
+    finished = finished_jobs(output)
+    jobs = [(rule, side, seed) for rule in rules for side in sides
+            for seed in seeds
+            if (rule.name, side, seed, generations) not in finished]
+    if not jobs:
+        return 0
+    with ProcessPoolExecutor(workers) as executor, \
+            open(output, "a+") as results:
+        # new results start on a line of their own after a line cut short
+        if results.tell():
+            results.seek(results.tell() - 1)
+            if results.read(1) != "\n":
+                results.write("\n")
+        futures = [executor.submit(run_job, rule, side, seed, generations,
+                                   board_threads)
+                   for rule, side, seed in jobs]
+        for future in as_completed(futures):
+            results.write(json.dumps(future.result()) + "\n")
+            # every finished job survives an interruption
+            results.flush()
+    return len(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", nargs="*",
+                        help="rule names from rules.json, all by default")
+    parser.add_argument("--sides", nargs="+", type=int, default=[64])
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0])
+    parser.add_argument("--generations", type=int, default=100)
+    parser.add_argument("--output", default="batch.jsonl")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes, one per core by default")
+    parser.add_argument("--board-threads", type=int, default=1,
+                        help="threads each board updates with")
+    args = parser.parse_args()
+
+    rules = load_rules()
+    if args.rules:
+        names = {rule.name for rule in rules}
+        unknown = [name for name in args.rules if name not in names]
+        if unknown:
+            raise SystemExit(f"no rules named {unknown} in rules.json")
+        rules = [rule for rule in rules if rule.name in args.rules]
+    count = run_sweep(rules, args.sides, args.seeds, args.generations,
+                      args.output, args.workers, args.board_threads)
+    print(f"{count} jobs run, results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# Times the board operations for every rule in rules.json over a range of
+# sides:
+#
+#   update     one Board.update, a generation and its remesh
+#   step       one generation without a remesh
+#   remesh     rebuilding the mesh after one step (the chunks it changed)
+#   mesh       meshing a whole board from scratch (get_quad_count)
+#   randomise  Board.randomise on a cleared board
+#   set_side   Board.set_side, which clears and randomises
+#
+# Each (rule, side) case runs in a fresh process, so its peak RSS is its own.
+# Results hold the median and 95th percentile seconds and the cells handled
+# per second for every operation. With --compare, the medians are checked
+# against an earlier results file and the script fails when one of them got
+# slower by more than --threshold:
+#
+#   ./benchmarks/operations.py --output baseline.json
+#   ./benchmarks/operations.py --compare baseline.json
+from typing import Callable, Dict, List
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_runs(repeat: int, prepare: Callable[[], None],
+              operation: Callable[[], None]) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        prepare()
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def case_child(rule_name: str, side: int, repeat: int):
+    import numpy as np
+    from _board import Board
+    from rule import load_rules
+
+    rule = next(rule for rule in load_rules() if rule.name == rule_name)
+    board = Board(side, rule)
+    board.randomise(rule.initial_radius, rule.initial_density)
+    board.get_quad_count()
+    nothing = lambda: None
+    step = lambda: board.step(1, remesh=False)
+    times = {"update": time_runs(repeat, nothing, board.update),
+             "step": time_runs(repeat, nothing, step),
+             "remesh": time_runs(repeat, step, board.get_quad_count)}
+
+    cells = board.get_cells(copy=True)
+    fresh_board = []
+
+    def new_board():
+        fresh_board[:] = [Board(side, rule)]
+        fresh_board[0].set_cells(cells)
+
+    times["mesh"] = time_runs(repeat, new_board,
+                              lambda: fresh_board[0].get_quad_count())
+    times["randomise"] = time_runs(
+        repeat, board.clear,
+        lambda: board.randomise(rule.initial_radius, rule.initial_density))
+    times["set_side"] = time_runs(repeat, nothing,
+                                  lambda: board.set_side(side))
+
+    operations = {}
+    for name, values in times.items():
+        median = float(np.median(values))
+        operations[name] = {
+            "median": median,
+            "p95": float(np.percentile(values, 95)),
+            "cells_per_second": side ** 3 / median if median else None,
+        }
+    # kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({"rule": rule_name, "side": side, "peak_rss": peak_rss,
+                      "operations": operations}))
+
+
+def run_case(rule_name: str, side: int, repeat: int) -> Dict:
+    command = [sys.executable, os.path.abspath(__file__), "--case-child",
+               rule_name, str(side), "--repeat", str(repeat)]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run(command, cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+# The operations whose median time grew by more than threshold (0.1 is 10%)
+# since the baseline, as (rule, side, operation, baseline, current) seconds.
+# Cases missing from either side are ignored.
+def find_regressions(baseline: Dict, current: Dict, threshold: float):
+    baseline_cases = {(case["rule"], case["side"]): case
+                      for case in baseline["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        old = baseline_cases.get((case["rule"], case["side"]))
+        if not old:
+            continue
+        for name, values in case["operations"].items():
+            if name not in old["operations"]:
+                continue
+            before = old["operations"][name]["median"]
+            after = values["median"]
+            if after > before * (1 + threshold):
+                regressions.append(
+                    (case["rule"], case["side"], name, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", nargs="*",
+                        help="rule names from rules.json, all by default")
+    parser.add_argument("--sides", nargs="+", type=int,
+                        default=[32, 64, 128, 256])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="flag regressions against this results file")
+    parser.add_argument("--results",
+                        help="compare this results file instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slow down of the median that counts as a "
+                             "regression, 0.1 is 10%%")
+    parser.add_argument("--case-child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case_child:
+        os.chdir(ROOT)
+        sys.path.insert(0, ROOT)
+        case_child(args.case_child[0], int(args.case_child[1]), args.repeat)
+        return
+
+    if args.results:
+        with open(args.results) as file:
+            result = json.load(file)
+    else:
+        sys.path.insert(0, ROOT)
+        from rule import load_rules
+        rule_names = args.rules or [rule.name for rule in
+                                    load_rules(os.path.join(ROOT,
+                                                            "rules.json"))]
+        cases = []
+        for side in args.sides:
+            for rule_name in rule_names:
+                case = run_case(rule_name, side, args.repeat)
+                cases.append(case)
+                update = case["operations"]["update"]
+                print(f"{rule_name:20} {side:4} "
+                      f"update {update['median'] * 1000:8.2f} ms "
+                      f"{update['cells_per_second'] / 1e6:8.1f} Mcells/s "
+                      f"peak {case['peak_rss'] / 2 ** 20:7.1f} MiB")
+        result = {"repeat": args.repeat, "cases": cases}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = find_regressions(baseline, result, args.threshold)
+        for rule_name, side, name, before, after in regressions:
+            print(f"REGRESSION {rule_name} side {side} {name}: "
+                  f"{before * 1000:.2f} ms -> {after * 1000:.2f} ms "
+                  f"({after / before - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions over {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Measures how long the application takes from launch to its first frame.
+#
+# The window mode starts celluar_automata_3d.py with --frames 1 and needs a
+# display. The headless mode goes through the same startup work (imports,
+# shaders, renderer, the first board and its first render) on an offscreen
+# EGL context, so it also runs on machines without one. Each run is a fresh
+# process, so imports and shader compilation are paid every time. "process"
+# is the wall time of the whole child process; the phases are measured from
+# the start of its script.
+from typing import Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def headless_child():
+    start = time.perf_counter()
+    phases: Dict[str, float] = {}
+
+    def mark(name: str):
+        phases[name] = time.perf_counter() - start
+
+    import glm
+    import moderngl
+    import engine.gl as gl
+    from engine.camera import Camera
+    from engine.renderer import Renderer
+    from engine.shader import Shader
+    from board import create_board
+    from rule import load_rules
+    mark("imports")
+
+    gl.ctx = moderngl.create_context(standalone=True, backend="egl")
+    framebuffer = gl.ctx.simple_framebuffer((1600, 900))
+    framebuffer.use()
+    gl.ctx.enable(moderngl.DEPTH_TEST)
+    mark("context")
+
+    Shader.init()
+    mark("shaders")
+    Renderer.init()
+    mark("renderer")
+
+    rule = load_rules()[0]
+    board = create_board(70, rule)
+    board.randomise(rule.initial_radius, rule.initial_density)
+    mark("board")
+
+    camera = Camera(aspect=1600 / 900)
+    camera.position = glm.vec3(0, 0, 140)
+    camera.focus(glm.vec3(0))
+    Renderer.begin_scene(camera=camera)
+    board.render()
+    Renderer.end_scene()
+    gl.ctx.finish()
+    mark("first_frame")
+    print(json.dumps(phases))
+
+
+def run_once(mode: str) -> Dict[str, float]:
+    if mode == "window":
+        command = [sys.executable, "celluar_automata_3d.py", "--frames", "1",
+                   "--report-startup"]
+    else:
+        command = [sys.executable, os.path.abspath(__file__),
+                   "--headless-child"]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    output = subprocess.run(command, cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    result = {"process": time.perf_counter() - start}
+    for line in output.splitlines():
+        if mode == "window" and line.startswith("first_frame_time"):
+            result["first_frame"] = float(line.split()[1])
+        elif mode == "headless" and line.startswith("{"):
+            result.update(json.loads(line))
+    return result
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for name in runs[0]:
+        values = [run[name] for run in runs]
+        summary[name] = {"median": statistics.median(values),
+                         "min": min(values), "max": max(values)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=("auto", "window", "headless"),
+                        default="auto")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--headless-child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.headless_child:
+        os.chdir(ROOT)
+        sys.path.insert(0, ROOT)
+        headless_child()
+        return
+
+    mode = args.mode
+    if mode == "auto":
+        has_display = os.environ.get("DISPLAY") or \
+            os.environ.get("WAYLAND_DISPLAY")
+        mode = "window" if has_display else "headless"
+    runs = [run_once(mode) for _ in range(args.repeat)]
+    result = {"mode": mode, "repeat": args.repeat,
+              "summary": summarize(runs), "runs": runs}
+    for name, values in result["summary"].items():
+        print(f"{name:12} {values['median'] * 1000:8.1f} ms after launch")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+from typing import Optional, Union
+from _board import Board, SparseBoard
+from rule import Rule
+
+ENGINES = ("dense", "sparse", "auto")
+# rules with engine "auto" use the sparse board when they are expected to
+# start with fewer alive cells than this share of the volume
+SPARSE_POPULATION_THRESHOLD = 0.01
+
+
+def expected_population(rule: Rule) -> float:
+    return rule.initial_density * rule.initial_radius ** 3
+
+
+def choose_engine(rule: Rule, engine: Optional[str] = None) -> str:
+    engine = engine or rule.engine
+    if engine not in ENGINES:
+        raise ValueError(f"unknown board engine: {engine}")
+    if engine == "auto":
+        sparse = expected_population(rule) < SPARSE_POPULATION_THRESHOLD
+        engine = "sparse" if sparse else "dense"
+    return engine
+
+
+def create_board(
+    side: int, rule: Rule, engine: Optional[str] = None
+) -> Union[Board, SparseBoard]:
+    if choose_engine(rule, engine) == "sparse":
+        return SparseBoard(side, rule)
+    return Board(side, rule)
@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
-from typing import List
+from typing import List, Optional
+import argparse
 import glfw
 import imgui
-import time
-import json
 from moderngl import CULL_FACE
-from rule import Rule
+from rule import Rule, load_rules
 from engine.application import Application
 from engine.event import Event
 from engine.free_control import FreeControl
@@ -15,6 +14,9 @@ from engine.event import EventType
 from engine.input import is_key_pressed
 import engine.gl as gl
 from _board import Board
+from board import choose_engine, create_board
+from recording import Replay
+from simulation import Simulation
 
 
 class CelluarAutomata3D(Application):
@@ -23,64 +25,110 @@ class CelluarAutomata3D(Application):
         self.free_control = FreeControl()
         self.orbit_control = OrbitControl(100)
         self.camera_control = self.orbit_control
-        self.rules: List[Rule] = []
-        with open("./rules.json") as jsonfile:
-            rules = json.load(jsonfile)
-            for rule in rules:
-                self.rules.append(
-                    Rule(
-                        rule["name"],
-                        rule["format"],
-                        rule["initial_density"],
-                        rule["initial_radius"],
-                    )
-                )
+        self.rules: List[Rule] = load_rules()
         self.rule_index = 0
-        self.board = Board(70, self.rules[self.rule_index])
-        self.paused = True
-        self.evolve_period = 0.05
-        self.last_board_update_time = time.time()
-        self.randomise_radius = self.board.get_rule().initial_radius
-        self.randomise_density = self.board.get_rule().initial_density
-        self.board.randomise(self.randomise_radius, self.randomise_density)
+        self.snapshot_path = "snapshot.ca3d"
+        self.recording_path = "recording.ca3r"
+        # while a recording is replayed, the live board waits here
+        self.replay: Optional[Replay] = None
+        self.replay_index = 0
+        self.replay_error: Optional[str] = None
+        self.live_board = None
+        board = create_board(70, self.rules[self.rule_index])
+        self.fast_forward_steps = 100
+        self.packed_vertices = True
+        # the LOD mesh is only used while orbiting the board from outside
+        self.lod = True
+        if isinstance(board, Board):
+            board.set_packed_vertices(self.packed_vertices)
+            board.set_lod(self.lod_active)
+        self.randomise_radius = board.get_rule().initial_radius
+        self.randomise_density = board.get_rule().initial_density
+        board.randomise(self.randomise_radius, self.randomise_density)
+        self.simulation = Simulation(board, evolve_period=0.05)
+        self.shown_rule = self.simulation.status["rule"]
         gl.ctx.disable(CULL_FACE)
 
+    @property
+    def board(self):
+        return self.simulation.board
+
+    @property
+    def lod_active(self):
+        return self.lod and self.camera_control == self.orbit_control
+
+    @property
+    def paused(self):
+        return self.simulation.paused
+
     def on_update(self, delta_time: float):
         if is_key_pressed(glfw.KEY_ESCAPE):
             self.running = False
         self.camera_control.on_update(delta_time)
-
-        curr_time = time.time()
-        dt = curr_time - self.last_board_update_time
-        if not self.paused and dt > self.evolve_period:
-            self.board.update()
-            Renderer.clear_vertex_buffer()
-            self.last_board_update_time = time.time()
+        self.simulation.update()
 
     def on_event(self, event: Event):
         self.camera_control.on_event(event)
+        if event.type == EventType.KeyPressedEvent and self.replay:
+            # holding the key keeps scrubbing
+            if event.key == glfw.KEY_RIGHT:
+                self.seek_replay(self.replay_index + 1)
+            if event.key == glfw.KEY_LEFT:
+                self.seek_replay(self.replay_index - 1)
         if event.type == EventType.KeyPressedEvent:
             if not event.repeated:
                 if event.key == glfw.KEY_SPACE:
-                    self.paused = not self.paused
+                    self.simulation.toggle_pause()
                 if self.paused and event.key == glfw.KEY_F:
-                    self.board.update()
+                    self.simulation.step()
+                if event.key == glfw.KEY_G:
+                    self.simulation.step(self.fast_forward_steps)
                 if event.key == glfw.KEY_R:
-                    Renderer.clear_vertex_buffer()
-                    self.board.randomise(self.randomise_radius, self.randomise_density)
+                    self.simulation.randomise(
+                        self.randomise_radius, self.randomise_density
+                    )
                 if event.key == glfw.KEY_E:
-                    Renderer.clear_vertex_buffer()
-                    self.board.clear()
+                    self.simulation.clear()
                 if event.key == glfw.KEY_C:
                     self.camera_control = (
                         self.orbit_control
                         if self.camera_control == self.free_control
                         else self.free_control
                     )
+                    if isinstance(self.board, Board):
+                        self.simulation.set_lod(self.lod_active)
                 if event.key == glfw.KEY_Q or event.key == glfw.KEY_ESCAPE:
                     self.running = False
-                if self.paused and event.key == glfw.KEY_RIGHT:
-                    self.board.update()
+                if (self.paused and not self.replay
+                        and event.key == glfw.KEY_RIGHT):
+                    self.simulation.step()
+
+    def start_replay(self):
+        try:
+            replay = Replay(self.recording_path)
+        except (OSError, ValueError) as error:
+            self.replay_error = str(error)
+            return
+        self.replay_error = None
+        board = Board(replay.side, Rule(replay.rule_name, replay.rule_format))
+        board.set_packed_vertices(self.packed_vertices)
+        board.set_lod(self.lod_active)
+        if not self.paused:
+            self.simulation.toggle_pause()
+        self.simulation.stop_recording()
+        self.live_board = self.board
+        self.replay = replay
+        self.simulation.set_board(board)
+        self.seek_replay(0)
+
+    def seek_replay(self, index: int):
+        self.replay_index = max(0, min(index, self.replay.frame_count - 1))
+        self.simulation.show_frame(self.replay, self.replay_index)
+
+    def stop_replay(self):
+        self.simulation.set_board(self.live_board)
+        self.live_board = None
+        self.replay = None
 
     def on_ready(self):
         imgui.new_frame()
@@ -90,6 +138,7 @@ class CelluarAutomata3D(Application):
         imgui.render()
 
     def on_render(self):
+        Renderer.set_state_count(self.board.get_rule().max_state)
         Renderer.begin_scene(camera=self.camera_control.camera)
         self.board.render()
         Renderer.end_scene()
@@ -108,6 +157,7 @@ class CelluarAutomata3D(Application):
                 imgui.bullet_text("E: erase all cells")
                 imgui.bullet_text("Spacebar: pause/continue simulation")
                 imgui.bullet_text("F: update one step forward")
+                imgui.bullet_text("G: fast forward by the fast forward steps")
                 imgui.bullet_text("Q/Esc: quit the application")
                 imgui.bullet_text("Different rules can be selected in Rules section")
                 imgui.bullet_text("You can add your own rules to rules.json file")
@@ -140,50 +190,170 @@ class CelluarAutomata3D(Application):
             expanded, _ = imgui.collapsing_header("Status", flags=flags)
             if expanded:
                 imgui.text(f"FPS: {self.fps:.1f}")
-                imgui.text(f"Quad Count: {self.board.get_quad_count()}")
+                status = self.simulation.status
+                drawn = Renderer.stats
+                imgui.text(
+                    f"Quad Count: {self.board.get_quad_count()}"
+                    f" (drawn {drawn['drawn_quads']},"
+                    f" culled chunks {drawn['culled_chunks']})"
+                )
+                if drawn["lod_chunks"]:
+                    imgui.text(f"LOD Chunks: {drawn['lod_chunks']}")
+                if "active_chunks" in status:
+                    imgui.text(
+                        f"Active Chunks: {status['active_chunks']}"
+                        f" / {status['chunks']}"
+                    )
+                else:
+                    imgui.text(f"Population: {status['population']}")
+                memory = status["memory"]
+                imgui.text(f"Board Memory: {memory / 2 ** 20:.1f} MiB")
+                imgui.text(f"Generation: {status['generation']}")
                 imgui.text(f"Paused: {self.paused}")
+                if self.simulation.error:
+                    imgui.text(f"Error: {self.simulation.error}")
+                if isinstance(self.board, Board):
+                    draw_phase_stats(self.board.stats())
+                    if imgui.button("Reset Stats"):
+                        self.board.reset_stats()
+
+        # averages over the last samples of each phase
+        def draw_phase_stats(stats):
+            def average(name):
+                return stats[name]["average"]
+
+            imgui.text(
+                f"Update: {average('update_ns') / 1e6:.2f} ms,"
+                f" {average('cells_changed'):.0f} cells changed"
+            )
+            imgui.text(
+                f"Mesh: {average('mesh_ns') / 1e6:.2f} ms,"
+                f" {average('quads'):.0f} quads"
+            )
+            imgui.text(
+                f"Render: {average('render_ns') / 1e6:.2f} ms,"
+                f" {average('bytes_uploaded') / 2 ** 10:.0f} KiB uploaded"
+            )
 
         def draw_rules():
             expanded, _ = imgui.collapsing_header("Rules", flags=flags)
             if expanded:
                 rule_names = [rule.name for rule in self.rules]
+                # a loaded snapshot can bring its own rule
+                rule_name = self.simulation.status["rule"]
+                if rule_name != self.shown_rule:
+                    self.shown_rule = rule_name
+                    if rule_name in rule_names:
+                        self.rule_index = rule_names.index(rule_name)
                 clicked, self.rule_index = imgui.listbox(
                     "##listbox_rules", self.rule_index, rule_names
                 )
                 if clicked:
-                    Renderer.clear_vertex_buffer()
                     selected_rule = self.rules[self.rule_index]
-                    self.board.set_rule(selected_rule)
+                    is_dense = isinstance(self.board, Board)
+                    if is_dense == (choose_engine(selected_rule) == "dense"):
+                        self.simulation.set_rule(selected_rule)
+                    else:
+                        board = create_board(
+                            self.simulation.status["side"], selected_rule
+                        )
+                        board.randomise(
+                            selected_rule.initial_radius,
+                            selected_rule.initial_density,
+                        )
+                        if isinstance(board, Board):
+                            board.set_packed_vertices(self.packed_vertices)
+                            board.set_lod(self.lod_active)
+                        self.simulation.set_board(board)
                     self.randomise_radius = selected_rule.initial_radius
                     self.randomise_density = selected_rule.initial_density
 
+                if isinstance(self.board, Board):
+                    _, self.snapshot_path = imgui.input_text(
+                        "snapshot", self.snapshot_path, 256
+                    )
+                    if imgui.button("Save"):
+                        self.simulation.save(self.snapshot_path)
+                    imgui.same_line()
+                    if imgui.button("Load"):
+                        self.simulation.load(self.snapshot_path)
+                    if self.simulation.snapshot_error:
+                        imgui.text(self.simulation.snapshot_error)
+
+        def draw_recording():
+            expanded, _ = imgui.collapsing_header("Recording", flags=flags)
+            if not expanded or not isinstance(self.board, Board):
+                return
+            _, self.recording_path = imgui.input_text(
+                "recording", self.recording_path, 256
+            )
+            if self.replay:
+                frame_count = self.replay.frame_count
+                changed, value = imgui.slider_int(
+                    "frame", self.replay_index, 0, frame_count - 1
+                )
+                if changed:
+                    self.seek_replay(value)
+                if imgui.button("<"):
+                    self.seek_replay(self.replay_index - 1)
+                imgui.same_line()
+                if imgui.button(">"):
+                    self.seek_replay(self.replay_index + 1)
+                imgui.same_line()
+                if imgui.button("Exit Replay"):
+                    self.stop_replay()
+                return
+            recorded_frames = self.simulation.status.get("recorded_frames")
+            if recorded_frames is None:
+                if imgui.button("Record"):
+                    self.simulation.start_recording(self.recording_path)
+            else:
+                if imgui.button("Stop"):
+                    self.simulation.stop_recording()
+                imgui.same_line()
+                imgui.text(f"Recorded Frames: {recorded_frames}")
+            if imgui.button("Replay"):
+                self.start_replay()
+            if self.replay_error:
+                imgui.text(self.replay_error)
+
         def draw_settings():
             expanded, _ = imgui.collapsing_header("Settings", flags=flags)
             if expanded:
                 changed = False
                 changed, value = imgui.drag_float(
                     "evolve seconds",
-                    value=self.evolve_period,
+                    value=self.simulation.evolve_period,
                     change_speed=0.01,
                     min_value=0.01,
                     max_value=5.0,
                     format="%.2f",
                 )
                 if changed:
-                    self.evolve_period = value
+                    self.simulation.evolve_period = value
+
+                changed = False
+                changed, value = imgui.drag_int(
+                    "fast forward steps",
+                    value=self.fast_forward_steps,
+                    change_speed=1,
+                    min_value=1,
+                    max_value=10000,
+                )
+                if changed:
+                    self.fast_forward_steps = value
 
                 changed = False
                 changed, value = imgui.drag_int(
                     "border side",
-                    value=self.board.get_side(),
+                    value=self.simulation.status["side"],
                     change_speed=1,
                     min_value=5,
-                    max_value=200,
+                    max_value=512,
                     format="%.2f",
                 )
                 if changed:
-                    Renderer.clear_vertex_buffer()
-                    self.board.set_side(value)
+                    self.simulation.set_side(value)
                     self.orbit_control.radius = value * 2
 
                 changed = False
@@ -210,14 +380,66 @@ class CelluarAutomata3D(Application):
                 if changed:
                     self.randomise_density = value
 
+                changed, value = imgui.checkbox(
+                    "background simulation", self.simulation.threaded
+                )
+                if changed:
+                    self.simulation.set_threaded(value)
+
+                if isinstance(self.board, Board):
+                    changed, value = imgui.checkbox(
+                        "packed vertices", self.packed_vertices
+                    )
+                    if changed:
+                        self.packed_vertices = value
+                        self.simulation.set_packed_vertices(value)
+
+                    changed, value = imgui.checkbox(
+                        "cull hidden chunks", Renderer.cull_chunks
+                    )
+                    if changed:
+                        Renderer.cull_chunks = value
+
+                    changed, value = imgui.checkbox(
+                        "distance LOD in orbit mode", self.lod
+                    )
+                    if changed:
+                        self.lod = value
+                        self.simulation.set_lod(self.lod_active)
+
+                    changed, value = imgui.drag_float(
+                        "LOD distance",
+                        value=Renderer.lod_distance,
+                        change_speed=1.0,
+                        min_value=10.0,
+                        max_value=1000.0,
+                        format="%.0f",
+                    )
+                    if changed:
+                        Renderer.lod_distance = value
+
         imgui.begin("Control Panel")
         draw_help()
         draw_status()
         draw_settings()
         draw_rules()
+        draw_recording()
         imgui.end()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--frames", type=int, help="quit after this many frames"
+    )
+    parser.add_argument(
+        "--report-startup",
+        action="store_true",
+        help="print the seconds until the first frame was rendered",
+    )
+    args = parser.parse_args()
     app = CelluarAutomata3D()
-    app.run()
+    app.run(max_frames=args.frames)
+    app.simulation.stop()
+    if args.report_startup:
+        print(f"first_frame_time {app.first_frame_time:.6f}")
@@ -1,26 +1,39 @@
 from typing import Optional
+import time
 import moderngl as mgl
-import glfw
 from engine.event import Event
+from engine.headless import FrameOutput, HeadlessWindow
 from engine.renderer import Renderer
 from engine.shader import Shader
-from engine.window import Window
 import engine.gl as gl
-import imgui.core as imgui
-from imgui.integrations.glfw import GlfwRenderer
 
 
 class Application:
     window = None
 
-    def __init__(self, window_size=(1600, 900), window_title="Application"):
+    # A headless application renders offscreen without input or GUI, for
+    # example to stream frames through frame_output. It does not need glfw
+    # or imgui to be installed.
+    def __init__(self, window_size=(1600, 900), window_title="Application",
+                 headless=False):
+        self.start_time = time.perf_counter()
+        # seconds from the start of __init__ until the GPU finished the
+        # first frame
+        self.first_frame_time: Optional[float] = None
+        self.headless = headless
         if Application.window == None:
-           Application.window = Window(window_size[0], window_size[1],
-                                       window_title)
+            if headless:
+                window_class = HeadlessWindow
+            else:
+                from engine.window import Window
+                window_class = Window
+            Application.window = window_class(window_size[0], window_size[1],
+                                              window_title)
         window = Application.window
         window.event_callback = self._check_events
         self.running = True
         self.fps = 0.0
+        self.frame_output: Optional[FrameOutput] = None
         gl.ctx.enable(flags=mgl.DEPTH_TEST | mgl.CULL_FACE)
         Shader.init()
         Renderer.init()
@@ -40,14 +53,14 @@ class Application:
     def on_ready(self):
         pass
 
-    def run(self):
+    def run(self, max_frames: Optional[int] = None):
         self.on_ready()
-        prev_time = glfw.get_time()
-        prev_frame_time = glfw.get_time()
+        prev_time = time.perf_counter()
+        prev_frame_time = prev_time
         frame_count = 0
         while self.running:
             frame_count += 1
-            curr_time = glfw.get_time()
+            curr_time = time.perf_counter()
             elapsed_time = curr_time - prev_frame_time
             duration = curr_time - prev_time
             if duration > 0.5:
@@ -56,7 +69,17 @@ class Application:
                 frame_count = 0
             self._update(elapsed_time)
             self._render()
+            if self.frame_output:
+                # only starts the readback, the next update overlaps it
+                self.frame_output.capture(gl.ctx.fbo)
             prev_frame_time = curr_time
+            if self.first_frame_time is None:
+                gl.ctx.finish()
+                self.first_frame_time = time.perf_counter() - self.start_time
+            if max_frames is not None:
+                max_frames -= 1
+                if max_frames <= 0:
+                    self.running = False
 
     def _shutdown(self):
         Shader.shutdown()
@@ -69,6 +92,9 @@ class Application:
         self.on_update(delta_time)
 
     def _render_gui(self):
+        if self.headless:
+            return
+        import imgui.core as imgui
         imgui.new_frame()
         self.on_render_gui()
         imgui.render()
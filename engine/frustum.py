@@ -0,0 +1,24 @@
+import glm
+import numpy as np
+
+
+# The six planes (left, right, bottom, top, near, far) of the view frustum
+# of a view projection matrix, as rows of (a, b, c, d) whose positive side
+# is inside.
+def frustum_planes(view_proj_matrix: glm.mat4) -> np.ndarray:
+    rows = np.array(view_proj_matrix, dtype=np.float64)
+    planes = np.array([rows[3] + rows[0], rows[3] - rows[0],
+                       rows[3] + rows[1], rows[3] - rows[1],
+                       rows[3] + rows[2], rows[3] - rows[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+# Whether each axis aligned box, given by its center and half extents, is
+# at least partly inside the frustum. A box is only rejected when it is
+# fully behind one plane, so a few boxes near the corners of the frustum
+# are kept although they are not visible.
+def boxes_in_frustum(planes: np.ndarray, centers: np.ndarray,
+                     half_extents: np.ndarray) -> np.ndarray:
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    radii = half_extents @ np.abs(planes[:, :3]).T
+    return np.all(distances + radii >= 0, axis=1)
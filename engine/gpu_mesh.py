@@ -0,0 +1,125 @@
+from typing import Optional
+import numpy as np
+from moderngl import Buffer, Program, VertexArray
+import engine.gl as gl
+
+
+# An index buffer that draws every four vertices as a quad of two
+# triangles. It grows to the largest mesh drawn so far instead of being
+# sized up front.
+class QuadIndexBuffer:
+    MIN_QUADS = 1024
+
+    def __init__(self):
+        self.buffer: Optional[Buffer] = None
+        self.quad_capacity = 0
+
+    def reserve(self, quad_count: int) -> Buffer:
+        if self.buffer is None or quad_count > self.quad_capacity:
+            capacity = max(quad_count, self.quad_capacity * 2, self.MIN_QUADS)
+            corners = np.array([0, 1, 2, 2, 3, 0], dtype="int32")
+            starts = np.arange(0, capacity * 4, 4, dtype="int32")
+            indices = starts[:, None] + corners
+            if self.buffer:
+                self.buffer.release()
+            self.buffer = gl.ctx.buffer(indices)
+            self.quad_capacity = capacity
+        return self.buffer
+
+    def release(self):
+        if self.buffer:
+            self.buffer.release()
+        self.buffer = None
+        self.quad_capacity = 0
+
+
+# A board mesh kept in one GPU buffer between frames and drawn with a single
+# call. The vertices are only uploaded when a different mesh or a newer
+# version of it is drawn, so frames where the board did not change only
+# issue the draw call. The buffer grows with the mesh and is orphaned before
+# every upload, so writing a new mesh never waits for draws of the old one.
+class GpuMesh:
+    def __init__(self, program: Program, layout: dict,
+                 quad_indices: QuadIndexBuffer, quad_size: int):
+        self.program = program
+        self.layout = layout
+        self.quad_indices = quad_indices
+        # bytes per quad
+        self.quad_size = quad_size
+        self.mesh_id: Optional[int] = None
+        self.version: Optional[int] = None
+        self.quad_count = 0
+        self.upload_count = 0
+        self.bytes_uploaded = 0
+        self._buffer: Optional[Buffer] = None
+        self._index_buffer: Optional[Buffer] = None
+        self._vertex_array: Optional[VertexArray] = None
+
+    @property
+    def capacity(self) -> int:
+        return self._buffer.size if self._buffer else 0
+
+    def upload(self, mesh_id: int, version: int, vertices) -> bool:
+        if mesh_id == self.mesh_id and version == self.version:
+            return False
+        data = memoryview(vertices).cast("B")
+        self.quad_count = data.nbytes // self.quad_size
+        if data.nbytes > self.capacity:
+            self._grow(data.nbytes)
+        elif data.nbytes:
+            self._buffer.orphan()
+        if data.nbytes:
+            self._buffer.write(data)
+        self.mesh_id = mesh_id
+        self.version = version
+        self.upload_count += 1
+        self.bytes_uploaded += data.nbytes
+        return True
+
+    # Draws every quad, or only the runs of quads given as arrays of first
+    # quads and quad counts, one draw call per run.
+    def draw(self, firsts=None, counts=None) -> int:
+        if not self.quad_count:
+            return 0
+        # the index buffer is shared, another mesh may have grown it
+        self._bind(self.quad_indices.reserve(self.quad_count))
+        if firsts is None:
+            self._vertex_array.render(vertices=self.quad_count * 6)
+            return self.quad_count
+        for first, count in zip(firsts.tolist(), counts.tolist()):
+            self._vertex_array.render(vertices=count * 6, first=first * 6)
+        return int(counts.sum())
+
+    def release(self):
+        if self._vertex_array:
+            self._vertex_array.release()
+        if self._buffer:
+            self._buffer.release()
+        self._vertex_array = None
+        self._buffer = None
+        self._index_buffer = None
+        self.mesh_id = None
+        self.version = None
+        self.quad_count = 0
+
+    def _grow(self, size: int):
+        # leave room so a slowly growing mesh does not reallocate every time
+        size = max(size, self.capacity * 3 // 2)
+        if self._vertex_array:
+            self._vertex_array.release()
+            self._vertex_array = None
+        if self._buffer:
+            self._buffer.release()
+        self._buffer = gl.ctx.buffer(reserve=size, dynamic=True)
+
+    def _bind(self, index_buffer: Buffer):
+        if self._vertex_array and self._index_buffer is index_buffer:
+            return
+        if self._vertex_array:
+            self._vertex_array.release()
+        self._vertex_array = gl.ctx.vertex_array(
+            self.program,
+            [(self._buffer, self.layout["format"], *self.layout["attributes"])],
+            index_buffer=index_buffer,
+            skip_errors=True)
+        self._index_buffer = index_buffer
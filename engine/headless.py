@@ -0,0 +1,133 @@
+from typing import BinaryIO, Callable, List, Optional
+import queue
+import threading
+import time
+import moderngl as mgl
+import numpy as np
+from moderngl import Buffer, Framebuffer
+from PIL import Image
+import engine.gl as gl
+from engine.event import Event
+
+
+# Takes the place of Window on machines without a display: a standalone EGL
+# context (Mesa llvmpipe works) that renders into an offscreen framebuffer.
+# There is no input and no GUI.
+class HeadlessWindow:
+    def __init__(self, width=1200, height=720, title="Title"):
+        self._width = width
+        self._height = height
+        self.title = title
+        self.event_callback: Callable[[Event], None] = lambda event: None
+        self.window = None
+        gl.ctx = mgl.create_context(standalone=True, backend="egl")
+        self.framebuffer = gl.ctx.framebuffer(
+            color_attachments=[gl.ctx.renderbuffer((width, height))],
+            depth_attachment=gl.ctx.depth_renderbuffer((width, height)))
+        self.framebuffer.use()
+
+    def render_gui(self, data):
+        pass
+
+    def on_update(self):
+        pass
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+
+# Streams the frames of a framebuffer to a binary stream, as raw top-down
+# RGB rows or as one PNG after another (ffmpeg reads either from a pipe with
+# -f rawvideo or -f image2pipe). Frames are read into a ring of pixel
+# buffers, so the GPU copies a frame while the next one is simulated and
+# rendered, and a frame is only mapped once the ring comes back to it.
+# Encoding and writing happen on a separate thread.
+class FrameOutput:
+    FORMATS = ("raw", "png")
+
+    def __init__(self, stream: BinaryIO, size, format: str = "raw",
+                 buffer_count: int = 3):
+        if format not in self.FORMATS:
+            raise ValueError(f"unknown frame format {format!r}")
+        self.stream = stream
+        self.size = tuple(size)
+        self.format = format
+        frame_size = self.size[0] * self.size[1] * 3
+        self._buffers: List[Buffer] = [gl.ctx.buffer(reserve=frame_size)
+                                       for _ in range(buffer_count)]
+        self._pending: List[bool] = [False] * buffer_count
+        self._next = 0
+        self.frame_count = 0
+        self._start_time: Optional[float] = None
+        self.elapsed_time = 0.0
+        self._frames: "queue.Queue[Optional[bytes]]" = queue.Queue(
+            maxsize=buffer_count)
+        self._error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_frames,
+                                        daemon=True)
+        self._writer.start()
+
+    @property
+    def fps(self) -> float:
+        if not self.elapsed_time:
+            return 0.0
+        return self.frame_count / self.elapsed_time
+
+    def capture(self, framebuffer: Framebuffer):
+        if self._start_time is None:
+            self._start_time = time.perf_counter()
+        if self._pending[self._next]:
+            self._emit(self._next)
+        framebuffer.read_into(self._buffers[self._next], components=3,
+                              alignment=1)
+        self._pending[self._next] = True
+        self._next = (self._next + 1) % len(self._buffers)
+
+    # writes the frames still in the ring and waits for the writer
+    def close(self):
+        for i in range(len(self._buffers)):
+            slot = (self._next + i) % len(self._buffers)
+            if self._pending[slot]:
+                self._emit(slot)
+        self._frames.put(None)
+        self._writer.join()
+        self.stream.flush()
+        if self._start_time is not None:
+            self.elapsed_time = time.perf_counter() - self._start_time
+        for buffer in self._buffers:
+            buffer.release()
+        self._buffers = []
+        if self._error:
+            raise self._error
+
+    def _emit(self, slot: int):
+        if self._error:
+            raise self._error
+        self._frames.put(self._buffers[slot].read())
+        self._pending[slot] = False
+        self.frame_count += 1
+
+    def _write_frames(self):
+        width, height = self.size
+        while True:
+            data = self._frames.get()
+            if data is None:
+                return
+            if self._error:
+                continue
+            try:
+                # OpenGL rows start at the bottom
+                rows = np.frombuffer(data, np.uint8).reshape(height, width, 3)
+                rows = rows[::-1]
+                if self.format == "png":
+                    Image.fromarray(rows).save(self.stream, "PNG",
+                                               compress_level=1)
+                else:
+                    self.stream.write(rows.tobytes())
+            except BaseException as error:
+                self._error = error
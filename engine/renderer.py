@@ -1,17 +1,19 @@
-from typing import Optional, List, TypedDict, overload, Tuple
+from typing import Dict, Optional, List, TypedDict, overload, Tuple
 import glm
 import numpy as np
-from moderngl import LINE_STRIP, LINES, Program, VertexArray, TextureCube, Buffer
+from moderngl import LINE_STRIP, LINES, NEAREST, Program, VertexArray, Texture, \
+    TextureCube, Buffer
 from engine.camera import Camera
 from engine.geometry import EnvBoxGemoetry
+from engine.frustum import boxes_in_frustum, frustum_planes
+from engine.gpu_mesh import GpuMesh, QuadIndexBuffer
 from engine.model import Model
 from engine.shader import Shader
 from engine.light import DirLight, PointLight
 import engine.gl as gl
-from engine.texture import get_white_texture
+from engine.texture import get_state_palette, get_white_texture
 
 N_MAX_POINT_LIGHTS = 8
-MAX_BUFFER_SIZE = 3600000
 
 
 class Renderer:
@@ -22,14 +24,33 @@ class Renderer:
     dir_light: Optional[DirLight] = None
     shader: Optional[Program] = None
     batch_layout = {
-        "format": "3f 2f 3f 4f",
-        "attributes": ["a_Position", "a_UV", "a_Normal", "a_Color"]
+        "format": "3f 2f 3f 1f",
+        "attributes": ["a_Position", "a_UV", "a_Normal", "a_State"]
+    }
+    # two words per vertex, unpacked by flat_packed.glsl
+    packed_batch_layout = {
+        "format": "2u4",
+        "attributes": ["a_Packed"]
     }
 
     # for batch rendering
-    _vertex_buffer: Optional[Buffer] = None
-    _quad_index_buffer: Optional[Buffer] = None
-    _vertex_array: Optional[VertexArray] = None
+    _quad_indices: Optional[QuadIndexBuffer] = None
+    # board meshes kept on the GPU, one for each vertex format and detail
+    meshes: Dict[str, GpuMesh] = {}
+    # the colors of the cell states, see get_state_palette
+    palette: Optional[Texture] = None
+    state_count = 256
+    # Chunks of a board mesh outside the view are not drawn. Boards with a
+    # LOD mesh draw it for the chunks further than lod_distance away.
+    cull_chunks = True
+    lod_distance = 300.0
+    # what the board meshes of the last frame drew
+    stats = {"drawn_quads": 0, "culled_chunks": 0, "lod_chunks": 0}
+
+    # chunk bounds by (side, chunk size), and which chunks are visible and
+    # far in this frame
+    _chunk_bounds: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+    _chunk_selection: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
 
     @staticmethod
     def init():
@@ -40,26 +61,31 @@ class Renderer:
             skip_errors=True)
 
         self.shader = Shader.flat
-        quad_indices = []
-        offset = 0
-        for i in range(0, MAX_BUFFER_SIZE, 6):
-            quad_indices.append(offset + 0)
-            quad_indices.append(offset + 1)
-            quad_indices.append(offset + 2)
-            quad_indices.append(offset + 2)
-            quad_indices.append(offset + 3)
-            quad_indices.append(offset + 0)
-            offset += 4
-        quad_indices = np.array(quad_indices, dtype="int32")
-        self._quad_index_buffer = gl.ctx.buffer(quad_indices)
-        self._vertex_buffer = gl.ctx.buffer(np.zeros(
-            MAX_BUFFER_SIZE, dtype="float32"), dynamic=True)
-        self._vertex_array = gl.ctx.vertex_array(
-            self.shader,
-            [(self._vertex_buffer, self.batch_layout["format"],
-              *self.batch_layout["attributes"])],
-            index_buffer=self._quad_index_buffer,
-            skip_errors=True)
+        self._quad_indices = QuadIndexBuffer()
+        self.meshes = {
+            "flat": GpuMesh(self.shader, self.batch_layout,
+                            self._quad_indices, 4 * 9 * 4),
+            "packed": GpuMesh(Shader.flat_packed, self.packed_batch_layout,
+                              self._quad_indices, 4 * 2 * 4),
+            "flat_lod": GpuMesh(self.shader, self.batch_layout,
+                                self._quad_indices, 4 * 9 * 4),
+            "packed_lod": GpuMesh(Shader.flat_packed,
+                                  self.packed_batch_layout,
+                                  self._quad_indices, 4 * 2 * 4),
+        }
+        self.palette = gl.ctx.texture(
+            (256, 3), 4, get_state_palette(self.state_count))
+        self.palette.filter = (NEAREST, NEAREST)
+        for mesh in self.meshes.values():
+            mesh.program['u_Palette'] = 1
+
+    # Fades the decaying states of rules with this many states.
+    @staticmethod
+    def set_state_count(state_count: int):
+        self = Renderer
+        if state_count != self.state_count:
+            self.state_count = state_count
+            self.palette.write(get_state_palette(state_count))
 
     @staticmethod
     def begin_scene(camera: Camera,
@@ -72,6 +98,13 @@ class Renderer:
         self.env_map = env_map
         self.point_lights = point_lights
         self.dir_light = dir_light
+        self.stats = {"drawn_quads": 0, "culled_chunks": 0, "lod_chunks": 0}
+        self._chunk_selection.clear()
+        # uniforms shared by every board mesh drawn in this frame
+        for mesh in self.meshes.values():
+            mesh.program['u_ViewProjection'].write(camera.view_proj_matrix)
+            if dir_light:
+                self.upload_dir_light(mesh.program)
 
     @staticmethod
     def end_scene():
@@ -87,23 +120,81 @@ class Renderer:
         vao.program['u_Transform'].write(transform)
         vao.render()
 
+    # Draws a board mesh. With chunk_offsets, the first quad of every chunk
+    # plus the quad count, only the chunks in view are drawn, and part
+    # picks the chunks this mesh is for: "all", the "near" ones, or the
+    # "far" ones for a LOD mesh.
     @staticmethod
-    def draw_batch(vertices):
+    def draw_mesh(mesh_id: int, version: int, vertices, side: int,
+                  packed: bool = False, chunk_size: int = 0,
+                  chunk_offsets=None, part: str = "all"):
+        # vertices are only read when the mesh is not on the GPU yet, returns
+        # the bytes uploaded
         self = Renderer
+        name = "packed" if packed else "flat"
+        if part == "far":
+            name += "_lod"
+        mesh = self.meshes[name]
+        uploaded = mesh.bytes_uploaded
+        mesh.upload(mesh_id, version, vertices)
+        uploaded = mesh.bytes_uploaded - uploaded
         get_white_texture().use()
-        vao = self._vertex_array
-        if self.camera:
-            vao.program['u_ViewProjection'].write(self.camera.view_proj_matrix)
-        vao.program['u_Transform'].write(glm.identity(glm.mat4))
-        if self.dir_light:
-            self.upload_dir_light(vao.program)
-        self._vertex_buffer.write(vertices)
-        vao.render()
+        self.palette.use(location=1)
+        transform = glm.identity(glm.mat4)
+        if packed:
+            # packed positions are cell corners, so center them like Board
+            # does for float vertices
+            transform = glm.translate(glm.vec3(-(side / 2 + 0.5)))
+        mesh.program['u_Transform'].write(transform)
+        if chunk_offsets is None or not self.camera:
+            self.stats["drawn_quads"] += mesh.draw()
+            return uploaded
+
+        offsets = np.frombuffer(chunk_offsets, dtype=np.uint32)
+        visible, far = self._select_chunks(side, chunk_size, len(offsets) - 1)
+        if part == "far":
+            selected = visible & far
+            self.stats["lod_chunks"] += int(np.count_nonzero(selected))
+        else:
+            selected = visible & ~far if part == "near" else visible
+            self.stats["culled_chunks"] += int(np.count_nonzero(~visible))
+        # neighbouring chunks are next to each other in the buffer, so each
+        # run of selected chunks is one draw call
+        edges = np.diff(np.concatenate(([0], selected.view(np.int8), [0])))
+        firsts = offsets[np.flatnonzero(edges == 1)]
+        counts = offsets[np.flatnonzero(edges == -1)] - firsts
+        self.stats["drawn_quads"] += mesh.draw(firsts, counts)
+        return uploaded
 
     @staticmethod
-    def clear_vertex_buffer():
+    def _select_chunks(side: int, chunk_size: int,
+                       chunk_count: int) -> Tuple[np.ndarray, np.ndarray]:
         self = Renderer
-        self._vertex_buffer.clear()
+        key = (side, chunk_size)
+        if key in self._chunk_selection:
+            return self._chunk_selection[key]
+        if key not in self._chunk_bounds:
+            n = -(-side // chunk_size)
+            index = np.arange(n ** 3)
+            lower = np.stack([index % n, index // n % n, index // (n * n)],
+                             axis=1) * chunk_size
+            upper = np.minimum(lower + chunk_size, side)
+            # the same centering as the board mesh
+            centers = (lower + upper) / 2 - (side / 2 + 0.5)
+            self._chunk_bounds[key] = (centers, (upper - lower) / 2)
+        centers, half_extents = self._chunk_bounds[key]
+        assert len(centers) == chunk_count
+
+        if self.cull_chunks:
+            planes = frustum_planes(self.camera.view_proj_matrix)
+            visible = boxes_in_frustum(planes, centers, half_extents)
+        else:
+            visible = np.ones(chunk_count, dtype=bool)
+        distances = np.linalg.norm(
+            centers - np.array(self.camera.position), axis=1)
+        far = distances > self.lod_distance
+        self._chunk_selection[key] = (visible, far)
+        return visible, far
 
     @staticmethod
     def draw_model(model: Model, position: Tuple[float, float, float]) -> None:
@@ -1,58 +1,77 @@
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from moderngl import Program
 import engine.gl as gl
 
+SHADER_DIRECTORY = 'assets/shaders'
+VERSION_HEADING = "#version 330 core\n"
+
 
 class Shader:
     flat: Optional[Program] = None
+    flat_packed: Optional[Program] = None
     phong: Optional[Program] = None
     phong_batch: Optional[Program] = None
     background: Optional[Program] = None
 
+    # Parsed sources by file name and linked programs by context and file
+    # name. moderngl can only build a program from source, so this cannot
+    # reuse driver binaries across launches; drivers with an on-disk shader
+    # cache (Mesa, NVIDIA) already do that for the same sources.
+    _sources: Dict[str, Tuple[str, str]] = {}
+    _programs: Dict[Tuple[int, str], Program] = {}
+
     @staticmethod
     def init():
         self = Shader
         Shader.flat = self.load('flat')
+        Shader.flat_packed = self.load('flat_packed')
         Shader.phong = self.load('phong')
         Shader.background = self.load('background')
 
     @staticmethod
     def shutdown():
         self = Shader
-        if self.flat:
-            self.flat.release()
-        if self.phong:
-            self.phong.release()
-        if self.background:
-            self.background.release()
+        for program in self._programs.values():
+            program.release()
+        self._programs.clear()
+        self.flat = None
+        self.flat_packed = None
+        self.phong = None
+        self.background = None
 
     @staticmethod
     def load(filename: str) -> Program:
+        self = Shader
         if not gl.ctx:
             raise RuntimeError("Application has not create gl context yet!")
-        with open(f'assets/shaders/{filename}.glsl') as file:
-            lines = file.readlines()
-            line_index = 0
-            vertex_source = ""
-            fragment_source = ""
-            while line_index < len(lines):
-                if "VERTEX_SHADER" in lines[line_index]:
-                    line_index += 1
-                    while "endif" not in lines[line_index]:
-                        vertex_source += lines[line_index]
-                        line_index += 1
-                elif "FRAGMENT_SHADER" in lines[line_index]:
-                    line_index += 1
-                    while "endif" not in lines[line_index]:
-                        fragment_source += lines[line_index]
-                        line_index += 1
-                line_index += 1
-
-        version_heading = "#version 330 core\n"
-        vertex_heading = "#define VERTEX_SHADER\n"
-        vertex_shader = version_heading + vertex_heading + vertex_source
-        fragment_heading = "#define FRAGMENT_SHADER\n"
-        fragment_shader = version_heading + fragment_heading + fragment_source
-        program = gl.ctx.program(vertex_shader=vertex_shader,
-                                 fragment_shader=fragment_shader)
-        return program
+        key = (id(gl.ctx), filename)
+        if key not in self._programs:
+            vertex_shader, fragment_shader = self.read_sources(filename)
+            self._programs[key] = gl.ctx.program(
+                vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        return self._programs[key]
+
+    @staticmethod
+    def read_sources(filename: str) -> Tuple[str, str]:
+        self = Shader
+        if filename not in self._sources:
+            with open(f'{SHADER_DIRECTORY}/{filename}.glsl') as file:
+                source = file.read()
+            vertex_source = _section(source, "VERTEX_SHADER")
+            fragment_source = _section(source, "FRAGMENT_SHADER")
+            vertex_heading = "#define VERTEX_SHADER\n"
+            fragment_heading = "#define FRAGMENT_SHADER\n"
+            self._sources[filename] = (
+                VERSION_HEADING + vertex_heading + vertex_source,
+                VERSION_HEADING + fragment_heading + fragment_source)
+        return self._sources[filename]
+
+
+# The lines between the "#ifdef <name>" line and the next "#endif" line.
+def _section(source: str, name: str) -> str:
+    begin = source.find(name)
+    if begin < 0:
+        return ""
+    begin = source.index("\n", begin) + 1
+    end = source.index("endif", begin)
+    return source[begin:source.rindex("\n", begin, end) + 1]
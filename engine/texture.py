@@ -1,5 +1,6 @@
 from typing import Tuple, List
 import glm
+import numpy as np
 import moderngl as mgl
 from moderngl import Texture, TextureCube
 from pathlib import Path
@@ -14,6 +15,21 @@ def get_white_texture():
                                     data=bytearray([255] * 4))
     return self.white
 
+# The colors of the cell states in a board mesh: a (3, 256, 4) RGBA array
+# with a row for the faces along each axis (z, x, y) and a column for each
+# state. Alive cells (state 1) keep the colors of their faces, and the
+# decaying states after it fade towards a quarter of that brightness.
+def get_state_palette(state_count: int) -> np.ndarray:
+    face_colors = np.array([(128, 126, 250), (244, 125, 126),
+                            (117, 236, 125)], dtype=np.float32)
+    states = np.arange(256)
+    fade = np.clip((states - 1) / max(state_count - 1, 1), 0, 1)
+    brightness = 1 - 0.75 * fade
+    palette = np.empty((3, 256, 4), dtype=np.uint8)
+    palette[..., :3] = np.rint(face_colors[:, None] * brightness[:, None])
+    palette[..., 3] = 255
+    return palette
+
 def get_depth_texture(
         scale: float,
         window_size: Tuple[float, float]) -> Texture:
@@ -0,0 +1,203 @@
+from collections import OrderedDict
+from typing import BinaryIO, List, Optional
+import os
+import struct
+import zlib
+import numpy as np
+from _board import Board
+
+# A recording starts with a header (magic, version, side, the lengths of the
+# rule name and format, then the name and format) followed by one frame per
+# recorded generation. Every frame has a small header (kind, generation,
+# payload length) and a zlib compressed payload:
+#   KEYFRAME      all cell states
+#   SPARSE_DELTA  the gaps between the indices of the changed cells as
+#                 uint32, then the XOR of their old and new states
+#   DENSE_DELTA   the XOR of all old and new states
+# XOR deltas work both ways, so a frame can be decoded from the frame before
+# or the frame after it.
+MAGIC = b"CA3DREC\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIII")
+FRAME_HEADER = struct.Struct("<BQQ")
+KEYFRAME, SPARSE_DELTA, DENSE_DELTA = range(3)
+
+
+# Writes the generations of a dense board to a stream as they are recorded.
+# A keyframe is written every keyframe_interval frames, and whenever the
+# generation does not follow the last one (after a clear or a load).
+class Recorder:
+    def __init__(self, stream: BinaryIO, board: Board,
+                 keyframe_interval=64):
+        self.stream = stream
+        self.side = board.get_side()
+        self.keyframe_interval = keyframe_interval
+        self.frame_count = 0
+        self._last: Optional[np.ndarray] = None
+        self._last_generation = -1
+        self._since_keyframe = 0
+        rule = board.get_rule()
+        name = rule.name.encode()
+        format = rule.format.encode()
+        stream.write(HEADER.pack(MAGIC, VERSION, self.side, len(name),
+                                 len(format)) + name + format)
+
+    # Appends the current generation of the board.
+    def record(self, board: Board):
+        if board.get_side() != self.side:
+            raise ValueError("the board side changed while recording")
+        # a view with x fastest, the order of the cell indices
+        cells = board.cells.ravel(order="F")
+        generation = board.get_generation()
+        if (self._last is None or generation != self._last_generation + 1
+                or self._since_keyframe + 1 >= self.keyframe_interval):
+            self._write(KEYFRAME, generation, cells.tobytes())
+            self._since_keyframe = 0
+        else:
+            xor = np.bitwise_xor(cells, self._last)
+            changed = np.flatnonzero(xor)
+            # a sparse delta takes five bytes per changed cell, and small
+            # gaps compress better than the indices themselves
+            if changed.size * 5 < cells.size:
+                gaps = np.diff(changed, prepend=0).astype(np.uint32)
+                payload = gaps.tobytes() + xor[changed].tobytes()
+                self._write(SPARSE_DELTA, generation, payload)
+            else:
+                self._write(DENSE_DELTA, generation, xor.tobytes())
+            self._since_keyframe += 1
+        if self._last is None:
+            self._last = cells.copy()
+        else:
+            np.copyto(self._last, cells)
+        self._last_generation = generation
+        # a replay can open the file while it is still being recorded
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+    def _write(self, kind: int, generation: int, payload: bytes):
+        payload = zlib.compress(payload, 1)
+        self.stream.write(FRAME_HEADER.pack(kind, generation, len(payload)))
+        self.stream.write(payload)
+        self.frame_count += 1
+
+
+# Reads a recording back frame by frame. A frame is decoded from the nearest
+# frame already in the cache or from the keyframe before it, whichever
+# needs fewer deltas, and the last cache_size decoded frames are kept. Going
+# back one frame from a cached frame undoes a single delta, so stepping
+# backwards costs as much as stepping forwards and memory stays bounded by
+# the cache.
+class Replay:
+    def __init__(self, path: str, cache_size=32):
+        self._file = open(path, "rb")
+        self.cache_size = cache_size
+        self.generations: List[int] = []
+        self._kinds: List[int] = []
+        self._offsets: List[int] = []
+        self._sizes: List[int] = []
+        self._cache: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        # a rejected file is closed right away
+        try:
+            magic, version, self.side, name_size, format_size = \
+                HEADER.unpack(self._file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a board recording")
+            self.rule_name = self._file.read(name_size).decode()
+            self.rule_format = self._file.read(format_size).decode()
+            self._index_frames()
+        except Exception:
+            self._file.close()
+            raise
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.generations)
+
+    # the first frame of a generation
+    def index_of(self, generation: int) -> int:
+        return self.generations.index(generation)
+
+    # The cell states of a frame as a read-only (side, side, side) array
+    # indexed [x, y, z], ready for Board.set_cells.
+    def frame(self, index: int) -> np.ndarray:
+        if not 0 <= index < self.frame_count:
+            raise IndexError(f"no frame {index} in the recording")
+        cells = self._cache.get(index)
+        if cells is None:
+            cells = self._decode(index)
+            cells.flags.writeable = False
+            self._cache[index] = cells
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(index)
+        side = self.side
+        return cells.reshape((side, side, side), order="F")
+
+    def close(self):
+        self._file.close()
+        self._cache.clear()
+
+    def _index_frames(self):
+        file_size = os.fstat(self._file.fileno()).st_size
+        while True:
+            header = self._file.read(FRAME_HEADER.size)
+            # a recording cut short keeps its complete frames
+            if len(header) < FRAME_HEADER.size:
+                break
+            kind, generation, size = FRAME_HEADER.unpack(header)
+            offset = self._file.tell()
+            if offset + size > file_size:
+                break
+            self._file.seek(size, os.SEEK_CUR)
+            if not self._kinds and kind != KEYFRAME:
+                raise ValueError("a recording must start with a keyframe")
+            self.generations.append(generation)
+            self._kinds.append(kind)
+            self._offsets.append(offset)
+            self._sizes.append(size)
+
+    def _payload(self, index: int) -> bytes:
+        self._file.seek(self._offsets[index])
+        return zlib.decompress(self._file.read(self._sizes[index]))
+
+    # the frames between index and the keyframes around it
+    def _keyframe_span(self, index: int):
+        first = index
+        while self._kinds[first] != KEYFRAME:
+            first -= 1
+        last = index + 1
+        while last < self.frame_count and self._kinds[last] != KEYFRAME:
+            last += 1
+        return first, last
+
+    def _decode(self, index: int) -> np.ndarray:
+        first, last = self._keyframe_span(index)
+        start, cost = first, index - first + 1
+        for cached in self._cache:
+            if first <= cached < last and abs(cached - index) < cost:
+                start, cost = cached, abs(cached - index)
+        if start == first and first not in self._cache:
+            cells = np.frombuffer(self._payload(first), np.uint8).copy()
+        else:
+            cells = self._cache[start].copy()
+        # deltas after start going forwards, or back down to index + 1
+        if start <= index:
+            deltas = range(start + 1, index + 1)
+        else:
+            deltas = range(start, index, -1)
+        for delta in deltas:
+            self._apply_delta(cells, delta)
+        return cells
+
+    def _apply_delta(self, cells: np.ndarray, index: int):
+        payload = self._payload(index)
+        if self._kinds[index] == DENSE_DELTA:
+            np.bitwise_xor(cells, np.frombuffer(payload, np.uint8), out=cells)
+            return
+        count = len(payload) // 5
+        gaps = np.frombuffer(payload, np.uint32, count)
+        changed = np.cumsum(gaps, dtype=np.int64)
+        xor = np.frombuffer(payload, np.uint8, count, offset=count * 4)
+        cells[changed] ^= xor
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Renders a simulation run offscreen and streams the frames, on machines
+# without a display. It only needs an EGL capable driver (Mesa llvmpipe
+# works), not glfw or imgui. To make a video with ffmpeg:
+#
+#   python3 render_headless.py --rule Amoeba --frames 300 --format raw \
+#       --size 1280x720 --output - | ffmpeg -f rawvideo -pix_fmt rgb24 \
+#       -s 1280x720 -r 30 -i - amoeba.mp4
+from typing import Tuple
+import argparse
+import sys
+import glm
+from board import create_board
+from engine.application import Application
+from engine.camera import Camera
+from engine.headless import FrameOutput
+from engine.renderer import Renderer
+from moderngl import CULL_FACE
+from rule import Rule, load_rules
+import engine.gl as gl
+
+
+class HeadlessRender(Application):
+    def __init__(self, rule: Rule, side: int, size: Tuple[int, int],
+                 steps_per_frame=1, orbit_speed=0.5, packed_vertices=True):
+        super().__init__(window_size=size, window_title="HeadlessRender",
+                         headless=True)
+        self.rule = rule
+        self.board = create_board(side, rule)
+        if hasattr(self.board, "set_packed_vertices"):
+            self.board.set_packed_vertices(packed_vertices)
+        self.board.randomise(rule.initial_radius, rule.initial_density)
+        self.steps_per_frame = steps_per_frame
+        # degrees the camera orbits around the board every frame
+        self.orbit_speed = orbit_speed
+        self.orbit_yaw = 0.0
+        self.radius = side * 2
+        self.camera = Camera(aspect=size[0] / size[1], far=side * 4)
+        self._place_camera()
+        gl.ctx.disable(CULL_FACE)
+
+    def on_update(self, delta_time: float):
+        # the GIL is released while stepping, so frames already read back
+        # are encoded meanwhile
+        self.board.step(self.steps_per_frame, remesh=True)
+        self.orbit_yaw += self.orbit_speed
+        self._place_camera()
+
+    def on_render(self):
+        Renderer.set_state_count(self.rule.max_state)
+        Renderer.begin_scene(camera=self.camera)
+        self.board.render()
+        Renderer.end_scene()
+
+    def _place_camera(self):
+        yaw = glm.radians(self.orbit_yaw)
+        self.camera.position = glm.vec3(glm.sin(yaw), 0.5,
+                                        glm.cos(yaw)) * self.radius
+        self.camera.focus(glm.vec3(0))
+
+
+def load_rule(name: str) -> Rule:
+    for rule in load_rules():
+        if rule.name == name:
+            return rule
+    raise SystemExit(f"no rule named {name!r} in rules.json")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rule", default="Crystal Growth")
+    parser.add_argument("--side", type=int, default=70)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--steps-per-frame", type=int, default=1)
+    parser.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT")
+    parser.add_argument("--format", choices=FrameOutput.FORMATS,
+                        default="png")
+    parser.add_argument("--output", default="-",
+                        help="file or pipe to stream the frames to, - for "
+                             "stdout")
+    parser.add_argument("--buffers", type=int, default=3,
+                        help="pixel buffers frames are read back through")
+    args = parser.parse_args()
+
+    size = tuple(int(value) for value in args.size.split("x"))
+    app = HeadlessRender(load_rule(args.rule), args.side, size,
+                         args.steps_per_frame)
+    stream = sys.stdout.buffer if args.output == "-" \
+        else open(args.output, "wb")
+    app.frame_output = FrameOutput(stream, size, args.format, args.buffers)
+    try:
+        app.run(max_frames=args.frames)
+        app.frame_output.close()
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+    print(f"{app.frame_output.frame_count} frames in "
+          f"{app.frame_output.elapsed_time:.2f} s, "
+          f"{app.frame_output.fps:.1f} fps", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
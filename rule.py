@@ -1,11 +1,21 @@
+from typing import List
+import json
+
+
 class Rule:
     def __init__(
-        self, name: str, format: str, initial_density=1.0, initial_radius=0.1
+        self,
+        name: str,
+        format: str,
+        initial_density=1.0,
+        initial_radius=0.1,
+        engine="dense",
     ) -> None:
         self.name = name
         self.format = format
         self.initial_density = initial_density
         self.initial_radius = initial_radius
+        self.engine = engine
 
         tokens = format.split("/")
         self.survival = self._get_set_from_token(tokens[0])
@@ -25,3 +35,17 @@ class Rule:
             else:
                 result.add(int(value))
         return result
+
+
+def load_rules(path="rules.json") -> List[Rule]:
+    with open(path) as jsonfile:
+        return [
+            Rule(
+                rule["name"],
+                rule["format"],
+                rule["initial_density"],
+                rule["initial_radius"],
+                rule.get("engine", "dense"),
+            )
+            for rule in json.load(jsonfile)
+        ]
@@ -0,0 +1,201 @@
+from typing import Callable, Optional, Union
+import queue
+import threading
+import time
+from _board import Board, SparseBoard
+from recording import Recorder, Replay
+
+AnyBoard = Union[Board, SparseBoard]
+Command = Callable[[], None]
+
+
+# Advances a board either inline from the frame loop or on a producer
+# thread. In threaded mode every change to the board is queued as a command
+# and run on the producer thread between generations, so the render loop
+# only draws the last mesh the board published and never waits for a
+# generation to finish.
+class Simulation:
+    def __init__(self, board: AnyBoard, evolve_period=0.05, threaded=True):
+        self.board = board
+        self.evolve_period = evolve_period
+        self.paused = True
+        self.status = {}
+        # why the last save or load failed, None after one succeeds
+        self.snapshot_error: Optional[str] = None
+        self.recorder: Optional[Recorder] = None
+        # the last error a command raised on the producer thread
+        self.error: Optional[str] = None
+        self._commands: "queue.Queue[Optional[Command]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._last_step_time = time.perf_counter()
+        self._refresh_status()
+        if threaded:
+            self.start()
+
+    @property
+    def threaded(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="simulation", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._commands.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def set_threaded(self, threaded: bool):
+        if threaded:
+            self.start()
+        else:
+            self.stop()
+
+    def update(self):
+        # the producer thread keeps its own time when threaded
+        if self.threaded:
+            return
+        if not self.paused and self._step_due():
+            self._step(1)
+
+    def toggle_pause(self):
+        self._submit(lambda: setattr(self, "paused", not self.paused))
+
+    def step(self, generations=1):
+        self._submit(lambda: self._step(generations))
+
+    def randomise(self, radius: float, density: float):
+        self._submit(lambda: self.board.randomise(radius, density))
+
+    def clear(self):
+        self._submit(lambda: self.board.clear())
+
+    def set_side(self, side: int):
+        self._submit(lambda: self.board.set_side(side))
+
+    def set_rule(self, rule):
+        self._submit(lambda: self.board.set_rule(rule))
+
+    def set_packed_vertices(self, enabled: bool):
+        self._submit(lambda: self.board.set_packed_vertices(enabled))
+
+    def set_lod(self, enabled: bool):
+        self._submit(lambda: self.board.set_lod(enabled))
+
+    def save(self, path: str):
+        self._submit(lambda: self._snapshot(self.board.save, path))
+
+    def load(self, path: str):
+        self._submit(lambda: self._snapshot(self.board.load, path))
+
+    # Records every generation stepped from now on, see recording.Recorder.
+    def start_recording(self, path: str, keyframe_interval=64):
+        def start():
+            self._stop_recording()
+            self.recorder = Recorder(open(path, "wb"), self.board,
+                                     keyframe_interval)
+            self.recorder.record(self.board)
+
+        self._submit(start)
+
+    def stop_recording(self):
+        self._submit(self._stop_recording)
+
+    # shows a frame of a replay on the board, which must have its side
+    def show_frame(self, replay: Replay, index: int):
+        def show():
+            self.board.set_cells(replay.frame(index))
+            self.board.set_generation(replay.generations[index])
+
+        self._submit(show)
+
+    def set_board(self, board: AnyBoard):
+        self._submit(lambda: setattr(self, "board", board))
+
+    def _submit(self, command: Command):
+        if self.threaded:
+            self._commands.put(command)
+        else:
+            command()
+            self._refresh_status()
+
+    # a missing or broken file must not end the producer thread
+    def _snapshot(self, action: Callable[[str], None], path: str):
+        try:
+            action(path)
+            self.snapshot_error = None
+        except (OSError, ValueError) as error:
+            self.snapshot_error = str(error)
+
+    def _step_due(self) -> bool:
+        return time.perf_counter() - self._last_step_time > self.evolve_period
+
+    def _step(self, generations: int):
+        # a recording can end on any generation, the rest is stepped at once
+        while self.recorder and generations > 0:
+            self.board.step(1, remesh=False)
+            self._record()
+            generations -= 1
+        self.board.step(generations, remesh=self.threaded)
+        self._last_step_time = time.perf_counter()
+        self._refresh_status()
+
+    def _record(self):
+        try:
+            self.recorder.record(self.board)
+        except ValueError:
+            # a recording keeps one side, so it ends when the side changes
+            self._stop_recording()
+
+    def _stop_recording(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def _refresh_status(self):
+        board = self.board
+        status = {
+            "generation": board.get_generation(),
+            "side": board.get_side(),
+            "rule": board.get_rule().name,
+            "memory": board.get_memory_report()["total"],
+        }
+        if isinstance(board, Board):
+            status["active_chunks"] = board.get_active_chunk_count()
+            status["chunks"] = board.get_chunk_count()
+        else:
+            status["population"] = board.get_population()
+        if self.recorder:
+            status["recorded_frames"] = self.recorder.frame_count
+        # replaced as a whole so the render thread never sees a half update
+        self.status = status
+
+    def _run(self):
+        while True:
+            timeout = None
+            if not self.paused:
+                elapsed = time.perf_counter() - self._last_step_time
+                timeout = max(0.0, self.evolve_period - elapsed)
+            try:
+                command = self._commands.get(timeout=timeout)
+            except queue.Empty:
+                command = lambda: None
+            if command is None:
+                return
+            # a failed command must not end the thread, or the board would
+            # silently stop evolving
+            try:
+                command()
+                if not self.paused and self._step_due():
+                    self._step(1)
+                # publish the mesh of whatever the command changed
+                self.board.step(0, remesh=True)
+                self._refresh_status()
+            except Exception as error:
+                self.error = f"{type(error).__name__}: {error}"
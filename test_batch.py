@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from batch import finished_jobs, initial_cells, run_job, run_sweep
+from rule import Rule
+
+
+side = 16
+rule = Rule("Amoeba", "9-26/5-7,12-13,15/5/M", 0.5, 0.5)
+# every cell dies and nothing is ever born
+dying_rule = Rule("Dying", "27/27/2/M", 1.0, 0.5)
+
+
+class TestBatch(unittest.TestCase):
+    def test_jobs_repeat_for_a_seed(self):
+        cells = initial_cells(side, rule, 3)
+        self.assertEqual(cells.shape, (side, side, side))
+        self.assertEqual(cells[0, 0, 0], 0)
+        self.assertTrue(cells.any())
+        first = run_job(rule, side, 3, 10)
+        second = run_job(rule, side, 3, 10)
+        self.assertEqual(first["population"], second["population"])
+        self.assertEqual(first["generations"], 10)
+        self.assertGreater(first["steps_per_second"], 0)
+
+    def test_extinction_ends_the_run(self):
+        result = run_job(dying_rule, side, 0, 100)
+        self.assertEqual(result["extinct_generation"], 1)
+        self.assertEqual(result["population"], 0)
+
+    def test_resume_skips_finished_jobs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "sweep.jsonl")
+            self.assertEqual(
+                run_sweep([rule], [side], [0, 1], 5, output, workers=2), 2)
+            # an interrupted write is redone
+            with open(output, "a") as results:
+                results.write('{"rule": "Amoeba", "side"')
+            self.assertEqual(len(finished_jobs(output)), 2)
+            self.assertEqual(
+                run_sweep([rule], [side], [0, 1, 2], 5, output, workers=2), 1)
+            self.assertEqual(len(finished_jobs(output)), 3)
+            self.assertEqual(
+                run_sweep([rule], [side], [0, 1, 2], 5, output, workers=2), 0)
+
+    def test_no_gl_or_gui_imports(self):
+        modules = subprocess.check_output(
+            [sys.executable, "-c",
+             "import sys, batch; batch.run_job(batch.Rule('a', '4/4/5/M'), "
+             "8, 0, 2); print(' '.join(sys.modules))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), text=True).split()
+        for module in ("moderngl", "imgui", "glfw", "engine.renderer"):
+            self.assertNotIn(module, modules)
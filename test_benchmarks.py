@@ -0,0 +1,23 @@
+import unittest
+from benchmarks.operations import find_regressions
+
+
+def results(update_median, mesh_median):
+    return {"cases": [{"rule": "Amoeba", "side": 64, "operations": {
+        "update": {"median": update_median},
+        "mesh": {"median": mesh_median},
+    }}]}
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_find_regressions(self):
+        baseline = results(0.010, 0.020)
+        self.assertEqual(
+            find_regressions(baseline, results(0.0105, 0.010), 0.1), [])
+        self.assertEqual(
+            find_regressions(baseline, results(0.012, 0.020), 0.1),
+            [("Amoeba", 64, "update", 0.010, 0.012)])
+        # cases only in one of the files are not compared
+        other_side = results(1.0, 1.0)
+        other_side["cases"][0]["side"] = 128
+        self.assertEqual(find_regressions(baseline, other_side, 0.1), [])
@@ -1,11 +1,15 @@
+import os
+import tempfile
 import unittest
-from _board import Board
+import numpy as np
+from _board import Board, HashLife, SparseBoard, compile_rule
+from board import create_board
 from rule import Rule
 import glm
 
 
 side = 10
-rule = Rule("0,1,2,3,4,5,6/1,3/2/VN", 1.0, 0.1)
+rule = Rule("Crystal Growth", "0,1,2,3,4,5,6/1,3/2/VN", 1.0, 0.1)
 center = glm.ivec3(side / 2, side / 2, side / 2)
 
 
@@ -18,12 +22,8 @@ class TestClass(unittest.TestCase):
         return test_board
 
     def compare_answer(self, test_board, answer_board):
-        for x in range(side):
-            for y in range(side):
-                for z in range(side):
-                    self.assertEqual(answer_board.get_cell_state(x, y, z),
-                                     test_board.get_cell_state(x, y, z),
-                                     f"cell state at ({x}, {y}, {z}) is different...")
+        np.testing.assert_array_equal(test_board.get_cells(),
+                                      answer_board.get_cells())
 
     def test_iteration_1(self):
         test_board = self.make_test_board(1)
@@ -50,12 +50,7 @@ class TestClass(unittest.TestCase):
         answer_board.set_cell_state(1, center.x, center.y - 2, center.z)
         answer_board.set_cell_state(1, center.x, center.y, center.z - 2)
 
-        for x in range(side):
-            for y in range(side):
-                for z in range(side):
-                    self.assertEqual(answer_board.get_cell_state(x, y, z),
-                                     test_board.get_cell_state(x, y, z),
-                                     f"cell state at ({x}, {y}, {z}) is different...")
+        self.compare_answer(test_board, answer_board)
 
     def test_iteration_3(self):
         test_board = self.make_test_board(3)
@@ -104,3 +99,406 @@ class TestClass(unittest.TestCase):
         answer_board.set_cell_state(1, center.x, center.y, center.z - 2 - 1)
 
         self.compare_answer(test_board, answer_board)
+
+    def test_alive_plane_matches_byte_cells(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        plain_board = Board(side, amoeba)
+        packed_board = Board(side, amoeba)
+        packed_board.set_alive_plane(True)
+        plain_board.randomise(1.0, 0.5)
+        packed_board.set_cells(plain_board.get_cells())
+        for i in range(5):
+            plain_board.update()
+            packed_board.update()
+        self.compare_answer(packed_board, plain_board)
+
+    def test_memory_report(self):
+        test_board = Board(side, rule)
+        report = test_board.get_memory_report()
+        self.assertEqual(report["cells"], side ** 3)
+        self.assertEqual(report["alive_plane"], 0)
+        test_board.set_alive_plane(True)
+        report = test_board.get_memory_report()
+        self.assertEqual(report["alive_plane"], (side ** 3 + 63) // 64 * 8)
+
+    def test_cell_state_range(self):
+        test_board = Board(side, rule)
+        test_board.set_cell_state(255, 0, 0, 0)
+        self.assertEqual(test_board.get_cell_state(0, 0, 0), 255)
+        with self.assertRaises(ValueError):
+            test_board.set_cell_state(256, 0, 0, 0)
+
+    def test_thread_count_does_not_change_result(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        serial_board = Board(side, amoeba)
+        serial_board.set_thread_count(1)
+        parallel_board = Board(side, amoeba)
+        parallel_board.set_thread_count(4)
+        parallel_board.set_grain_size(3)
+        self.assertEqual(parallel_board.get_thread_count(), 4)
+        serial_board.randomise(1.0, 0.5)
+        parallel_board.set_cells(serial_board.get_cells())
+        for i in range(5):
+            serial_board.update()
+            parallel_board.update()
+        self.compare_answer(parallel_board, serial_board)
+        self.assertEqual(parallel_board.get_quad_count(),
+                         serial_board.get_quad_count())
+        np.testing.assert_array_equal(parallel_board.vertex_buffer,
+                                      serial_board.vertex_buffer)
+
+    def test_only_chunks_near_changes_are_active(self):
+        test_board = Board(80, rule)
+        test_board.set_cell_state(1, 40, 40, 40)
+        self.assertEqual(test_board.get_chunk_count(), 125)
+        test_board.update()
+        self.assertEqual(test_board.get_active_chunk_count(), 125)
+        test_board.update()
+        self.assertEqual(test_board.get_active_chunk_count(), 27)
+        test_board.clear()
+        test_board.update()
+        test_board.update()
+        self.assertEqual(test_board.get_active_chunk_count(), 0)
+
+    def test_only_changed_chunks_are_remeshed(self):
+        test_board = Board(80, rule)
+        self.assertEqual(test_board.get_quad_count(), 0)
+        self.assertEqual(test_board.get_remeshed_chunk_count(), 125)
+        # a chunk and the three chunks whose lower border planes it touches
+        test_board.set_cell_state(1, 40, 40, 40)
+        self.assertEqual(test_board.get_quad_count(), 6)
+        self.assertEqual(test_board.get_remeshed_chunk_count(), 4)
+
+        # the kept chunk meshes add up to the same mesh as a fresh board
+        test_board.update()
+        fresh_board = Board(80, rule)
+        fresh_board.set_cells(test_board.get_cells())
+        np.testing.assert_array_equal(test_board.vertex_buffer,
+                                      fresh_board.vertex_buffer)
+
+    def test_packed_vertices_match_float_vertices(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        test_board = Board(20, amoeba)
+        test_board.randomise(1.0, 0.5)
+        test_board.update()
+        quad_count = test_board.get_quad_count()
+        vertices = test_board.vertex_buffer
+
+        test_board.set_packed_vertices(True)
+        self.assertEqual(test_board.get_quad_count(), quad_count)
+        self.assertEqual(len(test_board.vertex_buffer), 0)
+        packed = test_board.packed_vertex_buffer
+        self.assertEqual(len(packed), quad_count * 4)
+        positions = np.stack([packed[:, 0] >> shift & 1023
+                              for shift in (0, 10, 20)], axis=1)
+        np.testing.assert_array_equal(positions - (20 / 2 + 0.5),
+                                      vertices[:, :3])
+        np.testing.assert_array_equal(packed[:, 0] >> 30,
+                                      np.tile(np.arange(4), quad_count))
+        # the cells behind every quad are alive or dying
+        self.assertTrue(np.isin(packed[:, 1] >> 8, range(1, 16)).all())
+
+        with self.assertRaises(ValueError):
+            test_board.set_side(1024)
+
+    def test_vertex_buffer_is_a_read_only_view(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        test_board = Board(20, amoeba)
+        test_board.randomise(1.0, 0.5)
+        vertices = test_board.vertex_buffer
+        self.assertEqual(vertices.dtype, np.float32)
+        self.assertEqual(vertices.shape, (test_board.get_quad_count() * 4, 9))
+        self.assertFalse(vertices.flags.writeable)
+        self.assertTrue(np.shares_memory(vertices, test_board.vertex_buffer))
+
+        # later meshes go to other buffers and leave the old view alone
+        kept = vertices.copy()
+        for i in range(3):
+            test_board.update()
+        np.testing.assert_array_equal(vertices, kept)
+        self.assertFalse(np.shares_memory(vertices, test_board.vertex_buffer))
+
+    def test_quads_merge_only_equal_states(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        for packed in (False, True):
+            test_board = Board(8, amoeba)
+            test_board.set_packed_vertices(packed)
+            test_board.set_cell_state(1, 3, 3, 3)
+            test_board.set_cell_state(1, 4, 3, 3)
+            self.assertEqual(test_board.get_quad_count(), 6)
+            # the four long sides split in two
+            test_board.set_cell_state(5, 4, 3, 3)
+            self.assertEqual(test_board.get_quad_count(), 10)
+            if packed:
+                states = test_board.packed_vertex_buffer[:, 1] >> 8
+            else:
+                states = test_board.vertex_buffer[:, 8]
+            self.assertEqual(np.count_nonzero(states == 1), 5 * 4)
+            self.assertEqual(np.count_nonzero(states == 5), 5 * 4)
+
+    def test_lod_mesh_is_down_sampled(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        test_board = Board(21, amoeba)
+        test_board.set_lod(True)
+        test_board.set_cell_state(1, 20, 20, 20)
+        self.assertEqual(test_board.get_quad_count(), 6)
+        self.assertEqual(test_board.get_lod_quad_count(), 6)
+
+        cells = np.random.default_rng(2).integers(0, 2, (40, 40, 40))
+        test_board = Board(40, amoeba)
+        test_board.set_cells(cells)
+        test_board.set_lod(True)
+        self.assertLess(test_board.get_lod_quad_count(),
+                        test_board.get_quad_count() / 4)
+        # the LOD mesh of changed chunks is rebuilt like the full mesh
+        for i in range(2):
+            test_board.update()
+        fresh_board = Board(40, amoeba)
+        fresh_board.set_cells(test_board.get_cells())
+        fresh_board.set_lod(True)
+        self.assertEqual(test_board.get_lod_quad_count(),
+                         fresh_board.get_lod_quad_count())
+        test_board.set_lod(False)
+        self.assertEqual(test_board.get_lod_quad_count(), 0)
+
+    def test_sparse_board_matches_dense_board(self):
+        rules = [
+            rule,
+            Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5),
+            Rule("445", "4/4/5/M", 0.1, 1.0),
+        ]
+        for test_rule in rules:
+            dense_board = Board(side, test_rule)
+            sparse_board = SparseBoard(side, test_rule)
+            dense_board.randomise(0.8, 0.4)
+            sparse_board.set_cells(dense_board.get_cells())
+            for i in range(6):
+                dense_board.update()
+                sparse_board.update()
+            self.compare_answer(sparse_board, dense_board)
+
+    def test_unbounded_sparse_board_grows_past_side(self):
+        sparse_board = SparseBoard(side, rule, bounded=False)
+        sparse_board.set_cell_state(1, 0, 0, 0)
+        sparse_board.update()
+        self.assertEqual(sparse_board.get_cell_state(-1, 0, 0), 1)
+        self.assertEqual(sparse_board.get_population(), 6)
+        self.assertEqual(sparse_board.get_quad_count(), 6 * 6)
+
+    def test_create_board_picks_engine(self):
+        sparse_rule = Rule("Sparse", "0-6/1,3/2/VN", 1.0, 0.1, "auto")
+        dense_rule = Rule("Dense", "4/4/5/M", 0.5, 1.0, "auto")
+        self.assertIsInstance(create_board(side, sparse_rule), SparseBoard)
+        self.assertIsInstance(create_board(side, dense_rule), Board)
+        self.assertIsInstance(create_board(side, sparse_rule, "dense"), Board)
+
+    def test_compiled_transition_table(self):
+        table = compile_rule(rule)
+        self.assertEqual(table.shape, (256, 27))
+        # spawn on 1 or 3 neighbors
+        self.assertEqual(list(table[0][:5]), [0, 1, 0, 1, 0])
+        # survival 0-6 is checked against one neighbor less than the cell has
+        self.assertEqual(list(table[1][:9]), [0, 1, 1, 1, 1, 1, 1, 1, 0])
+
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        table = Board(side, amoeba).get_transition_table()
+        self.assertTrue((table[0][[5, 6, 7, 12, 14, 15]] == 1).all())
+        self.assertEqual(table[0][8], 0)
+        self.assertEqual(table[1][9], 2)
+        self.assertEqual(table[1][10], 1)
+        self.assertTrue((table[7] == 8).all())
+        self.assertTrue((table[15] == 0).all())
+
+    def test_step_matches_update(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+        updated_board = Board(side, amoeba)
+        stepped_board = Board(side, amoeba)
+        updated_board.randomise(1.0, 0.5)
+        stepped_board.set_cells(updated_board.get_cells())
+        for i in range(4):
+            updated_board.update()
+        stepped_board.step(4)
+        self.assertEqual(stepped_board.get_generation(), 4)
+        self.compare_answer(stepped_board, updated_board)
+        self.assertEqual(stepped_board.get_quad_count(),
+                         updated_board.get_quad_count())
+        np.testing.assert_array_equal(stepped_board.vertex_buffer,
+                                      updated_board.vertex_buffer)
+
+    def test_cells_view_follows_updates(self):
+        test_board = self.make_test_board(0)
+        cells = test_board.cells
+        self.assertEqual(cells.shape, (side, side, side))
+        self.assertEqual(cells[center.x, center.y, center.z], 1)
+        self.assertFalse(cells.flags.writeable)
+        test_board.update()
+        # the same view sees the next generation without a copy
+        self.assertEqual(cells[center.x, center.y, center.z], 0)
+        self.assertEqual(cells[center.x + 1, center.y, center.z], 1)
+        np.testing.assert_array_equal(cells, test_board.get_cells(copy=True))
+
+        # the cells move when the side changes, which no view may outlive
+        flat = cells.ravel(order="F")
+        del cells
+        with self.assertRaises(RuntimeError):
+            test_board.set_side(side + 1)
+        self.assertEqual(test_board.get_side(), side)
+        del flat
+        test_board.set_side(side + 1)
+        self.assertEqual(test_board.cells.shape, (side + 1,) * 3)
+
+    def test_set_cells(self):
+        cells = np.zeros((side, side, side), dtype=np.uint8)
+        cells[center.x, center.y, center.z] = 1
+        test_board = Board(side, rule)
+        test_board.set_cells(cells)
+        self.assertEqual(test_board.get_cell_state(center.x, center.y, center.z), 1)
+        self.compare_answer(test_board, self.make_test_board(0))
+
+        # any integer array is accepted as long as the states fit
+        test_board.set_cells(cells.astype(np.int64))
+        self.compare_answer(test_board, self.make_test_board(0))
+        test_board.update()
+        self.compare_answer(test_board, self.make_test_board(1))
+
+        # only the chunks that differ are remeshed
+        big_board = Board(40, rule)
+        big_board.get_quad_count()
+        big_cells = big_board.get_cells(copy=True)
+        big_cells[35, 35, 35] = 1
+        big_board.set_cells(big_cells)
+        big_board.get_quad_count()
+        self.assertLess(big_board.get_remeshed_chunk_count(),
+                        big_board.get_chunk_count())
+
+        with self.assertRaises(ValueError):
+            test_board.set_cells(np.zeros((side, side, side + 1), np.uint8))
+        with self.assertRaises(ValueError):
+            test_board.set_cells(np.full((side, side, side), 256))
+        with self.assertRaises(RuntimeError):
+            SparseBoard(side, rule, bounded=False).get_cells()
+
+    def test_stats(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12-13,15/5/M", 0.5, 0.5)
+        test_board = Board(20, amoeba)
+        test_board.randomise(0.5, 0.5)
+        before = test_board.get_cells(copy=True)
+        test_board.update()
+        stats = test_board.stats()
+        self.assertEqual(stats["cells_changed"]["last"],
+                         np.count_nonzero(before != test_board.get_cells()))
+        self.assertEqual(stats["update_ns"]["count"], 1)
+        self.assertGreater(stats["update_ns"]["last"], 0)
+        # the first mesh covers every chunk
+        self.assertEqual(stats["quads"]["last"], test_board.get_quad_count())
+        self.assertGreater(stats["mesh_ns"]["total"], 0)
+
+        # averages only cover the last 60 samples
+        test_board.reset_stats()
+        self.assertEqual(test_board.stats()["update_ns"]["count"], 0)
+        test_board.update()
+        first_changes = test_board.stats()["cells_changed"]["last"]
+        self.assertGreater(first_changes, 0)
+        test_board.clear()
+        test_board.step(60, remesh=False)
+        changed = test_board.stats()["cells_changed"]
+        self.assertEqual(changed["count"], 61)
+        self.assertEqual(changed["total"], first_changes)
+        self.assertEqual(changed["average"], 0.0)
+
+    def test_save_and_load(self):
+        amoeba = Rule("Amoeba", "9-26/5-7,12-13,15/5/M", 0.5, 0.5)
+        saved = Board(20, amoeba)
+        saved.randomise(0.5, 0.5)
+        saved.step(3, remesh=False)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "board.ca3d")
+            for compress in (True, False):
+                saved.save(path, compress=compress)
+                # the snapshot brings its side, generation and rule along
+                test_board = self.make_test_board(0)
+                test_board.load(path)
+                self.assertEqual(test_board.get_side(), 20)
+                self.assertEqual(test_board.get_generation(), 3)
+                self.assertEqual(test_board.get_rule().name, "Amoeba")
+                self.assertEqual(test_board.get_rule().format, amoeba.format)
+                self.compare_answer(test_board, saved)
+                test_board.update()
+                saved_copy = Board(20, amoeba)
+                saved_copy.set_cells(saved.get_cells())
+                saved_copy.update()
+                self.compare_answer(test_board, saved_copy)
+
+            # a rule of the same format under another name is still replaced
+            renamed = Board(20, Rule("Blob", amoeba.format, 0.5, 0.5))
+            renamed.save(path)
+            test_board = Board(20, amoeba)
+            test_board.load(path)
+            self.assertEqual(test_board.get_rule().name, "Blob")
+
+            # a broken payload is found before the board changes
+            saved.save(path, compress=True)
+            with open(path, "r+b") as snapshot:
+                snapshot.seek(-10, os.SEEK_END)
+                snapshot.write(bytes(10))
+            test_board = self.make_test_board(0)
+            with self.assertRaises(ValueError):
+                test_board.load(path)
+            self.assertEqual(test_board.get_side(), side)
+            self.assertEqual(test_board.get_rule().format, rule.format)
+            self.compare_answer(test_board, self.make_test_board(0))
+
+            # the side in the header is checked before anything is allocated
+            for bad_side in (0, 3000, 2 ** 32 - 1):
+                saved.save(path)
+                with open(path, "r+b") as snapshot:
+                    snapshot.seek(16)
+                    snapshot.write(bad_side.to_bytes(4, "little"))
+                with self.assertRaises(ValueError):
+                    test_board.load(path)
+                self.assertEqual(test_board.get_side(), side)
+            with self.assertRaises(ValueError):
+                test_board.set_side(0)
+
+            with open(path, "wb") as snapshot:
+                snapshot.write(b"not a snapshot at all, just some bytes")
+            with self.assertRaises(ValueError):
+                test_board.load(path)
+            with self.assertRaises(FileNotFoundError):
+                test_board.load(os.path.join(directory, "missing.ca3d"))
+
+    def test_hashlife_matches_board(self):
+        rules = [
+            rule,
+            Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5),
+            Rule("445", "4/4/5/M", 0.1, 1.0),
+        ]
+        for test_rule in rules:
+            board = Board(16, test_rule)
+            board.randomise(1.0, 0.3)
+            hashlife = HashLife.from_board(board)
+            for step_level in [0, 3, 1, 5]:
+                hashlife.step(step_level)
+                board.step(2 ** step_level)
+                self.assertEqual(hashlife.get_generation(),
+                                 board.get_generation())
+                self.compare_answer(hashlife, board)
+            self.compare_answer(hashlife.to_board(), board)
+
+    def test_hashlife_cache(self):
+        board = Board(16, rule)
+        board.set_cell_state(1, 8, 8, 8)
+        hashlife = HashLife.from_board(board, cache_limit=64)
+        hashlife.step(4)
+        stats = hashlife.stats()
+        self.assertGreater(stats["hit_rate"], 0.5)
+        self.assertEqual(stats["nodes"], hashlife.get_node_count())
+        self.assertGreater(stats["nodes"], 64)
+        # the limit is enforced before the next jump
+        board.step(16)
+        hashlife.step(0)
+        board.step(1)
+        self.assertEqual(hashlife.stats()["collections"], 1)
+        self.compare_answer(hashlife, board)
+        with self.assertRaises(ValueError):
+            HashLife(12, rule)
@@ -0,0 +1,100 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from _board import Board
+from recording import DENSE_DELTA, KEYFRAME, SPARSE_DELTA, Recorder, Replay
+from rule import Rule
+
+
+side = 20
+rule = Rule("Amoeba", "9-26/5-7,12-13,15/5/M", 0.5, 0.5)
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "run.ca3r")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, generations, keyframe_interval=8):
+        board = Board(side, rule)
+        board.randomise(0.5, 0.5)
+        frames = []
+        recorder = Recorder(open(self.path, "wb"), board, keyframe_interval)
+        for _ in range(generations):
+            recorder.record(board)
+            frames.append(board.get_cells(copy=True))
+            board.update()
+        recorder.close()
+        return frames
+
+    def test_replay_matches_recording(self):
+        frames = self.record(30)
+        replay = Replay(self.path, cache_size=4)
+        self.assertEqual(replay.frame_count, 30)
+        self.assertEqual(replay.side, side)
+        self.assertEqual(replay.rule_format, rule.format)
+        self.assertEqual(replay.generations, list(range(30)))
+        self.assertEqual(replay._kinds[0], KEYFRAME)
+        self.assertEqual(replay._kinds[8], KEYFRAME)
+        self.assertTrue(set(replay._kinds[1:8]) <= {SPARSE_DELTA, DENSE_DELTA})
+        for index in [0, 29, 5, 17, 8, 3]:
+            np.testing.assert_array_equal(replay.frame(index), frames[index])
+        self.assertFalse(replay.frame(3).flags.writeable)
+        self.assertEqual(replay.index_of(17), 17)
+        with self.assertRaises(IndexError):
+            replay.frame(30)
+
+    def test_rewind_undoes_one_delta_per_frame(self):
+        frames = self.record(16, keyframe_interval=16)
+        replay = Replay(self.path, cache_size=2)
+        replay.frame(15)
+        applied = []
+        apply_delta = replay._apply_delta
+        replay._apply_delta = lambda cells, index: (
+            applied.append(index), apply_delta(cells, index))
+        for index in range(14, -1, -1):
+            np.testing.assert_array_equal(replay.frame(index), frames[index])
+        # frame 0 is the keyframe itself
+        self.assertEqual(applied, list(range(15, 1, -1)))
+        self.assertLessEqual(len(replay._cache), 2)
+
+    def test_recording_cut_short_keeps_complete_frames(self):
+        frames = self.record(10)
+        with open(self.path, "r+b") as recording:
+            recording.truncate(os.path.getsize(self.path) - 3)
+        replay = Replay(self.path)
+        self.assertEqual(replay.frame_count, 9)
+        np.testing.assert_array_equal(replay.frame(8), frames[8])
+
+    def test_rejected_file_is_closed(self):
+        opened = []
+
+        def tracking_open(*args, **kwargs):
+            opened.append(open(*args, **kwargs))
+            return opened[-1]
+
+        with mock.patch("recording.open", tracking_open, create=True):
+            with self.assertRaises(ValueError):
+                Replay(__file__)
+        self.assertTrue(opened[0].closed)
+
+    def test_generation_jump_writes_keyframe(self):
+        board = Board(side, rule)
+        recorder = Recorder(io.BytesIO(), board)
+        recorder.record(board)
+        board.update()
+        recorder.record(board)
+        board.clear()
+        recorder.record(board)
+        self.assertEqual(recorder.frame_count, 3)
+        with self.assertRaises(ValueError):
+            Replay(__file__)
+        board.set_side(side + 1)
+        with self.assertRaises(ValueError):
+            recorder.record(board)
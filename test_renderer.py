@@ -0,0 +1,238 @@
+import io
+import subprocess
+import sys
+import threading
+import unittest
+import glm
+import moderngl
+import numpy as np
+import engine.gl as gl
+from engine.camera import Camera
+from engine.headless import FrameOutput
+from engine.renderer import Renderer
+from engine.shader import Shader
+from PIL import Image
+from _board import Board
+from rule import Rule
+
+
+amoeba = Rule("Amoeba", "9-26/5-7,12,14,15/16/M", 0.4, 0.5)
+
+
+def create_headless_context():
+    for backend in ("egl", None):
+        try:
+            if backend:
+                return moderngl.create_context(standalone=True,
+                                               backend=backend)
+            return moderngl.create_standalone_context()
+        except Exception:
+            continue
+    return None
+
+
+class TestClass(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        gl.ctx = create_headless_context()
+        if not gl.ctx:
+            raise unittest.SkipTest("no headless OpenGL context")
+        Shader.init()
+        Renderer.init()
+        cls.framebuffer = gl.ctx.simple_framebuffer((160, 120))
+        cls.framebuffer.use()
+        gl.ctx.enable(moderngl.DEPTH_TEST)
+        cls.camera = Camera(aspect=160 / 120)
+        cls.camera.position = glm.vec3(25, 30, 40)
+        cls.camera.focus(glm.vec3(0))
+
+    def render(self, board):
+        self.framebuffer.clear(0, 0, 0, 1)
+        Renderer.begin_scene(camera=self.camera)
+        board.render()
+        Renderer.end_scene()
+        return np.frombuffer(self.framebuffer.read(), dtype=np.uint8)
+
+    def test_mesh_is_uploaded_only_when_it_changes(self):
+        board = Board(20, amoeba)
+        board.randomise(1.0, 0.5)
+        mesh = Renderer.meshes["flat"]
+        first_frame = self.render(board)
+        uploads = mesh.upload_count
+        self.assertEqual(mesh.version, board.get_mesh_version())
+
+        # paused frames draw what is already on the GPU
+        for i in range(3):
+            np.testing.assert_array_equal(self.render(board), first_frame)
+        self.assertEqual(mesh.upload_count, uploads)
+
+        board.update()
+        self.render(board)
+        self.assertEqual(mesh.upload_count, uploads + 1)
+        self.assertEqual(mesh.version, board.get_mesh_version())
+
+    def test_board_is_usable_from_another_thread_while_drawing(self):
+        board = Board(20, amoeba)
+        board.randomise(1.0, 0.5)
+        mesh = Renderer.meshes["flat"]
+        upload = mesh.upload
+        finished = []
+
+        # the producer thread reads the board while the renderer runs
+        def upload_while_reading(*args):
+            reader = threading.Thread(target=lambda: finished.append(
+                (board.get_memory_report(), board.get_quad_count())))
+            reader.start()
+            reader.join(timeout=5)
+            return upload(*args)
+
+        mesh.upload = upload_while_reading
+        try:
+            self.render(board)
+        finally:
+            del mesh.upload
+        self.assertEqual(len(finished), 1)
+
+    def test_render_stats_count_uploaded_bytes(self):
+        board = Board(20, amoeba)
+        board.randomise(1.0, 0.5)
+        self.render(board)
+        self.render(board)
+        uploaded = board.stats()["bytes_uploaded"]
+        self.assertEqual(uploaded["count"], 2)
+        self.assertEqual(uploaded["total"], board.vertex_buffer.nbytes)
+        self.assertEqual(uploaded["last"], 0)
+        self.assertGreater(board.stats()["render_ns"]["total"], 0)
+
+    def test_packed_vertices_look_the_same(self):
+        board = Board(20, amoeba)
+        board.randomise(1.0, 0.5)
+        float_frame = self.render(board)
+        self.assertTrue(float_frame.any())
+        board.set_packed_vertices(True)
+        np.testing.assert_array_equal(self.render(board), float_frame)
+        self.assertEqual(Renderer.meshes["packed"].version,
+                         board.get_mesh_version())
+
+    def test_empty_board(self):
+        board = Board(8, amoeba)
+        self.assertFalse(self.render(board)[0::4].any())
+
+    def test_large_mesh_is_drawn_in_one_buffer(self):
+        # noise leaves few faces to merge, so this is well past the 75000
+        # quads one fixed size batch used to hold
+        side = 50
+        cells = np.random.default_rng(1).integers(0, 2, (side, side, side))
+        board = Board(side, amoeba)
+        board.set_cells(cells)
+        self.render(board)
+        mesh = Renderer.meshes["flat"]
+        self.assertGreater(mesh.quad_count, 75000)
+        self.assertEqual(mesh.quad_count, board.get_quad_count())
+        self.assertGreaterEqual(mesh.capacity, mesh.quad_count * 4 * 9 * 4)
+        self.assertGreaterEqual(Renderer._quad_indices.quad_capacity,
+                                mesh.quad_count)
+
+    def test_chunks_out_of_view_are_culled(self):
+        side = 64
+        cells = np.random.default_rng(3).integers(0, 2, (side, side, side))
+        board = Board(side, amoeba)
+        board.set_cells(cells)
+        camera = self.camera
+        try:
+            # inside the board looking at a corner
+            self.camera = Camera(aspect=160 / 120)
+            self.camera.position = glm.vec3(5, 5, 5)
+            self.camera.focus(glm.vec3(-32))
+            Renderer.cull_chunks = False
+            unculled_frame = self.render(board)
+            self.assertEqual(Renderer.stats["drawn_quads"],
+                             board.get_quad_count())
+            Renderer.cull_chunks = True
+            np.testing.assert_array_equal(self.render(board), unculled_frame)
+            self.assertGreater(Renderer.stats["culled_chunks"],
+                               board.get_chunk_count() / 2)
+            self.assertLess(Renderer.stats["drawn_quads"],
+                            board.get_quad_count() / 2)
+        finally:
+            self.camera = camera
+            Renderer.cull_chunks = True
+
+    def test_far_chunks_use_the_lod_mesh(self):
+        board = Board(40, amoeba)
+        board.randomise(1.0, 0.5)
+        board.set_packed_vertices(True)
+        board.set_lod(True)
+        self.render(board)
+        lod_distance = Renderer.lod_distance
+        self.assertEqual(Renderer.stats["lod_chunks"], 0)
+        self.assertEqual(Renderer.stats["drawn_quads"],
+                         board.get_quad_count())
+        try:
+            Renderer.lod_distance = 0
+            self.assertTrue(self.render(board).any())
+            self.assertEqual(Renderer.stats["lod_chunks"],
+                             board.get_chunk_count())
+            self.assertEqual(Renderer.stats["drawn_quads"],
+                             board.get_lod_quad_count())
+        finally:
+            Renderer.lod_distance = lod_distance
+
+    def test_decaying_states_use_the_palette(self):
+        state_count = Renderer.state_count
+        try:
+            Renderer.set_state_count(4)
+            frames = []
+            for state in (1, 3):
+                board = Board(8, amoeba)
+                board.set_packed_vertices(True)
+                board.set_cells(np.full((8, 8, 8), state))
+                frames.append(self.render(board).astype(int))
+            # the last dying state is drawn at half the brightness
+            lit = frames[0] > 0
+            np.testing.assert_allclose(frames[1][lit], frames[0][lit] / 2,
+                                       atol=2)
+            board.set_packed_vertices(False)
+            np.testing.assert_array_equal(self.render(board), frames[1])
+        finally:
+            Renderer.set_state_count(state_count)
+
+    def test_frames_are_read_back_in_order(self):
+        board = Board(20, amoeba)
+        board.randomise(1.0, 0.5)
+        for format in FrameOutput.FORMATS:
+            stream = io.BytesIO()
+            output = FrameOutput(stream, (160, 120), format, buffer_count=3)
+            expected = []
+            for i in range(5):
+                frame = self.render(board).reshape(120, 160, 3)[::-1]
+                expected.append(frame)
+                output.capture(self.framebuffer)
+                board.update()
+            output.close()
+            self.assertEqual(output.frame_count, 5)
+            if format == "raw":
+                frames = np.frombuffer(stream.getvalue(), np.uint8)
+                frames = frames.reshape(5, 120, 160, 3)
+            else:
+                signature = b"\x89PNG"
+                pngs = stream.getvalue().split(signature)[1:]
+                frames = [np.asarray(Image.open(io.BytesIO(signature + png)))
+                          for png in pngs]
+            np.testing.assert_array_equal(frames, expected)
+
+    def test_headless_render_streams_frames(self):
+        result = subprocess.run(
+            [sys.executable, "render_headless.py", "--frames", "3",
+             "--size", "64x48", "--format", "raw", "--side", "20"],
+            capture_output=True, check=True)
+        self.assertEqual(len(result.stdout), 3 * 64 * 48 * 3)
+        self.assertIn(b"fps", result.stderr)
+
+    def test_programs_are_cached(self):
+        self.assertIs(Shader.load("flat"), Shader.flat)
+        Shader.init()
+        self.assertIs(Shader.load("flat_packed"), Shader.flat_packed)
+        vertex_source, fragment_source = Shader.read_sources("flat")
+        self.assertIn("#define VERTEX_SHADER", vertex_source)
+        self.assertNotIn("endif", vertex_source + fragment_source)
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+from _board import Board
+from rule import Rule
+from recording import Replay
+from simulation import Simulation
+
+
+side = 10
+rule = Rule("Crystal Growth", "0,1,2,3,4,5,6/1,3/2/VN", 1.0, 0.1)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+
+class FakeReplay:
+    def __init__(self, side):
+        self.generations = [0]
+        self.side = side
+
+    def frame(self, index):
+        return np.zeros((self.side,) * 3, np.uint8)
+
+
+class TestSimulation(unittest.TestCase):
+    def test_inline_commands_run_immediately(self):
+        board = Board(side, rule)
+        simulation = Simulation(board, threaded=False)
+        simulation.step(3)
+        self.assertEqual(board.get_generation(), 3)
+        self.assertEqual(simulation.status["generation"], 3)
+        simulation.clear()
+        self.assertEqual(simulation.status["generation"], 0)
+
+    def test_threaded_commands_run_in_order(self):
+        board = Board(side, rule)
+        board.set_cell_state(1, 5, 5, 5)
+        simulation = Simulation(board)
+        try:
+            simulation.step(2)
+            simulation.step(1)
+            self.assertTrue(
+                wait_for(lambda: simulation.status["generation"] == 3))
+            # the producer publishes the mesh, so reading it never meshes
+            self.assertGreater(board.get_quad_count(), 0)
+            simulation.clear()
+            self.assertTrue(
+                wait_for(lambda: simulation.status["generation"] == 0))
+            self.assertEqual(board.get_quad_count(), 0)
+        finally:
+            simulation.stop()
+
+    def test_failed_command_keeps_the_thread_running(self):
+        board = Board(side, rule)
+        board.set_cell_state(1, 5, 5, 5)
+        simulation = Simulation(board)
+        try:
+            # a frame of another side cannot be shown
+            simulation.show_frame(FakeReplay(side + 1), 0)
+            simulation.step(2)
+            self.assertTrue(
+                wait_for(lambda: simulation.status["generation"] == 2))
+            self.assertIn("ValueError", simulation.error)
+        finally:
+            simulation.stop()
+
+    def test_threaded_simulation_runs_while_unpaused(self):
+        board = Board(side, rule)
+        board.set_cell_state(1, 5, 5, 5)
+        simulation = Simulation(board, evolve_period=0.001)
+        try:
+            simulation.toggle_pause()
+            self.assertTrue(
+                wait_for(lambda: simulation.status["generation"] >= 5))
+            simulation.toggle_pause()
+            self.assertTrue(wait_for(lambda: simulation.paused))
+        finally:
+            simulation.stop()
+        generation = board.get_generation()
+        time.sleep(0.01)
+        self.assertEqual(board.get_generation(), generation)
+
+    def test_failed_load_is_reported(self):
+        board = Board(side, rule)
+        simulation = Simulation(board, threaded=False)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "board.ca3d")
+            simulation.load(path)
+            self.assertIn("No such file", simulation.snapshot_error)
+            simulation.save(path)
+            simulation.load(path)
+            self.assertIsNone(simulation.snapshot_error)
+
+    def test_recording_and_replay(self):
+        board = Board(side, rule)
+        board.set_cell_state(1, 5, 5, 5)
+        simulation = Simulation(board, threaded=False)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.ca3r")
+            simulation.start_recording(path)
+            simulation.step(3)
+            self.assertEqual(simulation.status["recorded_frames"], 4)
+            simulation.stop_recording()
+            self.assertNotIn("recorded_frames", simulation.status)
+            cells = board.get_cells(copy=True)
+
+            replay = Replay(path)
+            simulation.set_board(Board(side, rule))
+            simulation.show_frame(replay, 3)
+            self.assertEqual(simulation.board.get_generation(), 3)
+            self.assertTrue((simulation.board.get_cells() == cells).all())
+            replay.close()
+
+    def test_recording_ends_when_the_side_changes(self):
+        board = Board(8, rule)
+        simulation = Simulation(board, threaded=False)
+        with tempfile.TemporaryDirectory() as directory:
+            simulation.start_recording(os.path.join(directory, "run.ca3r"))
+            simulation.set_side(side)
+            simulation.step(3)
+            self.assertIsNone(simulation.recorder)
+            self.assertEqual(board.get_generation(), 3)